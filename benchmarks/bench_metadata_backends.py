@@ -0,0 +1,70 @@
+"""Compares the metadata backends used by `data-agent autogen` on a real dataset.
+
+Reports, for each backend, the number of HTTP calls made to BigQuery and the
+wall time, and checks that both produce the same tableReferences.
+
+usage: python benchmarks/bench_metadata_backends.py PROJECT_ID DATASET_ID [--parallelism N]
+"""
+
+import time
+
+from cyclopts import App
+
+from cautils import metadata_tool as mt
+
+app = App()
+
+
+class CallCounter:
+    def __init__(self, session):
+        self.calls = 0
+        self._request = session.request
+        session.request = self
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self._request(*args, **kwargs)
+
+
+def _run(counter: CallCounter, label: str, fetch):
+    counter.calls = 0
+    start = time.perf_counter()
+    extracts = [mt.export_table(t) for t in fetch()]
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<28} tables={len(extracts):<6} calls={counter.calls:<6} wall={elapsed:.2f}s"
+    )
+    return extracts
+
+
+@app.default
+def main(project_id: str, dataset_id: str, parallelism: int = mt.DEFAULT_PARALLELISM):
+    counter = CallCounter(mt.get_client(project_id)._http)
+
+    per_table = _run(
+        counter,
+        "api, sequential",
+        lambda: mt.fetch_tables_metadata(mt.list_tables(project_id, dataset_id), 1),
+    )
+    _run(
+        counter,
+        f"api, parallelism={parallelism}",
+        lambda: mt.get_tables_metadata(project_id, dataset_id, parallelism),
+    )
+    bulk = _run(
+        counter,
+        "information_schema",
+        lambda: mt.get_tables_metadata_bulk(project_id, dataset_id),
+    )
+
+    differences = [a["tableId"] for a, b in zip(per_table, bulk) if a != b] + [
+        t["tableId"] for t in per_table[len(bulk) :] + bulk[len(per_table) :]
+    ]
+    if differences:
+        print(f"tables with different output: {', '.join(differences)}")
+    else:
+        print("both backends produced the same tableReferences")
+
+
+if __name__ == "__main__":
+    app()
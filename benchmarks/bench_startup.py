@@ -0,0 +1,108 @@
+"""Measures the startup time of ca-utils commands, to catch regressions in
+what they import.
+
+Each command line runs in a fresh interpreter with `python -X importtime`.
+Reported per command: median wall time, total import time, which heavy
+modules (genai, BigQuery) were loaded, and the import time of the main
+dependencies.
+
+usage: python benchmarks/bench_startup.py [--runs N]
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from cyclopts import App
+
+app = App()
+
+COMMANDS = [
+    ["--help"],
+    ["da-lro", "--help"],
+    ["da-lro", "list", "--help"],
+    ["data-agent", "--help"],
+    ["data-agent", "list", "--help"],
+    ["data-agent", "autogen", "--help"],
+]
+HEAVY_MODULES = ["google.genai", "google.cloud.bigquery"]
+# dependencies whose import time is shown, when they are imported
+REPORTED_MODULES = [
+    *HEAVY_MODULES,
+    "google.auth",
+    "requests",
+    "httpx",
+    "yaml",
+    "rich",
+    "cyclopts",
+]
+
+# runs the CLI as the ca-utils entry point would, then reports heavy modules
+RUNNER = """
+import json, sys
+command, heavy_modules = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+sys.argv = ["ca-utils", *command]
+try:
+    import cautils.main
+except SystemExit:
+    pass
+print(json.dumps([m for m in heavy_modules if m in sys.modules]))
+"""
+
+
+def run(command: list[str]) -> tuple[float, str, list[str]]:
+    start = time.perf_counter()
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            RUNNER,
+            json.dumps(command),
+            json.dumps(HEAVY_MODULES),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    heavy = json.loads(process.stdout.strip().splitlines()[-1])
+    return elapsed, process.stderr, heavy
+
+
+def import_times(importtime: str) -> tuple[float, dict[str, float]]:
+    """Total import time, and cumulative import time of each module, in seconds."""
+    total = 0.0
+    times = {}
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        seconds = int(cumulative) / 1e6
+        times.setdefault(name.strip(), seconds)
+        if not name[1:].startswith(" "):  # nested imports are indented
+            total += seconds
+    return total, times
+
+
+@app.default
+def main(runs: int = 5):
+    for command in COMMANDS:
+        walls = []
+        for _ in range(runs):
+            wall, importtime, heavy = run(command)
+            walls.append(wall)
+        total, times = import_times(importtime)
+        modules = ", ".join(
+            f"{name} {times[name]:.2f}s" for name in REPORTED_MODULES if name in times
+        )
+        print(
+            f"{' '.join(command):<28} wall={statistics.median(walls):.2f}s "
+            f"imports={total:.2f}s heavy={heavy or '-'}\n    {modules}"
+        )
+
+
+if __name__ == "__main__":
+    app()
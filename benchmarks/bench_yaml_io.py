@@ -0,0 +1,93 @@
+"""Compares the libyaml and pure Python yaml backends of cautils.yaml_io on a
+large generated datasourceReferences.yaml.
+
+Reports the best load and dump time of each backend, and checks that both
+dump the same bytes.
+
+usage: python benchmarks/bench_yaml_io.py [--tables N] [--columns N] [--runs N]
+"""
+
+import random
+import time
+
+import yaml
+from cyclopts import App
+
+from cautils import yaml_io
+
+app = App()
+
+TYPES = ["STRING", "INTEGER", "FLOAT", "DATE", "TIMESTAMP", "BOOLEAN", "NUMERIC"]
+WORDS = "amount customer order date region product total net tax id code name".split()
+
+
+def generate_schema(tables: int, columns: int) -> dict:
+    rng = random.Random(0)
+
+    def description():
+        return " ".join(rng.choices(WORDS, k=rng.randint(3, 30))).capitalize() + "."
+
+    return {
+        "bq": {
+            "tableReferences": [
+                {
+                    "projectId": "bench-project",
+                    "datasetId": f"dataset_{t % 10}",
+                    "tableId": f"table_{t}",
+                    "schema": {
+                        "description": description(),
+                        "fields": [
+                            {
+                                "name": f"{rng.choice(WORDS)}_{c}",
+                                "type": rng.choice(TYPES),
+                                "mode": rng.choice(["NULLABLE", "REQUIRED"]),
+                                "description": description(),
+                            }
+                            for c in range(columns)
+                        ],
+                    },
+                }
+                for t in range(tables)
+            ]
+        }
+    }
+
+
+def best_time(func, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+@app.default
+def main(tables: int = 500, columns: int = 40, runs: int = 3):
+    content = generate_schema(tables, columns)
+    text = yaml_io.dumps(content, dumper=yaml.SafeDumper)
+    print(f"{tables} tables x {columns} columns, {len(text) / 1e6:.1f} MB of yaml")
+
+    backends = {"pure": (yaml.SafeLoader, yaml.SafeDumper)}
+    if yaml.__with_libyaml__:
+        backends["libyaml"] = (yaml.CSafeLoader, yaml.CSafeDumper)
+    else:
+        print("PyYAML was built without libyaml, only the pure backend is measured")
+
+    results = {}
+    for name, (loader, dumper) in backends.items():
+        load = best_time(lambda loader=loader: yaml.load(text, Loader=loader), runs)
+        dump = best_time(
+            lambda dumper=dumper: yaml_io.dumps(content, dumper=dumper), runs
+        )
+        results[name] = (load, dump)
+        same = yaml_io.dumps(content, dumper=dumper) == text
+        print(f"{name:<8} load={load:.2f}s dump={dump:.2f}s identical={same}")
+
+    if "libyaml" in results:
+        (pure_load, pure_dump), (c_load, c_dump) = results["pure"], results["libyaml"]
+        print(f"speedup  load={pure_load / c_load:.1f}x dump={pure_dump / c_dump:.1f}x")
+
+
+if __name__ == "__main__":
+    app()
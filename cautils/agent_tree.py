@@ -0,0 +1,341 @@
+"""Upload and download of many data agents at once, one directory per agent.
+
+An agent directory has the same files that data-agent upload reads from the
+current directory (datasourceReferences.yaml, systemInstruction.yaml,
+agentMetadata.yaml, ...), and its name is the agent ID.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import yaml
+from requests.exceptions import HTTPError, RequestException
+from rich import box
+from rich import print as rprint
+from rich.console import Console
+from rich.prompt import Prompt
+from rich.table import Table
+
+from . import yaml_io
+from .helpers import (
+    GeminiDataAnalyticsRequestHelper,
+    iter_pages,
+    print_request_stats,
+)
+
+DATA_AGENT_ELEMENTS = [
+    "datasourceReferences",
+    "exampleQueries",
+    "glossaryTerms",
+    "schemaRelationships",
+    "systemInstruction",
+]
+METADATA_FILE = "agentMetadata.yaml"
+METADATA_KEYS = ["displayName", "description"]
+DEFAULT_CONCURRENCY = 8
+
+
+def copy_if_exists(from_dict: dict, to_dict: dict, keys: list[str]):
+    if not from_dict:
+        return
+    for k in keys:
+        if k in from_dict:
+            to_dict[k] = from_dict[k]
+
+
+def agent_file_names() -> list[str]:
+    return [f"{element}.yaml" for element in DATA_AGENT_ELEMENTS] + [METADATA_FILE]
+
+
+def find_agent_dirs(root: Path) -> list[Path]:
+    """Directories under root (root included) with at least one agent file.
+    Hidden directories, i.e. .git, are skipped."""
+    found = set()
+    for file_name in agent_file_names():
+        for path in root.rglob(file_name):
+            relative = path.parent.relative_to(root)
+            if not any(part.startswith(".") for part in relative.parts):
+                found.add(path.parent)
+    return sorted(found)
+
+
+def read_agent_payload(agent_dir: Path) -> tuple[dict, list[str]]:
+    """Builds the create/patch payload from the files in agent_dir.
+
+    Returns:
+        the payload, and the names of the elements (and "metadata") found.
+    """
+    published_context = {}
+    added = []
+    for element in DATA_AGENT_ELEMENTS:
+        path = agent_dir / f"{element}.yaml"
+        if path.exists():
+            published_context[element] = yaml_io.load_file(path)
+            added.append(element)
+
+    payload = {
+        "dataAnalyticsAgent": {"publishedContext": published_context},
+    }
+    path = agent_dir / METADATA_FILE
+    if path.exists():
+        metadata = yaml_io.load_file(path)
+        copy_if_exists(metadata, payload, METADATA_KEYS)
+        added.append("metadata")
+    return payload, added
+
+
+def _is_empty(value) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _same(local, remote) -> bool:
+    # the API leaves out empty fields
+    if _is_empty(local) and _is_empty(remote):
+        return True
+    return local == remote
+
+
+def changed_fields(payload: dict, remote: dict) -> list[str]:
+    """updateMask paths of the fields of an upload payload that differ from the
+    remote agent. Elements and metadata missing locally are cleared remotely,
+    as with a full update."""
+    fields = []
+    local_context = payload.get("dataAnalyticsAgent", {}).get("publishedContext", {})
+    remote_context = remote.get("dataAnalyticsAgent", {}).get("publishedContext", {})
+    for element in DATA_AGENT_ELEMENTS:
+        if not _same(local_context.get(element), remote_context.get(element)):
+            fields.append(f"dataAnalyticsAgent.publishedContext.{element}")
+    for key in METADATA_KEYS:
+        if not _same(payload.get(key), remote.get(key)):
+            fields.append(key)
+    return fields
+
+
+def upload_payload(
+    helper: GeminiDataAnalyticsRequestHelper,
+    ca_agent_id: str,
+    payload: dict,
+    patch: bool,
+) -> dict | None:
+    """Creates or patches an agent, and returns the deployment LRO.
+
+    A patch first gets the remote agent, and only sends the fields that
+    changed, or nothing (returning None) when there are no changes, so no
+    deployment is started.
+    """
+    if not patch:
+        params = {"dataAgentId": ca_agent_id}
+        return helper.post("dataAgents", payload, params)
+
+    remote = helper.get(f"dataAgents/{ca_agent_id}")
+    fields = changed_fields(payload, remote)
+    if not fields:
+        return None
+    published_context = payload["dataAnalyticsAgent"]["publishedContext"]
+    changed = {
+        "dataAnalyticsAgent": {
+            "publishedContext": {
+                element: published_context[element]
+                for element in DATA_AGENT_ELEMENTS
+                if f"dataAnalyticsAgent.publishedContext.{element}" in fields
+                and element in published_context
+            }
+        }
+    }
+    copy_if_exists(payload, changed, [k for k in METADATA_KEYS if k in fields])
+    params = {"updateMask": ",".join(fields)}
+    return helper.patch(f"dataAgents/{ca_agent_id}", changed, params)
+
+
+def agent_files(agent: dict) -> dict[str, object]:
+    """Content of each file that represents a downloaded agent, by file name."""
+    contents = {}
+    published_context = agent.get("dataAnalyticsAgent", {}).get("publishedContext", {})
+    for element in DATA_AGENT_ELEMENTS:
+        content = published_context.get(element)
+        if content:
+            contents[f"{element}.yaml"] = content
+    metadata = {}
+    copy_if_exists(agent, metadata, METADATA_KEYS)
+    if metadata:
+        contents[METADATA_FILE] = metadata
+    return contents
+
+
+def _request_error(e: RequestException) -> str:
+    if isinstance(e, HTTPError):
+        return f"{e.response.status_code}: {e.response.text}"
+    return str(e)
+
+
+def print_tree_summary(results: list[dict], detail_column: str):
+    table = Table(box=box.SQUARE)
+    table.add_column("Agent", style="bright_green")
+    table.add_column("Result")
+    table.add_column(detail_column, overflow="fold")
+
+    for result in results:
+        if "error" in result:
+            table.add_row(
+                result["agent"], "[bright_red]error[/bright_red]", result["error"]
+            )
+        elif result.get("skipped"):
+            table.add_row(result["agent"], "skipped", result["detail"])
+        else:
+            table.add_row(result["agent"], "ok", result["detail"])
+
+    console = Console(highlight=False)
+    console.print(table)
+    failed = sum(1 for r in results if "error" in r)
+    skipped = sum(1 for r in results if r.get("skipped"))
+    rprint(
+        f"{len(results) - failed - skipped} succeeded, {skipped} skipped, {failed} failed"
+    )
+
+
+def _run_concurrently(run, jobs: list, concurrency: int) -> list[dict]:
+    """Runs run(job) with up to concurrency jobs at a time, printing each result
+    as it finishes. Results keep the order of jobs."""
+    lock = threading.Lock()
+    done = [0]
+
+    def run_and_report(job):
+        result = run(job)
+        with lock:
+            done[0] += 1
+            if "error" in result:
+                status = "[bright_red]error[/bright_red]"
+            else:
+                status = "skipped" if result.get("skipped") else "ok"
+            rprint(f"[{done[0]}/{len(jobs)}] {result['agent']}: {status}")
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return [*executor.map(run_and_report, jobs)]
+
+
+def upload_tree(
+    project_id: str,
+    location: str,
+    root: Path = Path("."),
+    patch: bool = False,
+    concurrency: int = DEFAULT_CONCURRENCY,
+):
+    """Uploads every agent directory found under root, concurrently.
+
+    Each directory is uploaded as data-agent upload would from inside it, and
+    its name is the agent ID. The deployment LRO of each agent is shown in a
+    summary at the end.
+
+    Args:
+        project_id: The Google Cloud project ID.
+        location: The Google Cloud location.
+        root: Directory where agent directories are searched, recursively.
+        patch: Whether to patch existing agents, instead of creating them.
+            Agents with no changes are skipped.
+        concurrency: Maximum number of uploads running at the same time.
+    """
+    agent_dirs = find_agent_dirs(root)
+    if not agent_dirs:
+        rprint(f"[bright_red]No agent directories found under {root}[/bright_red]")
+        return
+    ids = [agent_dir.resolve().name for agent_dir in agent_dirs]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        rprint(
+            f"[bright_red]Several directories have the same agent ID: {', '.join(duplicates)}[/bright_red]"
+        )
+        return
+
+    helper = GeminiDataAnalyticsRequestHelper(
+        project_id, location, pool_maxsize=max(1, concurrency)
+    )
+
+    def upload(agent_dir: Path) -> dict:
+        ca_agent_id = agent_dir.resolve().name
+        try:
+            payload, _ = read_agent_payload(agent_dir)
+            response = upload_payload(helper, ca_agent_id, payload, patch)
+        except RequestException as e:
+            return {"agent": ca_agent_id, "error": _request_error(e)}
+        except (OSError, yaml.YAMLError) as e:
+            return {"agent": ca_agent_id, "error": str(e)}
+        if response is None:
+            return {"agent": ca_agent_id, "skipped": True, "detail": "no changes"}
+        return {"agent": ca_agent_id, "detail": response["name"]}
+
+    rprint(f"Uploading {len(agent_dirs)} agents, {concurrency} at a time")
+    results = _run_concurrently(upload, agent_dirs, concurrency)
+    print_tree_summary(results, "LRO")
+    print_request_stats(helper)
+    if any("error" not in r and not r.get("skipped") for r in results):
+        rprint(
+            f"To follow the deployments, run [green]ca-utils da-lro follow {project_id} {location} --all-running[/green]"
+        )
+
+
+def download_tree(
+    project_id: str,
+    location: str,
+    root: Path = Path("."),
+    concurrency: int = DEFAULT_CONCURRENCY,
+    overwrite: bool = False,
+):
+    """Downloads every data agent in a project and location, each one to a
+    directory under root named after the agent ID.
+
+    Agents are listed with large pages, and their files written concurrently.
+    Whether existing files can be overwritten is asked once, before writing.
+
+    Args:
+        project_id: The Google Cloud project ID.
+        location: The Google Cloud location.
+        root: Directory where agent directories are created.
+        concurrency: Maximum number of agents written at the same time.
+        overwrite: Overwrite existing files without asking.
+    """
+    helper = GeminiDataAnalyticsRequestHelper(project_id, location)
+    try:
+        agents = [
+            agent
+            for data in iter_pages(lambda params: helper.get("dataAgents", params))
+            for agent in data.get("dataAgents", [])
+        ]
+    except HTTPError as e:
+        rprint(f"[bright_red]{e.response.text}[/bright_red]")
+        return
+    if not agents:
+        rprint("No agents found")
+        return
+
+    jobs = [(agent["name"].split("/")[-1], agent_files(agent)) for agent in agents]
+    existing = [
+        root / ca_agent_id
+        for ca_agent_id, contents in jobs
+        if any((root / ca_agent_id / name).exists() for name in contents)
+    ]
+    if existing and not overwrite:
+        choice = Prompt.ask(
+            f"Files of {len(existing)} agents exist under {root}, overwrite?",
+            choices=["y", "n"],
+            default="n",
+        )
+        if choice == "n":
+            return
+
+    def write(job) -> dict:
+        ca_agent_id, contents = job
+        agent_dir = root / ca_agent_id
+        try:
+            agent_dir.mkdir(parents=True, exist_ok=True)
+            for name, content in contents.items():
+                yaml_io.dump(content, agent_dir / name)
+        except OSError as e:
+            return {"agent": ca_agent_id, "error": str(e)}
+        return {"agent": ca_agent_id, "detail": f"{len(contents)} files in {agent_dir}"}
+
+    rprint(f"Downloading {len(jobs)} agents to {root}")
+    results = _run_concurrently(write, jobs, concurrency)
+    print_tree_summary(results, "Files")
+    print_request_stats(helper)
@@ -0,0 +1,259 @@
+"""asyncio counterpart of GoogleRequestHelper, for callers that run many
+requests at the same time on one event loop.
+
+Requests go through one pooled httpx.AsyncClient (HTTP/2 when the h2 package
+is installed, HTTP/1.1 keep-alive otherwise), with the same retry policy and
+rate limiting as GoogleRequestHelper. Error responses raise
+httpx.HTTPStatusError, whose response has status_code and text, as the
+requests HTTPError raised by GoogleRequestHelper.
+"""
+
+import asyncio
+import importlib.util
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+
+from .backoff import backoff_delay
+from .google_request_helper import (
+    IDEMPOTENT_METHODS,
+    MAX_RETRIES,
+    RETRY_AFTER_MAX,
+    RETRY_INITIAL_DELAY,
+    RETRY_MAX_DELAY,
+    RETRY_STATUSES,
+    GoogleRequestHelper,
+    JsonArrayParser,
+    endpoint_key,
+    retry_after_seconds,
+)
+from .helpers import ALL_PAGE_SIZE
+from .rate_limit import shared_limiter
+
+# connections kept open to each host
+MAX_CONNECTIONS = 100
+TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+class AsyncGoogleRequestHelper:
+    def __init__(
+        self,
+        project_id,
+        base_url,
+        max_connections: int = MAX_CONNECTIONS,
+        max_qps: float = None,
+        http2: bool = None,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        """
+        Args:
+            project_id: The Google Cloud project ID, also used for quota.
+            base_url: Prefix of the url of every request.
+            max_connections: Maximum connections open at the same time.
+            max_qps: Maximum requests per second to each endpoint, shared with
+                every other helper of the process. By default, CA_UTILS_MAX_QPS.
+            http2: Whether to use HTTP/2. By default, when h2 is installed.
+            transport: httpx transport, i.e. to send requests somewhere else in tests.
+        """
+        self.project_id = project_id
+        self.base_url = base_url
+        # credentials, token cache and refresh are the sync helper's, called
+        # from a thread, so one refresh is shared by every task
+        self._auth = GoogleRequestHelper(
+            project_id, base_url, pool_maxsize=1, max_qps=max_qps
+        )
+        self.max_qps = self._auth.max_qps
+        self._token_lock = asyncio.Lock()
+        if http2 is None:
+            http2 = importlib.util.find_spec("h2") is not None
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=TIMEOUT,
+            transport=transport,
+        )
+        self.requests_sent = 0
+        self.retries = 0
+        self.retry_wait_seconds = 0.0
+        self.throttled_seconds = 0.0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+        self._auth.close()
+
+    def stats(self) -> dict:
+        return {
+            "requests_sent": self.requests_sent,
+            "tokens_refreshed": self._auth.tokens_refreshed,
+            "retries": self.retries,
+            "retry_wait_seconds": self.retry_wait_seconds,
+            "throttled_seconds": self.throttled_seconds,
+        }
+
+    async def _access_token(self) -> str:
+        if not self._auth._token_is_fresh():
+            async with self._token_lock:
+                if not self._auth._token_is_fresh():
+                    await asyncio.to_thread(self._auth._get_access_token)
+        return self._auth._token
+
+    async def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {await self._access_token()}",
+            "Content-Type": "application/json",
+            "X-Goog-User-Project": self.project_id,
+        }
+
+    async def _throttle(self, method: str, url: str):
+        if self.max_qps <= 0:
+            return
+        wait = shared_limiter(endpoint_key(method, url), self.max_qps).reserve()
+        if wait > 0:
+            self.throttled_seconds += wait
+            await asyncio.sleep(wait)
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        idempotent: bool = None,
+        stream: bool = False,
+        **kwargs,
+    ) -> httpx.Response:
+        """Sends a request, retrying it as GoogleRequestHelper._send does.
+
+        With stream, the response body is not read, and the caller must close
+        the response.
+
+        Raises:
+            httpx.HTTPStatusError: for error responses, once retries are exhausted.
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            await self._throttle(method, url)
+            delay = None
+            try:
+                request = self.client.build_request(
+                    method, url, headers=await self._headers(), **kwargs
+                )
+                self.requests_sent += 1
+                response = await self.client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                safe = idempotent or isinstance(
+                    e, (httpx.ConnectError, httpx.ConnectTimeout)
+                )
+                if not safe or attempt >= MAX_RETRIES:
+                    raise
+            else:
+                retry = response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES
+                if retry and not idempotent and response.status_code != 429:
+                    retry = False
+                if not retry:
+                    if response.is_error:
+                        await response.aread()
+                        await response.aclose()
+                        response.raise_for_status()
+                    return response
+                delay = retry_after_seconds(response)
+                if delay is not None:
+                    delay = min(delay, RETRY_AFTER_MAX)
+                await response.aclose()
+            if delay is None:
+                delay = backoff_delay(attempt, RETRY_INITIAL_DELAY, RETRY_MAX_DELAY)
+            self.retries += 1
+            self.retry_wait_seconds += delay
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _execute_request(
+        self,
+        method: str,
+        url: str,
+        data: dict = None,
+        params: dict = None,
+        idempotent: bool = None,
+    ) -> dict:
+        response = await self._send(
+            method, self.base_url + url, idempotent, json=data, params=params
+        )
+        return response.json()
+
+    async def post_stream(self, url, data, params: dict[str, str] = None):
+        """Posts data to a method that streams a JSON array, and yields each
+        element as soon as it arrives."""
+        response = await self._send(
+            "POST", self.base_url + url, json=data, params=params, stream=True
+        )
+        parser = JsonArrayParser()
+        try:
+            async for chunk in response.aiter_bytes():
+                for element in parser.feed(chunk):
+                    yield element
+        finally:
+            await response.aclose()
+
+    async def get_project_number(self):
+        response = await self._send(
+            "GET",
+            f"https://cloudresourcemanager.googleapis.com/v1/projects/{self.project_id}",
+        )
+        return response.json().get("projectNumber")
+
+    async def get(self, url, params: dict = None):
+        return await self._execute_request("GET", url, params=params)
+
+    async def post(
+        self, url, data, params: dict[str, str] = None, idempotent: bool = False
+    ):
+        return await self._execute_request("POST", url, data, params, idempotent)
+
+    async def delete(self, url, params: dict = None):
+        return await self._execute_request("DELETE", url, params=params)
+
+    async def patch(
+        self, url, data, params: dict[str, str] = None, idempotent: bool = False
+    ):
+        return await self._execute_request("PATCH", url, data, params, idempotent)
+
+
+class AsyncGeminiDataAnalyticsRequestHelper(AsyncGoogleRequestHelper):
+    def __init__(self, project_id, location, **kwargs):
+        self.base_url = f"https://geminidataanalytics.googleapis.com/v1beta/projects/{project_id}/locations/{location}/"
+        super().__init__(project_id, self.base_url, **kwargs)
+
+
+async def paginate(
+    retriever: Callable[[dict], Awaitable[dict]], page_size: int = ALL_PAGE_SIZE
+) -> AsyncIterator[dict]:
+    """Yields every page of a list method. The next page is requested as soon
+    as the current one arrives, so it downloads while the caller handles it.
+
+    Usage:
+        async for page in paginate(lambda params: helper.get("dataAgents", params)):
+            ...
+    """
+    task = asyncio.ensure_future(retriever({"pageSize": page_size}))
+    try:
+        while task is not None:
+            data = await task
+            if next_page_token := data.get("nextPageToken"):
+                task = asyncio.ensure_future(
+                    retriever({"pageToken": next_page_token, "pageSize": page_size})
+                )
+            else:
+                task = None
+            yield data
+    finally:
+        if task is not None:
+            task.cancel()
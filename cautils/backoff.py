@@ -0,0 +1,16 @@
+"""Exponential backoff with jitter, for polling and retries."""
+
+import random
+
+
+def backoff_delay(
+    attempt: int, initial: float, maximum: float, factor: float = 2.0
+) -> float:
+    """Seconds to wait before attempt number `attempt` + 1 (attempt starts at 0).
+
+    The delay grows from initial by factor on every attempt, up to maximum.
+    Half of it is random ("equal jitter"), so many callers backing off at the
+    same time spread out, while none of them waits less than half the delay.
+    """
+    delay = min(maximum, initial * factor**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
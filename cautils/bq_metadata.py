@@ -1,8 +1,9 @@
+import sys
+
 from cyclopts import App
-from google.cloud.bigquery import TableReference
-from yaml import dump
 import json
 from . import metadata_tool
+from . import yaml_io
 
 app = App(
     "bq-metadata",
@@ -13,21 +14,26 @@ app = App(
 # Note: this is not being used, it was replaced by
 # data_agent.autogen
 @app.command
-def export(project_id: str, dataset_id: str):
+def export(
+    project_id: str,
+    dataset_id: str,
+    parallelism: int = metadata_tool.DEFAULT_PARALLELISM,
+):
     """Exports BigQuery table metadata.
 
     Args:
         project_id: The Google Cloud project ID.
         dataset_id: The ID of the BigQuery dataset.
+        parallelism: Maximum number of tables whose metadata is fetched at the same time.
     """
-    tables = metadata_tool.get_tables_metadata(
-        project_id=project_id, dataset_id=dataset_id
+    tables = metadata_tool.iter_tables_metadata(
+        metadata_tool.list_tables(project_id, dataset_id), parallelism
+    )
+    yaml_io.dump_list_streaming(
+        sys.stdout,
+        ["tableReferences"],
+        (metadata_tool.export_table(t) for t in tables),
     )
-    table_extracts = []
-    for t in tables:
-        table_extracts.append(metadata_tool.export_table(t))
-
-    print(dump({"tableReferences": table_extracts}))
     # print("---")
     # print(json.dumps({"tableReferences": references}, indent=2))
     # for table in tables:
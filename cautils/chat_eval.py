@@ -0,0 +1,215 @@
+"""Batch evaluation and load testing of data agents through the chat method."""
+
+import json
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from requests.exceptions import HTTPError, RequestException
+from rich import box
+from rich import print as rprint
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+from . import chat_messages, yaml_io
+from .helpers import GeminiDataAnalyticsRequestHelper, print_request_stats
+from .rate_limit import TokenBucket
+
+
+def read_prompts(prompts_file: Path) -> list[dict]:
+    """Reads prompts from a yaml list, or a .jsonl file with one prompt per line.
+
+    Each prompt is either a string, or a mapping with "prompt" and, optionally,
+    "expectedSql", "expectedAnswer" and "agent" (to override the agents given
+    on the command line).
+    """
+    with open(prompts_file, "r") as file:
+        if prompts_file.suffix == ".jsonl":
+            entries = [json.loads(line) for line in file if line.strip()]
+        else:
+            entries = yaml_io.load(file) or []
+    prompts = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"prompt": entry}
+        if not entry.get("prompt"):
+            raise ValueError(f"Prompt entries must have a 'prompt': {entry}")
+        prompts.append(entry)
+    return prompts
+
+
+def normalize_sql(sql: str) -> str:
+    sql = sql.replace("`", "").strip().rstrip(";")
+    return re.sub(r"\s+", " ", sql).lower()
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run_prompt(
+    helper: GeminiDataAnalyticsRequestHelper,
+    project_id: str,
+    location: str,
+    ca_agent_id: str,
+    entry: dict,
+) -> dict:
+    """Sends one prompt to one agent, and returns its result and timings."""
+    payload = {
+        "messages": [{"userMessage": {"text": entry["prompt"]}}],
+        "dataAgentContext": {
+            "dataAgent": f"projects/{project_id}/locations/{location}/dataAgents/{ca_agent_id}"
+        },
+    }
+    result = {"agent": ca_agent_id, "prompt": entry["prompt"]}
+    messages = []
+    start = time.perf_counter()
+    try:
+        for message in helper.post_stream(":chat", payload):
+            if not messages:
+                result["firstMessageSeconds"] = time.perf_counter() - start
+            messages.append(message)
+    except HTTPError as e:
+        result["error"] = f"{e.response.status_code}: {e.response.text}"
+    except RequestException as e:
+        result["error"] = str(e)
+    except json.JSONDecodeError as e:
+        result["error"] = f"Malformed streamed message: {e}"
+    result["latencySeconds"] = time.perf_counter() - start
+
+    errors = [
+        m["systemMessage"]["error"]
+        for m in messages
+        if "error" in m.get("systemMessage", {})
+    ]
+    if errors and "error" not in result:
+        result["error"] = json.dumps(errors)
+    result["sql"] = chat_messages.generated_sql(messages)
+    result["answer"] = chat_messages.final_text(messages)
+    if entry.get("expectedSql"):
+        result["sqlMatch"] = bool(result["sql"]) and normalize_sql(
+            result["sql"]
+        ) == normalize_sql(entry["expectedSql"])
+    if entry.get("expectedAnswer"):
+        result["answerMatch"] = (
+            str(entry["expectedAnswer"]).lower() in result["answer"].lower()
+        )
+    return result
+
+
+def print_summary(results: list[dict], wall_seconds: float):
+    table = Table(box=box.SQUARE)
+    table.add_column("Agent", style="bright_green")
+    table.add_column("Prompts", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("p50", justify="right")
+    table.add_column("p95", justify="right")
+    table.add_column("p99", justify="right")
+    table.add_column("SQL match", justify="right")
+    table.add_column("Answer match", justify="right")
+
+    groups = {}
+    for result in results:
+        groups.setdefault(result["agent"], []).append(result)
+    if len(groups) > 1:
+        groups["all"] = results
+
+    for agent, group in groups.items():
+        latencies = sorted(r["latencySeconds"] for r in group if "error" not in r)
+        errors = sum(1 for r in group if "error" in r)
+        sql_checked = [r["sqlMatch"] for r in group if "sqlMatch" in r]
+        answer_checked = [r["answerMatch"] for r in group if "answerMatch" in r]
+        table.add_row(
+            agent,
+            str(len(group)),
+            f"{errors} ({errors / len(group):.0%})",
+            *(f"{percentile(latencies, p):.2f}s" for p in (50, 95, 99)),
+            f"{sum(sql_checked)}/{len(sql_checked)}" if sql_checked else "-",
+            f"{sum(answer_checked)}/{len(answer_checked)}" if answer_checked else "-",
+        )
+
+    console = Console(highlight=False)
+    console.print(table)
+    rprint(
+        f"{len(results)} prompts in {wall_seconds:.1f}s, "
+        f"throughput {len(results) / wall_seconds if wall_seconds else 0:.2f} prompts/s"
+    )
+
+
+def chat_batch(
+    project_id: str,
+    location: str,
+    prompts_file: Path,
+    ca_agent_ids: list[str],
+    concurrency: int = 4,
+    rate: float = 0,
+    output: Path = Path("chat_results.jsonl"),
+):
+    """Sends every prompt in a file to one or more data agents, concurrently, and
+    reports latency percentiles, error rates and throughput.
+
+    Args:
+        project_id: The Google Cloud project ID.
+        location: The Google Cloud location.
+        prompts_file: A yaml list (or .jsonl file) of prompts. Each entry is a
+            string or a mapping with prompt and, optionally, expectedSql,
+            expectedAnswer and agent.
+        ca_agent_ids: The IDs of the data agents that receive every prompt.
+        concurrency: Maximum number of chats running at the same time.
+        rate: Maximum number of chats started per second. 0 means no limit.
+        output: File where one JSON result per prompt and agent is written, as
+            soon as each one finishes.
+    """
+    try:
+        prompts = read_prompts(prompts_file)
+    except (OSError, ValueError) as e:
+        rprint(f"[bright_red]{e}[/bright_red]")
+        return
+
+    jobs = [
+        (agent, entry)
+        for entry in prompts
+        for agent in ([entry["agent"]] if entry.get("agent") else ca_agent_ids)
+    ]
+    concurrency = max(1, concurrency)
+    helper = GeminiDataAnalyticsRequestHelper(
+        project_id, location, pool_maxsize=concurrency
+    )
+    limiter = TokenBucket(rate) if rate > 0 else None
+    output_lock = threading.Lock()
+    results = []
+
+    def run(job):
+        agent, entry = job
+        if limiter:
+            limiter.acquire()
+        result = run_prompt(helper, project_id, location, agent, entry)
+        with output_lock:
+            file.write(json.dumps(result) + "\n")
+            file.flush()
+            results.append(result)
+            status = "[bright_red]error[/bright_red]" if "error" in result else "ok"
+            rprint(
+                f"[{len(results)}/{len(jobs)}] {agent}: {status} "
+                f"{result['latencySeconds']:.2f}s {escape(entry['prompt'][:60])}"
+            )
+
+    rprint(f"Running {len(jobs)} chats, {concurrency} at a time")
+    start = time.perf_counter()
+    with (
+        open(output, "w") as file,
+        ThreadPoolExecutor(max_workers=concurrency) as executor,
+    ):
+        for _ in executor.map(run, jobs):
+            pass
+    print_summary(results, time.perf_counter() - start)
+    print_request_stats(helper)
+    rprint(f"Results written to {output}")
@@ -0,0 +1,117 @@
+"""Helpers for the messages returned by the conversational analytics chat method."""
+
+import json
+
+from rich import box
+from rich.console import Console
+from rich.syntax import Syntax
+from rich.table import Table
+from rich.text import Text
+
+# rows of a data result shown when rendering a message
+MAX_ROWS_SHOWN = 20
+
+
+def step_name(message: dict) -> str:
+    """Short description of what a system message carries, i.e. "data: sql"."""
+    system_message = message.get("systemMessage", {})
+    for kind in ("text", "schema", "data", "analysis", "chart", "error"):
+        content = system_message.get(kind)
+        if content is None:
+            continue
+        if kind == "data":
+            if "generatedSql" in content:
+                return "data: sql"
+            if "result" in content:
+                return "data: rows"
+            if "bigQueryJob" in content:
+                return "data: job"
+            return "data: query"
+        if kind in ("schema", "chart"):
+            return f"{kind}: {'result' if 'result' in content else 'query'}"
+        return kind
+    if "userMessage" in message:
+        return "user"
+    return "other"
+
+
+def generated_sql(messages: list[dict]):
+    """The last SQL statement generated in a chat response, or None."""
+    sql = None
+    for message in messages:
+        data = message.get("systemMessage", {}).get("data", {})
+        sql = data.get("generatedSql", sql)
+    return sql
+
+
+def final_text(messages: list[dict]) -> str:
+    """Text of the final answer in a chat response (the last text message)."""
+    text = ""
+    for message in messages:
+        content = message.get("systemMessage", {}).get("text")
+        if content:
+            text = "".join(content.get("parts", []))
+    return text
+
+
+# model text and data values are printed as plain Text, or with markup=False,
+# since rich would read a "[" in them as markup
+
+
+def _print_rows(console: Console, result: dict):
+    fields = [f["name"] for f in result.get("schema", {}).get("fields", [])]
+    rows = result.get("data", [])
+    if not fields and rows:
+        fields = [*rows[0].keys()]
+    title = result.get("name")
+    table = Table(box=box.SQUARE, title=Text(title) if title else None)
+    for field in fields:
+        table.add_column(Text(field), overflow="fold")
+    for row in rows[:MAX_ROWS_SHOWN]:
+        table.add_row(*(Text(str(row.get(field, ""))) for field in fields))
+    console.print(table)
+    if len(rows) > MAX_ROWS_SHOWN:
+        console.print(f"... {len(rows) - MAX_ROWS_SHOWN} more rows")
+
+
+def render_message(console: Console, message: dict):
+    """Prints one chat message in a readable form, as it arrives."""
+    system_message = message.get("systemMessage", {})
+    step = step_name(message)
+    if "text" in system_message:
+        console.print("".join(system_message["text"].get("parts", [])), markup=False)
+    elif step == "schema: query":
+        question = system_message["schema"]["query"].get("question", "")
+        console.print(f"Question: {question}", markup=False)
+    elif step == "schema: result":
+        datasources = system_message["schema"]["result"].get("datasources", [])
+        tables = [
+            ".".join(
+                d["bigqueryTableReference"].get(k, "")
+                for k in ("projectId", "datasetId", "tableId")
+            )
+            for d in datasources
+            if "bigqueryTableReference" in d
+        ]
+        console.print(f"Tables: {', '.join(tables) or len(datasources)}", markup=False)
+    elif step == "data: sql":
+        console.print(
+            Syntax(system_message["data"]["generatedSql"], "sql", word_wrap=True)
+        )
+    elif step == "data: rows":
+        _print_rows(console, system_message["data"]["result"])
+    elif step == "data: query":
+        query = system_message["data"]["query"]
+        console.print(
+            f"Data query: {query.get('question', query.get('name', ''))}", markup=False
+        )
+    elif step == "chart: query":
+        instructions = system_message["chart"]["query"].get("instructions", "")
+        console.print(f"Chart: {instructions}", markup=False)
+    elif step == "chart: result":
+        console.print("Chart generated (vega config received)")
+    elif step == "error":
+        error = system_message["error"]
+        console.print(Text(str(error.get("text", error)), style="bright_red"))
+    else:
+        console.print(json.dumps(message, indent=2), markup=False)
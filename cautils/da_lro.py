@@ -1,13 +1,25 @@
+import datetime
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.exceptions import HTTPError, RequestException
 from rich.console import Console
-import json
-from cyclopts import App
+from cyclopts import App, Parameter
 from rich.table import Table
 from rich import box
 from rich.live import Live
 from rich import print as rprint
 import time
+from typing import Annotated, Literal
 
-from .helpers import GeminiDataAnalyticsRequestHelper, paginate
+from .backoff import backoff_delay
+from .helpers import (
+    GeminiDataAnalyticsRequestHelper,
+    iter_pages,
+    paginate,
+    print_request_stats,
+    stream_all,
+)
 
 app = App(
     "da-lro",
@@ -15,79 +27,237 @@ app = App(
 )
 
 
-def print_list(data):
+# rich style of each operation status in tables
+STATUS_STYLES = {"error": "bright_red", "success": "bright_green"}
+
+
+def operation_row(item: dict) -> dict:
+    metadata = item.get("metadata", {})
+    if item.get("done"):
+        status = "done"
+        response = ""
+        error = item.get("error")
+        if error:
+            status = "error"
+            response = f"code:{error.get('code')}\nmessage:{error.get('message')}"
+        if item.get("response"):
+            status = "success"
+            response = ""
+    else:
+        status = "running"
+        response = "N/A"
+
+    return {
+        "name": "/".join(item["name"].split("/")[4:]),
+        "verb": metadata.get("verb", "N/A"),
+        "target": metadata.get("target", "N/A"),
+        "status": status,
+        "createTime": metadata.get("createTime", "N.A"),
+        "updateTime": metadata.get("updateTime", "N.A"),
+        "response": response,
+    }
+
+
+def _operations_table() -> Table:
     table = Table(box=box.SQUARE, show_lines=True)
     table.add_column("LRO IDs", style="bright_green")
     table.add_column("Verb\nTarget", overflow="fold")
     table.add_column("Status\nDates")
     table.add_column("Response", overflow="fold")
+    return table
 
-    for item in data.get("operations", []):
-        name = "\n".join(item["name"].split("/")[4:])
-        metadata = item.get("metadata", {})
-        verb = metadata.get("verb", "N/A")
-        target = metadata.get("target", "N/A")
-        create_time = metadata.get("createTime", "N.A")
-        end_time = metadata.get("updateTime", "N.A")
-        dates = f"create: {create_time}\nupdate: {end_time}"
-
-        if item.get("done"):
-            status = "done"
-            error = item.get("error")
-            if error:
-                status = "[bright_red]error[/bright_red]"
-                response = f"code:{error.get('code')}\nmessage:{error.get('message')}"
-            item_response = item.get("response")
-            if item_response:
-                status = "[bright_green]success[/bright_green]"
-                response = ""
-        else:
-            status = "running"
-            response = "N/A"
 
-        table.add_row(name, verb + "\n" + target, status + "\n" + dates, response)
+def _operation_cells(item: dict) -> list[str]:
+    row = operation_row(item)
+    status = row["status"]
+    if style := STATUS_STYLES.get(status):
+        status = f"[{style}]{status}[/{style}]"
+    dates = f"create: {row['createTime']}\nupdate: {row['updateTime']}"
+    return [
+        row["name"].replace("/", "\n"),
+        row["verb"] + "\n" + row["target"],
+        status + "\n" + dates,
+        row["response"],
+    ]
+
+
+def operations_table(operations) -> Table:
+    table = _operations_table()
+    for item in operations:
+        table.add_row(*_operation_cells(item))
+    return table
+
 
+def print_list(data):
     console = Console(highlight=False)
-    console.print(table)
+    console.print(operations_table(data.get("operations", [])))
 
 
 @app.command()
-def list(project_id: str, location: str):
+def list(
+    project_id: str,
+    location: str,
+    fetch_all: Annotated[bool, Parameter(name="--all")] = False,
+    output_format: Literal["jsonl", "csv"] = "jsonl",
+):
     """Lists long running operations (LROs) in the specified project and location.
 
     Args:
         project_id: The Google Cloud project ID.
         location: The Google Cloud location.
+        fetch_all: List every LRO without asking, streaming them to stdout in
+            output_format.
+        output_format: Format used with --all: jsonl (raw JSON, one LRO per
+            line) or csv.
     """
     helper = GeminiDataAnalyticsRequestHelper(project_id, location)
+    if fetch_all:
+        stream_all(
+            lambda params: helper.get("operations", params),
+            "operations",
+            operation_row,
+            output_format,
+        )
+        return
     paginate(
         lambda params: helper.get("operations", params),
         lambda data: print_list(data),
     )
 
 
+# polling starts fast, for deployments that finish quickly, and backs off
+# exponentially (with jitter) up to MAX_POLL_DELAY
+FIRST_POLL_DELAY = 2.0
+POLL_BACKOFF_FACTOR = 1.5
+MAX_POLL_DELAY = 60.0
+# maximum number of operations polled at the same time
+MAX_CONCURRENT_POLLS = 8
+
+
+def _parse_time(value: str):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FollowedOperation:
+    """Polling state of one followed LRO."""
+
+    def __init__(self, lro_id: str):
+        self.lro_id = lro_id
+        self.data = {"name": f"-/-/-/-/operations/{lro_id}"}
+        self.polls = 0
+        self.error = None
+        self.next_poll = 0.0
+        self.detection_delay = None
+
+    @property
+    def done(self) -> bool:
+        return self.error is not None or self.data.get("done", False)
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None or "error" in self.data
+
+    def poll(self, helper: GeminiDataAnalyticsRequestHelper):
+        try:
+            self.data = helper.get(f"operations/{self.lro_id}")
+        except HTTPError as e:
+            if e.response.status_code != 429 and e.response.status_code < 500:
+                self.error = f"{e.response.status_code}: {e.response.text}"
+        except RequestException:
+            pass  # transient, polled again after the backoff
+        self.polls += 1
+        if self.data.get("done"):
+            # how long after the server finished the operation it was seen done
+            finished = _parse_time(self.data.get("metadata", {}).get("updateTime"))
+            if finished:
+                now = datetime.datetime.now(datetime.timezone.utc)
+                self.detection_delay = max(0.0, (now - finished).total_seconds())
+        self.next_poll = time.monotonic() + backoff_delay(
+            self.polls - 1, FIRST_POLL_DELAY, MAX_POLL_DELAY, POLL_BACKOFF_FACTOR
+        )
+
+
+def follow_table(operations) -> Table:
+    table = _operations_table()
+    table.add_column("Polls", justify="right")
+    table.add_column("Detected after", justify="right", overflow="fold")
+    for operation in operations:
+        if operation.error:
+            detected = f"[bright_red]{operation.error}[/bright_red]"
+        elif operation.detection_delay is not None:
+            detected = f"{operation.detection_delay:.1f}s"
+        else:
+            detected = ""
+        table.add_row(*_operation_cells(operation.data), str(operation.polls), detected)
+    return table
+
+
+def _running_operation_ids(helper: GeminiDataAnalyticsRequestHelper):
+    return [
+        operation["name"].split("/")[-1]
+        for data in iter_pages(lambda params: helper.get("operations", params))
+        for operation in data.get("operations", [])
+        if not operation.get("done")
+    ]
+
+
 @app.command()
-def follow(project_id: str, location: str, lro_id: str):
-    """Follows the status of a specific long running operation (LRO).
+def follow(project_id: str, location: str, *lro_ids: str, all_running: bool = False):
+    """Follows the status of one or more long running operations (LROs), until
+    all of them are done. Exits with code 1 if any of them failed.
+
+    Operations are polled concurrently, often at first and then less and less
+    often (up to every minute), so fast deployments are seen done quickly.
 
     Args:
         project_id: The Google Cloud project ID.
         location: The Google Cloud location.
-        lro_id: The ID of the long running operation to follow.
+        lro_ids: The IDs of the long running operations to follow.
+        all_running: Follow every operation that is not done yet.
     """
     helper = GeminiDataAnalyticsRequestHelper(project_id, location)
+    ids = [*lro_ids]
+    if all_running:
+        try:
+            ids += [i for i in _running_operation_ids(helper) if i not in ids]
+        except HTTPError as e:
+            rprint(f"[bright_red]{e.response.text}[/bright_red]")
+            sys.exit(1)
+    if not ids:
+        rprint("No operations to follow")
+        return
 
-    SLEEP = 15
-    rprint(f"Updates are made every {SLEEP}s. Times are in UTC.")
+    operations = [FollowedOperation(lro_id) for lro_id in ids]
+    rprint(f"Following {len(operations)} operations. Times are in UTC.")
     rprint(
-        "This will exit when LRO is done. [yellow]To cancel before that, press Ctrl+C[/yellow]"
+        "This will exit when all LROs are done. [yellow]To cancel before that, press Ctrl+C[/yellow]"
     )
-    with Live(Table(), auto_refresh=False) as live:
-        start_time = time.monotonic()
+    start_time = time.monotonic()
+    with (
+        ThreadPoolExecutor(
+            max_workers=min(MAX_CONCURRENT_POLLS, len(operations))
+        ) as executor,
+        Live(Table(), auto_refresh=False) as live,
+    ):
         while True:
-            current_elapsed_seconds = time.monotonic() - start_time
-            lro_data = helper.get(f"operations/{lro_id}")
-            live.update(print_list({"operations": [lro_data]}), refresh=True)
-            if lro_data.get("done", False):
+            now = time.monotonic()
+            due = [o for o in operations if not o.done and o.next_poll <= now]
+            for _ in executor.map(lambda operation: operation.poll(helper), due):
+                pass
+            live.update(follow_table(operations), refresh=True)
+            pending = [o for o in operations if not o.done]
+            if not pending:
                 break
-            time.sleep(SLEEP)
+            time.sleep(max(0.0, min(o.next_poll for o in pending) - time.monotonic()))
+
+    failed = sum(1 for o in operations if o.failed)
+    rprint(
+        f"{len(operations)} operations done in {time.monotonic() - start_time:.0f}s "
+        f"with {sum(o.polls for o in operations)} polls, {failed} failed"
+    )
+    print_request_stats(helper)
+    if failed:
+        sys.exit(1)
@@ -1,45 +1,36 @@
+import asyncio
 import json
+import time
 from pathlib import Path
 
-import yaml
-from cyclopts import App
-from requests.exceptions import HTTPError
+from cyclopts import App, Parameter
+from requests.exceptions import HTTPError, RequestException
 from rich import box
 from rich import print as rprint
 from rich.console import Console
+from rich.markup import escape
 from rich.table import Table
 from rich.prompt import Prompt
-from typing import Callable
+from typing import Annotated, Callable, Literal
 from . import metadata_tool as mt
-from importlib.resources import files
-
-from google.genai.types import (
-    Content,
-    GenerateContentConfig,
-    Part,
+from . import chat_messages
+from . import chat_eval
+from . import agent_tree
+from . import yaml_io
+from .agent_tree import (
+    METADATA_FILE,
+    agent_files,
+    read_agent_payload,
+    upload_payload,
 )
-from google import genai
+from .metadata_cache import MetadataCache
+from .genai_cache import GenerationCache
+from importlib.resources import files
 
-from .helpers import GeminiDataAnalyticsRequestHelper, paginate
+from .helpers import GeminiDataAnalyticsRequestHelper, paginate, stream_all
 
 app = App("data-agent", help="commands related to conversational analytics api agents")
 
-DATA_AGENT_ELEMENTS = [
-    "datasourceReferences",
-    "exampleQueries",
-    "glossaryTerms",
-    "schemaRelationships",
-    "systemInstruction",
-]
-
-
-def copy_if_exists(from_dict: dict, to_dict: dict, keys: list[str]):
-    if not from_dict:
-        return
-    for k in keys:
-        if k in from_dict:
-            to_dict[k] = from_dict[k]
-
 
 def read_json(filename: str):
     with open(filename, "r") as f:
@@ -55,9 +46,12 @@ def read_bytes(file_path: Path):
     return data
 
 
-def _resource_write_after_confirm(
-    content_generator: Callable[[], str], path: Path, ask: bool
-):
+def _confirm_overwrite(path: Path, ask: bool) -> tuple[bool, bool]:
+    """Asks whether an existing file can be overwritten.
+
+    Returns:
+        whether path can be written, and whether to keep asking for other files.
+    """
     if path.exists() and ask:
         choice = Prompt.ask(
             f"File {path} exists, overwrite? [Y]es,[N]o,[A]ll",
@@ -65,107 +59,292 @@ def _resource_write_after_confirm(
             default="n",
         )
         if choice == "n":
-            return True
+            return False, True
         elif choice == "a":
             ask = False
+    return True, ask
+
+
+def _resource_write_after_confirm(
+    content_generator: Callable[[], str], path: Path, ask: bool
+):
+    write, ask = _confirm_overwrite(path, ask)
+    if not write:
+        return ask
     path.write_text(content_generator())
     print(f"Wrote {path}")
     return ask
 
 
+def _yaml_dump(content, path: Path):
+    yaml_io.dump(content, path)
+    print(f"Wrote {path}")
+
+
 def _yaml_dump_after_confirm(
     content_generator: Callable[[], dict], path: Path, ask: bool
 ):
-    if path.exists() and ask:
-        choice = Prompt.ask(
-            f"File {path} exists, overwrite? [Y]es,[N]o,[A]ll",
-            choices=["y", "n", "a"],
-            default="n",
-        )
-        if choice == "n":
-            return True
-        elif choice == "a":
-            ask = False
-    with open(path, "w") as file:
-        yaml.safe_dump(content_generator(), file)
-        print(f"Wrote {path}")
+    write, ask = _confirm_overwrite(path, ask)
+    if not write:
+        return ask
+    _yaml_dump(content_generator(), path)
     return ask
 
 
 def _gen_example_queries(
-    project_id: str, location: str, data_source_references_path: Path
+    project_id: str,
+    location: str,
+    data_source_references_path: Path,
+    cache: GenerationCache = None,
+    prompt_format: str = "compact",
 ):
-    """Generates the schemaRelationships.yaml file, by calling an LLM with:
-    - input: the data_sourceReferences.yaml file
-    - output schema: a json schema file that matches the expected output
-    """
-    history = [
-        Content(
-            role="user",
-            parts=[
-                Part.from_bytes(
-                    data=read_bytes(data_source_references_path),
-                    mime_type="text/plain",
-                ),
-            ],
+    """Generates the exampleQueries.yaml file, see generation.generate_example_queries"""
+    from . import generation, prompt_encoding
+
+    encoding = prompt_encoding.PromptEncoding(prompt_format)
+    return asyncio.run(
+        _with_client(
+            project_id,
+            location,
+            lambda client: generation.generate_example_queries(
+                client, data_source_references_path, cache, encoding
+            ),
         )
-    ]
-
-    rel_schema = files("cautils").joinpath("exampleQueries_schema.json")
-
-    genai_client = genai.Client(vertexai=True, project=project_id, location=location)
-    response = genai_client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=history,
-        config=GenerateContentConfig(
-            system_instruction="Your goal is to create one sample natural language query and its corresponding SQL statement\n"
-            "For input, you will be given the metadata for the tables in a yaml format\n",
-            response_json_schema=json.loads(rel_schema.read_text(encoding="utf-8")),
-            response_mime_type="application/json",
-        ),
     )
-    if response.candidates:
-        return json.loads(response.candidates[0].content.parts[0].text)
-    else:
-        raise Exception("no response from LLM")
 
 
 def _gen_schema_relationships(
-    project_id: str, location: str, data_source_references_path: Path
+    project_id: str,
+    location: str,
+    data_source_references_path: Path,
+    cache: GenerationCache = None,
+    prompt_format: str = "compact",
 ):
-    """Generates the schemaRelationships.yaml file, by calling an LLM with:
-    - input: the data_sourceReferences.yaml file
-    - output schema: a json schema file that matches the expected output
-    """
-    history = [
-        Content(
-            role="user",
-            parts=[
-                Part.from_bytes(
-                    data=read_bytes(data_source_references_path),
-                    mime_type="text/plain",
-                ),
-            ],
+    """Generates the schemaRelationships.yaml file, see generation.generate_schema_relationships"""
+    from . import generation, prompt_encoding
+
+    encoding = prompt_encoding.PromptEncoding(prompt_format)
+    return asyncio.run(
+        _with_client(
+            project_id,
+            location,
+            lambda client: generation.generate_schema_relationships(
+                client, data_source_references_path, cache, encoding=encoding
+            ),
         )
-    ]
-
-    rel_schema = files("cautils").joinpath("schemaRelationships_schema.json")
-
-    genai_client = genai.Client(vertexai=True, project=project_id, location=location)
-    response = genai_client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=history,
-        config=GenerateContentConfig(
-            system_instruction="Your goal is to infer foreign key relationships between tables in a database schema\n"
-            "For input, you will be given the metadata for the tables in a yaml format\n",
-            response_json_schema=json.loads(rel_schema.read_text(encoding="utf-8")),
-            response_mime_type="application/json",
-        ),
     )
-    if response.candidates:
-        return json.loads(response.candidates[0].content.parts[0].text)
+
+
+async def _with_client(
+    project_id: str, location: str, run: Callable, needs_client: bool = True
+):
+    """Runs run(client) with a genai client, or run(None) if not needs_client."""
+    if not needs_client:
+        return await run(None)
+    # google.genai is slow to import, and only needed by generation commands
+    from . import generation
+
+    client = generation.new_client(project_id, location)
+    try:
+        return await run(client)
+    finally:
+        await client.aio.aclose()
+
+
+def _parse_data_source(
+    data_source, default_backend: str, default_options: mt.SchemaOptions
+):
+    """A data source is either "project.dataset.table" (or "project.dataset.*"),
+    or a mapping with "source" and, optionally, "backend" and "schemaExport"
+    (overriding the top level schemaExport options) keys."""
+    if isinstance(data_source, dict):
+        named_table = data_source.get("source", "")
+        backend = data_source.get("backend", default_backend)
+        options = mt.SchemaOptions.from_config(
+            data_source.get("schemaExport"), default_options
+        )
     else:
-        raise Exception("no response from LLM")
+        named_table = data_source
+        backend = default_backend
+        options = default_options
+    parts = named_table.strip().split(".")
+    if len(parts) != 3:
+        raise ValueError(
+            f"Invalid data source '{named_table}', expected project.dataset.table or project.dataset.*"
+        )
+    if backend not in mt.METADATA_BACKENDS:
+        raise ValueError(
+            f"Invalid backend '{backend}' for {named_table}, expected one of {mt.METADATA_BACKENDS}"
+        )
+    return named_table, parts, backend, options
+
+
+def _export_jobs(
+    data_sources: list,
+    default_backend: str,
+    cache: MetadataCache = None,
+    schema_options: mt.SchemaOptions = mt.DEFAULT_SCHEMA_OPTIONS,
+    billing_project: str = None,
+    parallelism: int = mt.DEFAULT_PARALLELISM,
+):
+    """Yields one job per table of the data sources, in output order, as each
+    data source is listed.
+
+    A job is a dict with either "extract" (the tableReferences entry, already
+    known: cached, or read with the information_schema backend) or "ref" (the
+    table to get with the api backend) and "options" (to export it with), and
+    "cache_key" (project, dataset, table, lastModifiedTime) when its entry must
+    be cached. Metadata queries run in billing_project.
+
+    The lastModifiedTime of cached tables comes from one __TABLES__ query per
+    dataset or, when the query is denied, from getting each table.
+    """
+    from google.api_core.exceptions import Forbidden
+
+    for data_source in data_sources:
+        named_table, parts, backend, options = _parse_data_source(
+            data_source, default_backend, schema_options
+        )
+        export_options = options.cache_key()
+        project_id, dataset_id, table_id = parts
+        print(f"exporting {named_table}")
+        table_ids = None if table_id == "*" else [table_id]
+
+        if cache is None:
+            if backend == "information_schema":
+                for table_meta in mt.get_tables_metadata_bulk(
+                    project_id, dataset_id, table_ids, billing_project
+                ):
+                    yield {"extract": mt.export_table(table_meta, options)}
+            elif table_ids is None:
+                for ref in mt.list_tables(project_id, dataset_id):
+                    yield {"ref": ref, "options": options}
+            else:
+                yield {
+                    "ref": mt.table_reference(project_id, dataset_id, table_id),
+                    "options": options,
+                }
+            continue
+
+        # tables already got when __TABLES__ could not be queried
+        fetched = {}
+        try:
+            last_modified_times = mt.get_last_modified_times(
+                project_id, dataset_id, table_ids, billing_project
+            )
+        except Forbidden as e:
+            print(
+                f"Cannot query {project_id}.{dataset_id}.__TABLES__ ({e.message}),"
+                " getting each table instead"
+            )
+            fetched = mt.get_tables_repr(project_id, dataset_id, table_ids, parallelism)
+            last_modified_times = {
+                t: table_meta["lastModifiedTime"] for t, table_meta in fetched.items()
+            }
+        if table_ids and not last_modified_times:
+            raise ValueError(f"Table {named_table} was not found")
+        cached = {
+            cached_table_id: cache.get(
+                project_id,
+                dataset_id,
+                cached_table_id,
+                last_modified_time,
+                export_options,
+            )
+            for cached_table_id, last_modified_time in last_modified_times.items()
+        }
+        missing = [t for t, entry in cached.items() if entry is None]
+        fetched = {t: fetched[t] for t in missing if t in fetched}
+        bulk = {}
+        if missing and backend == "information_schema" and not fetched:
+            bulk = {
+                table_meta["tableReference"]["tableId"]: table_meta
+                for table_meta in mt.get_tables_metadata_bulk(
+                    project_id, dataset_id, missing, billing_project
+                )
+            }
+        for cached_table_id, entry in cached.items():
+            if entry is not None:
+                yield {"extract": entry}
+                continue
+            cache_key = (
+                project_id,
+                dataset_id,
+                cached_table_id,
+                last_modified_times[cached_table_id],
+            )
+            if cached_table_id in fetched:
+                table_meta = fetched.pop(cached_table_id)
+                yield {
+                    "extract": mt.export_table(table_meta, options),
+                    "etag": table_meta.get("etag"),
+                    "cache_key": cache_key,
+                    "export_options": export_options,
+                }
+            elif backend == "information_schema":
+                yield {
+                    "extract": mt.export_table(bulk.pop(cached_table_id), options),
+                    "cache_key": cache_key,
+                    "export_options": export_options,
+                }
+            else:
+                yield {
+                    "ref": mt.table_reference(project_id, dataset_id, cached_table_id),
+                    "options": options,
+                    "cache_key": cache_key,
+                    "export_options": export_options,
+                }
+
+
+def _run_export_job(job: dict) -> dict:
+    if "ref" in job:
+        table_meta = mt.get_table_repr(job["ref"])
+        return {
+            **job,
+            "extract": mt.export_table(table_meta, job["options"]),
+            "etag": table_meta.get("etag"),
+        }
+    return job
+
+
+def _export_data_sources(
+    data_sources: list,
+    default_backend: str,
+    parallelism: int,
+    cache: MetadataCache = None,
+    schema_options: mt.SchemaOptions = mt.DEFAULT_SCHEMA_OPTIONS,
+    billing_project: str = None,
+):
+    """Gets metadata for all data sources, and yields each table exported as a
+    tableReferences entry (see metadata_tool.export_table), in the order they
+    are listed.
+
+    Tables are listed, fetched and exported in a pipeline, with a bounded
+    number of tables in flight (see metadata_tool.map_bounded), so memory does
+    not grow with the number of tables. With a cache, tables whose
+    lastModifiedTime did not change since they were cached are not fetched
+    again. Metadata queries run in (and are billed to) billing_project."""
+    jobs = _export_jobs(
+        data_sources,
+        default_backend,
+        cache,
+        schema_options,
+        billing_project,
+        parallelism,
+    )
+    for job in mt.map_bounded(_run_export_job, jobs, parallelism):
+        if cache is not None and "cache_key" in job:
+            cache.put(
+                *job["cache_key"],
+                job["extract"],
+                job.get("etag"),
+                job["export_options"],
+            )
+        yield job["extract"]
+
+    if cache is not None:
+        cache.save()
+        print(cache.summary())
 
 
 @app.command
@@ -192,8 +371,24 @@ def autogen(
     project_id: str,
     location: str,
     gen_data_source_references: bool = True,
+    gen_descriptions: bool = True,
     gen_schema_relationships: bool = True,
     gen_example_queries: bool = True,
+    parallelism: int = mt.DEFAULT_PARALLELISM,
+    metadata_backend: Literal["api", "information_schema"] = "api",
+    cache: bool = True,
+    relationship_shard_size: int = 0,
+    llm_concurrency: int = 4,
+    relationship_mode: Literal["llm", "heuristic", "hybrid"] = "llm",
+    prompt_format: Literal["compact", "yaml"] = "compact",
+    prompt_max_tokens: int = 0,
+    prompt_description_chars: int = 0,
+    prompt_compare_yaml: bool = False,
+    gen_column_profiles: bool = False,
+    profile_method: Literal["tablesample", "storage"] = "tablesample",
+    profile_sample_rows: int = 10_000,
+    verify_relationships: bool = False,
+    min_containment: float = 0.5,
 ):
     """Auto generates data agent files based on specification.
 
@@ -201,59 +396,263 @@ def autogen(
         project_id: The Google Cloud project ID.
         location: The Google Cloud location.
         gen_data_source_references: Whether to generate data source references.
+        gen_descriptions: Whether to infer the missing column descriptions of the
+            generated data source references with an LLM.
         gen_schema_relationships: Whether to generate schema relationships.
         gen_example_queries: Whether to generate example queries.
+        parallelism: Maximum number of tables whose metadata is fetched at the same time.
+        metadata_backend: How table metadata is read, for data sources that do not
+            set their own backend in autogen.yaml. "api" gets each table, while
+            "information_schema" reads a whole dataset with one query.
+        cache: Whether to reuse results cached by previous runs: metadata of tables
+            that have not been modified since, inferred column descriptions, and
+            LLM generations whose input has not changed.
+        relationship_shard_size: If more than 0, schema relationships are inferred in
+            groups of up to this many related tables, one LLM call per group,
+            instead of sending all tables in one prompt. For very large schemas.
+        llm_concurrency: Maximum number of LLM calls made at the same time.
+        relationship_mode: How schema relationships are found. "llm" asks the LLM
+            to search all tables, "heuristic" matches column names and types
+            without an LLM, and "hybrid" asks the LLM to confirm the heuristic
+            candidates only.
+        prompt_format: How tables are sent to the LLM. "compact" has one line per
+            column, with its name, type, mode and description, and "yaml" sends
+            datasourceReferences.yaml as it is.
+        prompt_max_tokens: If more than 0, the token budget of each compact
+            prompt. Descriptions are truncated until prompts fit, and a prompt
+            that does not fit without descriptions fails.
+        prompt_description_chars: If more than 0, descriptions in compact prompts
+            are truncated to about this many characters.
+        prompt_compare_yaml: Whether to report the token count of each compact
+            prompt sent to the LLM, and the one the yaml would have. Two
+            count_tokens calls per prompt, only made when the result is not cached.
+        gen_column_profiles: Whether to profile a sample of rows of each table
+            (null ratio, approximate distinct count, min/max, most frequent
+            values) to columnProfiles.yaml, which the LLM generations get with
+            the tables. Needs pyarrow, see profiling.
+        profile_method: How samples are read. "tablesample" queries a random
+            sample of blocks, "storage" uses the BigQuery Storage Read API.
+        profile_sample_rows: Maximum rows read per table for its profile.
+        verify_relationships: Whether to check the generated schema relationships
+            against the data of their tables, see verify-relationships.
+        min_containment: Verified relationships whose support is lower are dropped.
     """
+    from google.api_core.exceptions import GoogleAPICallError
+    from google.genai import errors as genai_errors
+
+    from . import description_inference, generation, profiling, prompt_encoding
+
     try:
         data_source_references_path = Path("datasourceReferences.yaml")
-        ask = True
+        example_queries_path = Path("exampleQueries.yaml")
+        schema_relationships_path = Path("schemaRelationships.yaml")
+        column_profiles_path = Path(profiling.PROFILES_FILE)
+        outputs = []
         if gen_data_source_references:
-            with open("autogen.yaml", "r") as file:
-                autogen = yaml.safe_load(file)
+            outputs.append(data_source_references_path)
+        if gen_column_profiles:
+            outputs.append(column_profiles_path)
+        if gen_example_queries:
+            outputs.append(example_queries_path)
+        if gen_schema_relationships:
+            outputs.append(schema_relationships_path)
+
+        # every overwrite question is answered before any work starts
+        ask = True
+        writable = set()
+        for path in outputs:
+            write, ask = _confirm_overwrite(path, ask)
+            if write:
+                writable.add(path)
+
+        data_sources = None
+        if data_source_references_path in writable:
+            autogen = yaml_io.load_file(Path("autogen.yaml"))
 
             if not autogen or not "bqDataSources" in autogen:
                 raise ValueError("autogen.yaml must specify bqDataSources")
-            table_extracts = []
-            for named_table in autogen["bqDataSources"]:
-                parts = named_table.strip().split(".")
-                print(f"exporting {named_table}")
-                if parts[2] == "*":
-                    for table_meta in mt.get_tables_metadata(parts[0], parts[1]):
-                        table_extracts.append(mt.export_table(table_meta))
-                else:
-                    table_meta = mt.get_table_metadata(parts[0], parts[1], parts[2])
-                    table_extracts.append(mt.export_table(table_meta))
-
-            ask = _yaml_dump_after_confirm(
-                lambda: {"bq": {"tableReferences": table_extracts}},
-                data_source_references_path,
-                ask,
-            )
-
-        if not data_source_references_path.exists():
+            data_sources = autogen["bqDataSources"]
+            schema_options = mt.SchemaOptions.from_config(autogen.get("schemaExport"))
+        elif not data_source_references_path.exists():
             raise FileNotFoundError(
                 f"Cannot generate content if {data_source_references_path} does not exist"
             )
 
-        if gen_example_queries:
-            ask = _yaml_dump_after_confirm(
-                lambda: _gen_example_queries(
-                    project_id, location, data_source_references_path
-                ),
-                Path("exampleQueries.yaml"),
-                ask,
+        async def pipeline(client):
+            if data_sources is not None:
+                await asyncio.to_thread(
+                    yaml_io.write_table_references,
+                    data_source_references_path,
+                    _export_data_sources(
+                        data_sources,
+                        metadata_backend,
+                        parallelism,
+                        MetadataCache() if cache else None,
+                        schema_options,
+                        project_id,
+                    ),
+                )
+                print(f"Wrote {data_source_references_path}")
+                if gen_descriptions:
+                    await description_inference.fill_descriptions(
+                        client,
+                        data_source_references_path,
+                        llm_concurrency,
+                        description_inference.DescriptionCache() if cache else None,
+                    )
+
+            if column_profiles_path in writable:
+                await asyncio.to_thread(
+                    profiling.profile_tables,
+                    project_id,
+                    data_source_references_path,
+                    profile_method,
+                    profile_sample_rows,
+                    parallelism,
+                )
+                print(f"Wrote {column_profiles_path}")
+
+            generation_cache = GenerationCache() if cache else None
+            encoding = prompt_encoding.PromptEncoding(
+                prompt_format,
+                prompt_max_tokens,
+                prompt_description_chars,
+                prompt_compare_yaml,
             )
 
-        if gen_schema_relationships:
-            ask = _yaml_dump_after_confirm(
-                lambda: _gen_schema_relationships(
-                    project_id, location, data_source_references_path
-                ),
-                Path("schemaRelationships.yaml"),
-                ask,
+            async def generate_example_queries():
+                _yaml_dump(
+                    await generation.generate_example_queries(
+                        client, data_source_references_path, generation_cache, encoding
+                    ),
+                    example_queries_path,
+                )
+
+            async def generate_schema_relationships():
+                relationships = await generation.generate_relationships_for_mode(
+                    client,
+                    data_source_references_path,
+                    relationship_mode,
+                    relationship_shard_size,
+                    llm_concurrency,
+                    generation_cache,
+                    encoding,
+                )
+                if verify_relationships:
+                    relationships = await asyncio.to_thread(
+                        _verify_relationships,
+                        project_id,
+                        relationships,
+                        min_containment,
+                        100.0,
+                        parallelism,
+                        cache,
+                    )
+                _yaml_dump(relationships, schema_relationships_path)
+
+            # the generations only depend on datasourceReferences.yaml, and
+            # each one writes its file even if the other one fails
+            generations = {}
+            if example_queries_path in writable:
+                generations[example_queries_path] = generate_example_queries()
+            if schema_relationships_path in writable:
+                generations[schema_relationships_path] = generate_schema_relationships()
+            results = await asyncio.gather(
+                *generations.values(), return_exceptions=True
+            )
+            failed = 0
+            for path, result in zip(generations, results):
+                if isinstance(result, Exception):
+                    rprint(
+                        f"[bright_red]Could not generate {path}: {escape(str(result))}[/bright_red]"
+                    )
+                    failed += 1
+            return failed
+
+        needs_client = (
+            (data_sources is not None and gen_descriptions)
+            or example_queries_path in writable
+            or (
+                schema_relationships_path in writable
+                and relationship_mode != "heuristic"
             )
-        rprint("[green]Files auto generated[/green]")
-    except (FileExistsError, OSError, ValueError) as e:
+        )
+        if not asyncio.run(_with_client(project_id, location, pipeline, needs_client)):
+            rprint("[green]Files auto generated[/green]")
+    except (
+        FileExistsError,
+        OSError,
+        ValueError,
+        GoogleAPICallError,
+        genai_errors.APIError,
+    ) as e:
+        rprint(f"[bright_red]{e}[/bright_red]")
+
+
+def _verify_relationships(
+    project_id: str,
+    relationships: list[dict],
+    min_containment: float,
+    sample_percent: float,
+    parallelism: int,
+    cache: bool,
+) -> list[dict]:
+    """Checks relationships against their data, see relationship_verification.verify"""
+    from . import relationship_verification as rv
+
+    kept, scores = rv.verify(
+        project_id,
+        relationships,
+        min_containment,
+        sample_percent,
+        parallelism,
+        rv.SketchCache() if cache else None,
+    )
+    rv.print_scores(relationships, scores, min_containment)
+    print(f"Kept {len(kept)} of {len(relationships)} schema relationships")
+    return kept
+
+
+@app.command
+def verify_relationships(
+    project_id: str,
+    min_containment: float = 0.5,
+    sample_percent: float = 100.0,
+    parallelism: int = mt.DEFAULT_PARALLELISM,
+    cache: bool = True,
+    dry_run: bool = False,
+):
+    """Checks the schemaRelationships.yaml file against the data of its tables.
+
+    The join columns of each table are summarized in BigQuery by sketches (an
+    approximate distinct count and a MinHash of their values), and each
+    relationship gets the estimated fraction of the values of one side found in
+    the other. Relationships without enough support are dropped, and the others
+    are sorted by support. Sketches are cached until their table is modified.
+
+    Args:
+        project_id: The Google Cloud project ID, that runs the sketch queries.
+        min_containment: Relationships whose support is lower are dropped.
+        sample_percent: If less than 100, only this percent of each table is
+            read. Cheaper for very large tables, but sampling lowers the support.
+        parallelism: Maximum number of tables sketched at the same time.
+        cache: Whether to reuse the sketches of previous runs.
+        dry_run: If true, prints the scores without rewriting the file.
+    """
+    schema_relationships_path = Path("schemaRelationships.yaml")
+    try:
+        relationships = yaml_io.load_file(schema_relationships_path) or []
+        kept = _verify_relationships(
+            project_id,
+            relationships,
+            min_containment,
+            sample_percent,
+            parallelism,
+            cache,
+        )
+        if not dry_run:
+            _yaml_dump(kept, schema_relationships_path)
+    except (OSError, ValueError) as e:
         rprint(f"[bright_red]{e}[/bright_red]")
 
 
@@ -268,39 +667,22 @@ def upload(
     Args:
         project_id: The Google Cloud project ID.
         location: The Google Cloud location.
-        patch: Whether to patch an existing agent.
+        patch: Whether to patch an existing agent. Only the fields that differ
+            from the remote agent are sent, and nothing is sent (so no
+            deployment starts) when there are no differences.
     """
     ca_agent_id = Path().resolve().name
     helper = GeminiDataAnalyticsRequestHelper(project_id, location)
-    publishedContext = {}
-    for element in DATA_AGENT_ELEMENTS:
-        path = Path(f"{element}.yaml")
-        if path.exists():
-            with open(path, "r") as file:
-                publishedContext[element] = yaml.safe_load(file)
-            print(f"Added {element}")
-
-    payload = {
-        "dataAnalyticsAgent": {"publishedContext": publishedContext},
-    }
-    # add metadata
-    path = Path("agentMetadata.yaml")
-    if path.exists():
-        with open(path, "r") as file:
-            metadata = yaml.safe_load(file)
-        copy_if_exists(metadata, payload, ["displayName", "description"])
-        print("Added metadata")
+    payload, added = read_agent_payload(Path())
+    for element in added:
+        print(f"Added {element}")
     # print(json.dumps(payload, indent=2))
     try:
         print(f"Uploading agent {ca_agent_id}")
-        if patch:
-            params = {
-                "updateMask": "dataAnalyticsAgent.publishedContext,displayName,description"
-            }
-            response = helper.patch(f"dataAgents/{ca_agent_id}", payload, params)
-        else:
-            params = {"dataAgentId": ca_agent_id}
-            response = helper.post("dataAgents", payload, params)
+        response = upload_payload(helper, ca_agent_id, payload, patch)
+        if response is None:
+            rprint("[green]No changes, the agent is up to date[/green]")
+            return
 
         name_parts = response["name"].split("/")
         project_number = name_parts[1]
@@ -316,6 +698,36 @@ def upload(
         rprint(f"[bright_red]{e.response.text}[/bright_red]")
 
 
+def agent_row(item: dict) -> dict:
+    da = item.get("dataAnalyticsAgent", {})
+    pc = da.get("publishedContext", {})
+    dsr = pc.get("datasourceReferences", {})
+    bq = dsr.get("bq", {})
+    bq_tables = ",".join(
+        [
+            f"{t['datasetId']}.{t.get('tableId', '*')}"
+            for t in bq.get("tableReferences", [])
+        ]
+    )
+
+    if bq:
+        data_source = f"bq: {bq_tables} "
+    elif dsr.get("studio"):
+        data_source = "looker studio"
+    elif dsr.get("looker"):
+        data_source = "looker"
+    else:
+        data_source = "?"
+
+    return {
+        "name": item["name"].split("/")[-1],
+        "displayName": item.get("displayName", "N.A"),
+        "description": item.get("description", "N.A"),
+        "systemInstruction": pc.get("systemInstruction", "N.A"),
+        "dataSource": data_source,
+    }
+
+
 def print_agent_list(data, format_raw: bool):
     if format_raw:
         print(json.dumps(data, indent=2))
@@ -329,52 +741,62 @@ def print_agent_list(data, format_raw: bool):
     table.add_column("Data Source", overflow="fold")
 
     for item in data.get("dataAgents", []):
-        name = item["name"].split("/")[-1]
-        display_name = item.get("displayName", "N.A")
-        description = item.get("description", "N.A")
-        da = item.get("dataAnalyticsAgent", {})
-        pc = da.get("publishedContext", {})
-        system_instruction = pc.get("systemInstruction", "N.A")[:80]
-        dsr = pc.get("datasourceReferences", {})
-        bq = dsr.get("bq", {})
-        bq_tables = ",".join(
-            [
-                f"{t['datasetId']}.{t.get('tableId', '*')}"
-                for t in bq.get("tableReferences", [])
-            ]
+        row = agent_row(item)
+        table.add_row(
+            row["name"],
+            row["displayName"],
+            row["description"],
+            row["systemInstruction"][:80],
+            row["dataSource"],
         )
 
-        if bq:
-            data_source = f"bq: {bq_tables} "
-        elif dsr.get("studio"):
-            data_source = "looker studio"
-        elif dsr.get("looker"):
-            data_source = "looker"
-        else:
-            data_source = "?"
-
-        table.add_row(name, display_name, description, system_instruction, data_source)
-
     console = Console(highlight=False)
     console.print(table)
 
 
 @app.command
-def list(project_id: str, location: str, format_raw: bool = False):
+def list(
+    project_id: str,
+    location: str,
+    format_raw: bool = False,
+    fetch_all: Annotated[bool, Parameter(name="--all")] = False,
+    output_format: Literal["jsonl", "csv"] = "jsonl",
+):
     """Lists data agents in the specified project and location.
 
     Args:
         project_id: The Google Cloud project ID.
         location: The Google Cloud location.
         format_raw: Whether to print the raw JSON output.
+        fetch_all: List every agent without asking, streaming them to stdout
+            in output_format.
+        output_format: Format used with --all: jsonl (raw JSON, one agent per
+            line) or csv.
     """
     helper = GeminiDataAnalyticsRequestHelper(project_id, location)
+    if fetch_all:
+        stream_all(
+            lambda params: helper.get("dataAgents", params),
+            "dataAgents",
+            agent_row,
+            output_format,
+        )
+        return
     paginate(
         lambda params: helper.get("dataAgents", params),
         lambda data: print_agent_list(data, format_raw),
     )
 
 
+def conversation_row(item: dict) -> dict:
+    return {
+        "name": item["name"].split("/")[-1],
+        "agents": ",".join([a.split("/")[-1] for a in item.get("agents", [])]),
+        "createTime": item.get("createTime", ""),
+        "lastUsedTime": item.get("lastUsedTime", ""),
+    }
+
+
 def print_conversation_list(data):
     # print(json.dumps(data, indent=2))
     # return
@@ -384,25 +806,41 @@ def print_conversation_list(data):
     table.add_column("Dates")
 
     for item in data.get("conversations", []):
-        name = item["name"].split("/")[-1]
-        agents = ",".join([a.split("/")[-1] for a in item.get("agents", [])])
-        dates = f"created:{item['createTime']}\nlast updated:{item['lastUsedTime']}"
+        row = conversation_row(item)
+        dates = f"created:{row['createTime']}\nlast updated:{row['lastUsedTime']}"
 
-        table.add_row(name, agents, dates)
+        table.add_row(row["name"], row["agents"], dates)
 
     console = Console(highlight=False)
     console.print(table)
 
 
 @app.command
-def list_conversation(project_id: str, location: str):
+def list_conversation(
+    project_id: str,
+    location: str,
+    fetch_all: Annotated[bool, Parameter(name="--all")] = False,
+    output_format: Literal["jsonl", "csv"] = "jsonl",
+):
     """Lists conversations in the specified project and location.
 
     Args:
         project_id: The Google Cloud project ID.
         location: The Google Cloud location.
+        fetch_all: List every conversation without asking, streaming them to
+            stdout in output_format.
+        output_format: Format used with --all: jsonl (raw JSON, one
+            conversation per line) or csv.
     """
     helper = GeminiDataAnalyticsRequestHelper(project_id, location)
+    if fetch_all:
+        stream_all(
+            lambda params: helper.get("conversations", params),
+            "conversations",
+            conversation_row,
+            output_format,
+        )
+        return
     paginate(
         lambda params: helper.get("conversations", params),
         lambda data: print_conversation_list(data),
@@ -444,23 +882,12 @@ def download(project_id: str, location: str, dry_run: bool = False):
         response = helper.get(f"dataAgents/{ca_agent_id}")
         # print(json.dumps(response, indent=2))
         ask = True
-        for element in DATA_AGENT_ELEMENTS:
-            content = response["dataAnalyticsAgent"]["publishedContext"].get(element)
-            if not content:
-                continue
+        for name, content in agent_files(response).items():
             if dry_run:
-                print(f"{element}: {content}")
+                if name != METADATA_FILE:
+                    print(f"{Path(name).stem}: {content}")
                 continue
-            ask = _yaml_dump_after_confirm(
-                lambda: content, Path(f"{element}.yaml"), ask
-            )
-
-        metadata = {}
-        copy_if_exists(response, metadata, ["displayName", "description"])
-        if metadata and not dry_run:
-            ask = _yaml_dump_after_confirm(
-                lambda: metadata, Path("agentMetadata.yaml"), ask
-            )
+            ask = _yaml_dump_after_confirm(lambda: content, Path(name), ask)
         rprint("[green]Data Agent downloaded to the current folder[/green]")
     except HTTPError as e:
         rprint(f"[bright_red]{e.response.text}[/bright_red]")
@@ -468,8 +895,29 @@ def download(project_id: str, location: str, dry_run: bool = False):
         rprint(f"[bright_red]{e}[/bright_red]")
 
 
+def print_step_timings(steps):
+    table = Table(box=box.SQUARE)
+    table.add_column("Step", style="bright_green")
+    table.add_column("Arrived at", justify="right")
+    table.add_column("Took", justify="right")
+
+    previous = 0.0
+    for name, elapsed in steps:
+        table.add_row(name, f"{elapsed:.2f}s", f"{elapsed - previous:.2f}s")
+        previous = elapsed
+
+    console = Console(highlight=False)
+    console.print(table)
+
+
 @app.command
-def chat(project_id: str, location: str, ca_agent_id: str, prompt: str):
+def chat(
+    project_id: str,
+    location: str,
+    ca_agent_id: str,
+    prompt: str,
+    stream: bool = False,
+):
     """Initiates a chat with a specified data agent.
 
     Args:
@@ -477,6 +925,8 @@ def chat(project_id: str, location: str, ca_agent_id: str, prompt: str):
         location: The Google Cloud location.
         ca_agent_id: The ID of the data agent to chat with.
         prompt: The user's prompt.
+        stream: Show each step of the response as soon as it arrives, followed by
+            step timings, instead of the whole response as JSON at the end.
     """
     helper = GeminiDataAnalyticsRequestHelper(project_id, location)
     payload = {
@@ -486,7 +936,31 @@ def chat(project_id: str, location: str, ca_agent_id: str, prompt: str):
         },
     }
     try:
-        response = helper.post(":chat", payload)
-        rprint(json.dumps(response, indent=2))
+        if not stream:
+            response = helper.post(":chat", payload)
+            rprint(json.dumps(response, indent=2))
+            return
+
+        console = Console(highlight=False)
+        steps = []
+        start = time.perf_counter()
+        for message in helper.post_stream(":chat", payload):
+            elapsed = time.perf_counter() - start
+            step = chat_messages.step_name(message)
+            steps.append((step, elapsed))
+            console.rule(f"{step} [dim]+{elapsed:.2f}s[/dim]", align="left")
+            chat_messages.render_message(console, message)
+        if steps:
+            rprint(f"Time to first message: {steps[0][1]:.2f}s")
+            print_step_timings(steps)
     except HTTPError as e:
         rprint(f"[bright_red]{e.response.text}[/bright_red]")
+    except RequestException as e:
+        rprint(f"[bright_red]{escape(str(e))}[/bright_red]")
+    except json.JSONDecodeError as e:
+        rprint(f"[bright_red]Malformed streamed message: {escape(str(e))}[/bright_red]")
+
+
+app.command(chat_eval.chat_batch)
+app.command(agent_tree.upload_tree)
+app.command(agent_tree.download_tree)
@@ -0,0 +1,254 @@
+"""LLM inference of the column descriptions missing in tableReferences.
+
+Every column without a description, across all tables, is collected and
+packed into batches that fit a token budget, and the batches are sent to the
+LLM concurrently. Inferred descriptions are cached on disk by table, column
+path, type and sibling columns, so a column is only sent again when its
+table changes around it.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from google import genai
+
+from . import generation, yaml_io
+from .local_cache import cache_dir
+
+DESCRIPTIONS_INSTRUCTION = (
+    "Your goal is to write a description for each column of a BigQuery table that has none\n"
+    "For input, you will be given the columns in a yaml format, with their table, type and "
+    "the names of the other columns at the same level, to use as context\n"
+    "Return one short description per column id, useful to someone writing SQL\n"
+)
+# estimated tokens of the columns sent in one LLM call
+DEFAULT_BATCH_TOKENS = 8000
+# sibling column names sent as context with each column
+MAX_SIBLINGS = 40
+CACHE_VERSION = 1
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of text, about 4 characters per token."""
+    return len(text) // 4 + 1
+
+
+def sibling_fingerprint(fields: list[dict]) -> str:
+    """Identifies the names and types of the columns at one level of a schema."""
+    siblings = sorted([f.get("name", ""), f.get("type", "")] for f in fields)
+    return hashlib.sha256(json.dumps(siblings).encode()).hexdigest()[:16]
+
+
+def missing_descriptions(table_references: list[dict]) -> list[dict]:
+    """Every column of table_references without a description.
+
+    Returns:
+        one dict per column with "table" (project.dataset.table), "path"
+        (dotted column path), "type", "siblings" (names of the columns at the
+        same level), "key" (identifies the column for the cache) and "field"
+        (the column's dict in table_references, to fill in).
+    """
+    columns = []
+    for table_reference in table_references:
+        table = ".".join(
+            table_reference[k] for k in ("projectId", "datasetId", "tableId")
+        )
+        stack = [("", table_reference.get("schema", {}).get("fields", []))]
+        while stack:
+            prefix, fields = stack.pop()
+            fingerprint = sibling_fingerprint(fields)
+            names = [f.get("name", "") for f in fields]
+            for field in fields:
+                path = prefix + field.get("name", "")
+                if not field.get("description"):
+                    key = json.dumps([table, path, field.get("type"), fingerprint])
+                    columns.append(
+                        {
+                            "table": table,
+                            "path": path,
+                            "type": field.get("type"),
+                            "siblings": [n for n in names if n != field.get("name")],
+                            "key": hashlib.sha256(key.encode()).hexdigest(),
+                            "field": field,
+                        }
+                    )
+                subfields = field.get("subfields") or field.get("fields")
+                if subfields:
+                    stack.append((f"{path}.", subfields))
+    return columns
+
+
+def make_batches(
+    columns: list[dict], ids: list[int], max_tokens: int = DEFAULT_BATCH_TOKENS
+) -> list[list[dict]]:
+    """Packs the columns[id] of ids into batches of LLM input entries, each of
+    up to max_tokens estimated tokens (or one entry, if larger)."""
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for i in ids:
+        column = columns[i]
+        entry = {
+            "id": i,
+            "table": column["table"],
+            "column": column["path"],
+            "type": column["type"],
+            "siblingColumns": column["siblings"][:MAX_SIBLINGS],
+        }
+        tokens = estimate_tokens(yaml_io.dumps([entry]))
+        if batch and batch_tokens + tokens > max_tokens:
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(entry)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class DescriptionCache:
+    """Inferred column descriptions, by column key (see missing_descriptions).
+
+    There is one file per dataset, shared by every agent that uses the dataset.
+    """
+
+    def __init__(self, directory: Path = None):
+        self.directory = directory or cache_dir("descriptions")
+        self._datasets = {}
+        self._dirty = set()
+        self.hits = 0
+        self.new = 0
+
+    def _descriptions(self, table: str) -> dict:
+        dataset = table.rsplit(".", 1)[0]
+        if dataset not in self._datasets:
+            descriptions = {}
+            try:
+                data = json.loads((self.directory / f"{dataset}.json").read_text())
+                if data.get("version") == CACHE_VERSION:
+                    descriptions = data["descriptions"]
+            except (OSError, ValueError, KeyError):
+                pass
+            self._datasets[dataset] = descriptions
+        return self._datasets[dataset]
+
+    def get(self, column: dict) -> str | None:
+        description = self._descriptions(column["table"]).get(column["key"])
+        if description is None:
+            self.new += 1
+        else:
+            self.hits += 1
+        return description
+
+    def put(self, column: dict, description: str):
+        self._descriptions(column["table"])[column["key"]] = description
+        self._dirty.add(column["table"].rsplit(".", 1)[0])
+
+    def save(self):
+        for dataset in sorted(self._dirty):
+            path = self.directory / f"{dataset}.json"
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(
+                json.dumps(
+                    {"version": CACHE_VERSION, "descriptions": self._datasets[dataset]}
+                )
+            )
+            os.replace(tmp_path, path)
+        self._dirty.clear()
+
+    def summary(self) -> str:
+        return f"description cache: {self.hits} hits, {self.new} new columns"
+
+
+async def infer_descriptions(
+    client: genai.Client,
+    table_references: list[dict],
+    concurrency: int,
+    max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    cache: DescriptionCache = None,
+) -> int:
+    """Fills in, in place, the missing column descriptions of table_references.
+
+    Cached descriptions are used as they are, and the other columns are sent to
+    the LLM in batches of up to max_batch_tokens, with up to concurrency calls
+    at the same time. A failed batch leaves its columns without description.
+
+    Returns:
+        the number of descriptions filled in.
+    """
+    columns = missing_descriptions(table_references)
+    filled = 0
+    pending = []
+    for i, column in enumerate(columns):
+        description = cache.get(column) if cache is not None else None
+        if description:
+            column["field"]["description"] = description
+            filled += 1
+        else:
+            pending.append(i)
+    batches = make_batches(columns, pending, max_batch_tokens)
+    print(
+        f"Inferring {len(pending)} missing column descriptions in {len(batches)} batches"
+        f" ({filled} cached)"
+    )
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def infer(batch):
+        contents = yaml_io.dumps({"columns": batch}).encode()
+        async with semaphore:
+            return await generation.generate_json_with_usage(
+                client,
+                contents,
+                "columnDescriptions_schema.json",
+                DESCRIPTIONS_INSTRUCTION,
+            )
+
+    outputs = await asyncio.gather(
+        *(infer(batch) for batch in batches), return_exceptions=True
+    )
+    failed = 0
+    prompt_tokens = output_tokens = 0
+    for batch, output in zip(batches, outputs):
+        if isinstance(output, Exception):
+            print(f"A batch of {len(batch)} columns failed: {output}")
+            failed += 1
+            continue
+        result, usage = output
+        prompt_tokens += usage["prompt_tokens"]
+        output_tokens += usage["output_tokens"]
+        ids = {entry["id"] for entry in batch}
+        for item in result:
+            if item.get("id") in ids and item.get("description"):
+                column = columns[item["id"]]
+                column["field"]["description"] = item["description"]
+                if cache is not None:
+                    cache.put(column, item["description"])
+                filled += 1
+                # a repeated id is only counted once
+                ids.discard(item["id"])
+    print(
+        f"Filled in {filled} of {len(columns)} missing descriptions, "
+        f"{failed} failed batches, {prompt_tokens} prompt and {output_tokens} output tokens"
+    )
+    if cache is not None:
+        cache.save()
+        print(cache.summary())
+    return filled
+
+
+async def fill_descriptions(
+    client: genai.Client,
+    data_source_references_path: Path,
+    concurrency: int,
+    cache: DescriptionCache = None,
+):
+    """Infers the missing column descriptions of a datasourceReferences.yaml
+    file (see infer_descriptions), and rewrites it when any were filled in."""
+    table_references = generation.read_table_references(data_source_references_path)
+    if await infer_descriptions(client, table_references, concurrency, cache=cache):
+        yaml_io.write_table_references(data_source_references_path, table_references)
+        print(f"Wrote {data_source_references_path}")
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from .local_cache import cache_dir
+
+# Results are small JSON documents, this keeps thousands of them
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def cache_key(
+    contents: bytes, response_schema: str, model: str, system_instruction: str
+) -> str:
+    """Identifies one generation: same inputs, schema, model and instruction
+    are expected to produce an equivalent result."""
+    digest = hashlib.sha256()
+    for part in (
+        contents,
+        response_schema.encode(),
+        model.encode(),
+        system_instruction.encode(),
+    ):
+        # length prefix, so that moving bytes from one part to the next changes the key
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class GenerationCache:
+    """LLM results stored on disk, one file per key.
+
+    When the files grow over max_bytes, the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory: Path = None, max_bytes: int = None):
+        self.directory = directory or cache_dir("genai")
+        if max_bytes is None:
+            max_bytes = int(
+                os.environ.get("CA_UTILS_GENAI_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+            )
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        path = self.directory / f"{key}.json"
+        try:
+            result = json.loads(path.read_text())["result"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        # the modification time tracks the last use, for eviction
+        os.utime(path)
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result, model: str = None):
+        path = self.directory / f"{key}.json"
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"model": model, "result": result}))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
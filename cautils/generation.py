@@ -0,0 +1,457 @@
+"""LLM generation of data agent files (exampleQueries, schemaRelationships).
+
+All functions are async and share one genai.Client, so independent
+generations can run at the same time on one event loop.
+"""
+
+import asyncio
+import json
+import time
+from importlib.resources import files
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from google import genai
+from google.genai.types import (
+    Content,
+    GenerateContentConfig,
+    Part,
+)
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+from . import genai_cache, profiling, prompt_encoding, yaml_io
+from .genai_cache import GenerationCache
+from .join_candidates import ColumnIndex
+from .prompt_encoding import PromptEncoding
+from .relationship_shards import merge_relationships, shard_tables
+
+MODEL = "gemini-2.0-flash"
+
+YAML_INPUT = "For input, you will be given the metadata for the tables in a yaml format"
+EXAMPLE_QUERIES_INSTRUCTION = (
+    "Your goal is to create one sample natural language query and its corresponding SQL statement\n"
+    f"{YAML_INPUT}\n"
+)
+SCHEMA_RELATIONSHIPS_INSTRUCTION = (
+    "Your goal is to infer foreign key relationships between tables in a database schema\n"
+    f"{YAML_INPUT}\n"
+)
+CONFIRM_SCHEMA_RELATIONSHIPS_INSTRUCTION = (
+    "Your goal is to confirm foreign key relationships between tables in a database schema\n"
+    f"{YAML_INPUT}, and under "
+    "candidateRelationships, relationships found by matching column names and types\n"
+    "Return only the candidates that are real relationships, with your own confidenceScore\n"
+)
+PROFILES_INPUT = (
+    "After the tables, under 'column profiles', you will be given statistics of the "
+    "values of the columns in a sample of rows of each table: null ratio, approximate "
+    "distinct count, min, max and most frequent values\n"
+)
+
+
+def new_client(project_id: str, location: str) -> genai.Client:
+    return genai.Client(vertexai=True, project=project_id, location=location)
+
+
+def read_bytes(file_path: Path):
+    with open(file_path, "rb") as f:
+        data = f.read()
+
+    return data
+
+
+def read_table_references(data_source_references_path: Path) -> list[dict]:
+    return yaml_io.load_file(data_source_references_path)["bq"]["tableReferences"]
+
+
+def with_profiles(
+    contents: bytes,
+    instruction: str,
+    profiles: dict[str, dict],
+    table_references: list[dict] = None,
+) -> tuple[bytes, str]:
+    """Appends the column profiles of the tables (all by default) to an LLM
+    input, if there are any (see profiling.read_profiles)."""
+    tables = None
+    if table_references is not None:
+        tables = [profiling.table_name(t) for t in table_references]
+    text = profiling.encode_profiles(profiles, tables)
+    if not text:
+        return contents, instruction
+    contents = contents.rstrip(b"\n") + b"\n\ncolumn profiles:\n" + text.encode()
+    return contents, instruction + PROFILES_INPUT
+
+
+def is_compact(encoding: PromptEncoding = None) -> bool:
+    return encoding is not None and encoding.compact
+
+
+def yaml_comparison(
+    client: genai.Client,
+    table_references: list[dict],
+    contents: bytes,
+    encoding: PromptEncoding = None,
+    extra: str = "",
+    label: str = "prompt",
+) -> Callable[[], Awaitable] | None:
+    """The on_cache_miss of generate_json_with_usage that reports the token
+    counts of a compact prompt and of its yaml, if encoding asks for it."""
+    if not is_compact(encoding) or not encoding.compare_yaml or contents is None:
+        return None
+    return lambda: prompt_encoding.compare_with_yaml(
+        client, MODEL, table_references, contents, extra, label
+    )
+
+
+def instruction_for(instruction: str, encoding: PromptEncoding = None) -> str:
+    """instruction, describing the compact input format instead of yaml when
+    encoding is compact."""
+    if not is_compact(encoding):
+        return instruction
+    return instruction.replace(YAML_INPUT, prompt_encoding.INPUT_INSTRUCTION)
+
+
+async def generate_json_with_usage(
+    client: genai.Client,
+    contents: bytes,
+    schema_file: str,
+    system_instruction: str,
+    cache: GenerationCache = None,
+    on_cache_miss: Callable[[], Awaitable] = None,
+) -> tuple[object, dict]:
+    """Calls the LLM with contents as input, and returns its output parsed as json.
+
+    The output follows the json schema in schema_file. With a cache, a previous
+    result for the same contents, schema, model and system instruction is
+    returned instead of calling the LLM. on_cache_miss, if given, is awaited
+    before calling the LLM, e.g. to report token counts.
+
+    Returns:
+        the parsed output, and a dict with the call's latency (seconds), token
+        counts and whether it came from the cache.
+    """
+    start = time.perf_counter()
+    response_schema = files("cautils").joinpath(schema_file).read_text(encoding="utf-8")
+    key = genai_cache.cache_key(contents, response_schema, MODEL, system_instruction)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            usage = {
+                "latency": time.perf_counter() - start,
+                "prompt_tokens": 0,
+                "output_tokens": 0,
+                "cached": True,
+            }
+            return cached, usage
+    if on_cache_miss is not None:
+        await on_cache_miss()
+
+    history = [
+        Content(
+            role="user",
+            parts=[
+                Part.from_bytes(
+                    data=contents,
+                    mime_type="text/plain",
+                ),
+            ],
+        )
+    ]
+
+    response = await client.aio.models.generate_content(
+        model=MODEL,
+        contents=history,
+        config=GenerateContentConfig(
+            system_instruction=system_instruction,
+            response_json_schema=json.loads(response_schema),
+            response_mime_type="application/json",
+        ),
+    )
+    if not response.candidates:
+        raise Exception("no response from LLM")
+    result = json.loads(response.candidates[0].content.parts[0].text)
+    if cache is not None:
+        cache.put(key, result, MODEL)
+    usage_metadata = response.usage_metadata
+    usage = {
+        "latency": time.perf_counter() - start,
+        "prompt_tokens": (usage_metadata and usage_metadata.prompt_token_count) or 0,
+        "output_tokens": (usage_metadata and usage_metadata.candidates_token_count)
+        or 0,
+        "cached": False,
+    }
+    return result, usage
+
+
+async def generate_json(
+    client: genai.Client,
+    contents: bytes,
+    schema_file: str,
+    system_instruction: str,
+    cache: GenerationCache = None,
+    on_cache_miss: Callable[[], Awaitable] = None,
+):
+    result, usage = await generate_json_with_usage(
+        client, contents, schema_file, system_instruction, cache, on_cache_miss
+    )
+    if usage["cached"]:
+        print(f"Reused cached {schema_file.split('_')[0]} result")
+    return result
+
+
+async def generate_example_queries(
+    client: genai.Client,
+    data_source_references_path: Path,
+    cache: GenerationCache = None,
+    encoding: PromptEncoding = None,
+):
+    """Generates the exampleQueries.yaml file, by calling an LLM with:
+    - input: the data_sourceReferences.yaml file, or its tables in the compact
+      format (see prompt_encoding) when encoding is compact
+    - output schema: a json schema file that matches the expected output
+    """
+    on_cache_miss = None
+    if is_compact(encoding):
+        table_references = read_table_references(data_source_references_path)
+        label = "exampleQueries prompt"
+        contents = await prompt_encoding.encode_for_prompt(
+            client, MODEL, table_references, encoding, label=label
+        )
+        on_cache_miss = yaml_comparison(
+            client, table_references, contents, encoding, label=label
+        )
+    else:
+        contents = read_bytes(data_source_references_path)
+    contents, instruction = with_profiles(
+        contents,
+        instruction_for(EXAMPLE_QUERIES_INSTRUCTION, encoding),
+        profiling.read_profiles(data_source_references_path),
+    )
+    return await generate_json(
+        client,
+        contents,
+        "exampleQueries_schema.json",
+        instruction,
+        cache,
+        on_cache_miss,
+    )
+
+
+def _hybrid_input(table_references: list[dict]) -> tuple[list[dict], list[dict]]:
+    """The tables that are part of a candidate relationship, and the candidates."""
+    index = ColumnIndex(table_references)
+    candidates = index.candidates()
+    tables = [table_references[i] for i in index.candidate_table_indexes(candidates)]
+    return tables, candidates
+
+
+def relationships_input(table_references: list[dict], hybrid: bool):
+    """Returns the LLM input and system instruction to infer relationships among
+    table_references. In hybrid mode, the input only has the tables that are part
+    of a candidate relationship, and the candidates to confirm, or is None if
+    there are no candidates."""
+    if not hybrid:
+        contents = yaml_io.dumps({"bq": {"tableReferences": table_references}})
+        return contents.encode(), SCHEMA_RELATIONSHIPS_INSTRUCTION
+    tables, candidates = _hybrid_input(table_references)
+    if not candidates:
+        return None, CONFIRM_SCHEMA_RELATIONSHIPS_INSTRUCTION
+    contents = yaml_io.dumps(
+        {
+            "bq": {"tableReferences": tables},
+            "candidateRelationships": candidates,
+        }
+    )
+    return contents.encode(), CONFIRM_SCHEMA_RELATIONSHIPS_INSTRUCTION
+
+
+async def relationships_prompt(
+    client: genai.Client,
+    table_references: list[dict],
+    hybrid: bool,
+    encoding: PromptEncoding = None,
+    label: str = "schemaRelationships prompt",
+):
+    """relationships_input, with the tables in the compact format (see
+    prompt_encoding) when encoding is compact, and the on_cache_miss of its
+    LLM call (see yaml_comparison)."""
+    if not is_compact(encoding):
+        return (*relationships_input(table_references, hybrid), None)
+    if not hybrid:
+        contents = await prompt_encoding.encode_for_prompt(
+            client, MODEL, table_references, encoding, label=label
+        )
+        return (
+            contents,
+            instruction_for(SCHEMA_RELATIONSHIPS_INSTRUCTION, encoding),
+            yaml_comparison(client, table_references, contents, encoding, label=label),
+        )
+    instruction = instruction_for(CONFIRM_SCHEMA_RELATIONSHIPS_INSTRUCTION, encoding)
+    tables, candidates = _hybrid_input(table_references)
+    if not candidates:
+        return None, instruction, None
+    extra = yaml_io.dumps({"candidateRelationships": candidates})
+    contents = await prompt_encoding.encode_for_prompt(
+        client, MODEL, tables, encoding, extra=extra, label=label
+    )
+    return (
+        contents,
+        instruction,
+        yaml_comparison(client, tables, contents, encoding, extra, label),
+    )
+
+
+async def generate_schema_relationships(
+    client: genai.Client,
+    data_source_references_path: Path,
+    cache: GenerationCache = None,
+    hybrid: bool = False,
+    encoding: PromptEncoding = None,
+):
+    """Generates the schemaRelationships.yaml file, by calling an LLM with:
+    - input: the data_sourceReferences.yaml file, or its tables in the compact
+      format (see prompt_encoding) when encoding is compact
+    - output schema: a json schema file that matches the expected output
+
+    In hybrid mode, the LLM gets candidate relationships found by
+    join_candidates.ColumnIndex, and only confirms them.
+    """
+    on_cache_miss = None
+    if hybrid or is_compact(encoding):
+        contents, instruction, on_cache_miss = await relationships_prompt(
+            client,
+            read_table_references(data_source_references_path),
+            hybrid,
+            encoding,
+        )
+        if contents is None:
+            print("No candidate relationships found")
+            return []
+    else:
+        contents = read_bytes(data_source_references_path)
+        instruction = SCHEMA_RELATIONSHIPS_INSTRUCTION
+    contents, instruction = with_profiles(
+        contents, instruction, profiling.read_profiles(data_source_references_path)
+    )
+    return await generate_json(
+        client,
+        contents,
+        "schemaRelationships_schema.json",
+        instruction,
+        cache,
+        on_cache_miss,
+    )
+
+
+def generate_schema_relationships_heuristic(data_source_references_path: Path):
+    """Generates the schemaRelationships.yaml file without an LLM, from column
+    names and types only (see join_candidates.ColumnIndex.candidates)."""
+    return ColumnIndex(read_table_references(data_source_references_path)).candidates()
+
+
+def print_shard_usage(shards: list[list[int]], usages: list[dict], results: list):
+    table = Table(box=box.SQUARE)
+    table.add_column("Shard", style="bright_green")
+    table.add_column("Tables", justify="right")
+    table.add_column("Latency", justify="right")
+    table.add_column("Prompt tokens", justify="right")
+    table.add_column("Output tokens", justify="right")
+    table.add_column("Relationships", justify="right")
+
+    for i, (shard, usage, result) in enumerate(zip(shards, usages, results)):
+        latency = "cached" if usage["cached"] else f"{usage['latency']:.1f}s"
+        table.add_row(
+            str(i + 1),
+            str(len(shard)),
+            latency,
+            str(usage["prompt_tokens"]),
+            str(usage["output_tokens"]),
+            str(len(result)),
+        )
+
+    console = Console(highlight=False)
+    console.print(table)
+
+
+async def generate_schema_relationships_sharded(
+    client: genai.Client,
+    data_source_references_path: Path,
+    shard_size: int,
+    concurrency: int,
+    cache: GenerationCache = None,
+    hybrid: bool = False,
+    encoding: PromptEncoding = None,
+):
+    """Generates the schemaRelationships.yaml file for schemas too large for one prompt.
+
+    Tables are split into overlapping shards of related tables (see
+    relationship_shards.shard_tables), relationships are inferred for each shard
+    with up to `concurrency` LLM calls at the same time, and the results merged.
+    In hybrid mode, each shard only confirms the candidates found among its tables.
+    """
+    table_references = read_table_references(data_source_references_path)
+    profiles = profiling.read_profiles(data_source_references_path)
+    shards = shard_tables(table_references, shard_size)
+    print(f"Inferring schema relationships in {len(shards)} shards")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def infer(i, shard):
+        tables = [table_references[t] for t in shard]
+        # the prompt's count_tokens calls count against the concurrency too
+        async with semaphore:
+            contents, instruction, on_cache_miss = await relationships_prompt(
+                client, tables, hybrid, encoding, label=f"shard {i + 1} prompt"
+            )
+            if contents is None:
+                return [], {
+                    "latency": 0,
+                    "prompt_tokens": 0,
+                    "output_tokens": 0,
+                    "cached": False,
+                }
+            contents, instruction = with_profiles(
+                contents, instruction, profiles, tables
+            )
+            return await generate_json_with_usage(
+                client,
+                contents,
+                "schemaRelationships_schema.json",
+                instruction,
+                cache,
+                on_cache_miss,
+            )
+
+    outputs = await asyncio.gather(*(infer(i, shard) for i, shard in enumerate(shards)))
+    results = [result for result, _ in outputs]
+    print_shard_usage(shards, [usage for _, usage in outputs], results)
+    return merge_relationships(results)
+
+
+async def generate_relationships_for_mode(
+    client: genai.Client,
+    data_source_references_path: Path,
+    mode: str,
+    shard_size: int,
+    concurrency: int,
+    cache: GenerationCache = None,
+    encoding: PromptEncoding = None,
+):
+    """Generates schema relationships with the given mode: llm, heuristic or hybrid."""
+    if mode == "heuristic":
+        return generate_schema_relationships_heuristic(data_source_references_path)
+    hybrid = mode == "hybrid"
+    if shard_size > 0:
+        return await generate_schema_relationships_sharded(
+            client,
+            data_source_references_path,
+            shard_size,
+            concurrency,
+            cache,
+            hybrid,
+            encoding,
+        )
+    return await generate_schema_relationships(
+        client, data_source_references_path, cache, hybrid, encoding
+    )
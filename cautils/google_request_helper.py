@@ -1,76 +1,365 @@
+import codecs
+import datetime
+import email.utils
 import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 from google import auth as google_auth
 from google.auth.transport import requests as google_requests
-from urllib.parse import urlencode
+from . import token_cache
+from .backoff import backoff_delay
+from .rate_limit import shared_limiter
+
+# Refresh the access token this long before it actually expires, so a token
+# never runs out in the middle of a request.
+TOKEN_EXPIRY_MARGIN = datetime.timedelta(minutes=5)
+
+# Number of hosts kept in the pool (geminidataanalytics, cloudresourcemanager,
+# oauth2...) and keep-alive connections kept per host.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+# Retries of failed requests, with exponential backoff and jitter, or the wait
+# asked for by the server's Retry-After header (up to RETRY_AFTER_MAX seconds).
+MAX_RETRIES = 5
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 32.0
+RETRY_AFTER_MAX = 120.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# methods that can be sent twice with the same effect as once
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Maximum requests per second to each endpoint, shared by all helpers (and
+# threads) of the process. 0 means no limit.
+MAX_QPS_ENV = "CA_UTILS_MAX_QPS"
+
+
+def retry_after_seconds(response) -> float | None:
+    """Seconds to wait given by a Retry-After header (a number of seconds or an
+    HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+
+def endpoint_key(method: str, url: str) -> str:
+    """Rate limiting key of a request, i.e. "GET geminidataanalytics.googleapis.com
+    dataAgents": the host, method and collection (or custom method, i.e. ":chat")
+    under the project location."""
+    parts = urlsplit(url)
+    path = parts.path.split("/locations/", 1)[-1].split("/")
+    collection = path[1] if len(path) > 1 else path[0]
+    if ":" in parts.path.rsplit("/", 1)[-1]:
+        collection = ":" + parts.path.rsplit(":", 1)[-1]
+    return f"{method} {parts.netloc} {collection}"
+
+
+class JsonArrayParser:
+    """Incremental parser of a JSON array of objects, fed with bytes in pieces of
+    any size (i.e. a streamed response)."""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._start = None  # where the current element starts in buffer
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._closed = False
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        """Returns the elements completed by chunk."""
+        elements = []
+        offset = len(self._buffer)
+        self._buffer += self._decoder.decode(chunk)
+        buffer = self._buffer
+        for i in range(offset, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    elements.append(json.loads(buffer[self._start : i + 1]))
+                    self._start = None
+            elif char == "]" and self._depth == 0:
+                self._closed = True
+        # keep only the element in progress
+        if self._start is None:
+            self._buffer = ""
+        elif self._start > 0:
+            self._buffer = buffer[self._start :]
+            self._start = 0
+        return elements
+
+    def close(self):
+        """Checks that the whole array was fed.
+
+        Raises:
+            json.JSONDecodeError: when the stream stopped before the end of the
+                array, i.e. in the middle of an element.
+        """
+        try:
+            rest = self._buffer + self._decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            rest = self._buffer + "\ufffd"
+        if self._depth or rest.strip() or not self._closed:
+            raise json.JSONDecodeError("Unterminated JSON array", rest, len(rest))
+
+
+def iter_json_array(chunks):
+    """Yields the elements of a JSON array of objects as soon as each one is complete.
+
+    Args:
+        chunks: bytes of the array, in pieces of any size (i.e. a streamed response).
+
+    Raises:
+        json.JSONDecodeError: when the chunks end before the array does.
+    """
+    parser = JsonArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
 
 
 class GoogleRequestHelper:
-    def __init__(self, project_id, base_url):
+    def __init__(
+        self,
+        project_id,
+        base_url,
+        pool_maxsize: int = POOL_MAXSIZE,
+        max_qps: float = None,
+    ):
         self.project_id = project_id
         self.base_url = base_url
+        self._credentials = None
+        self._token = None
+        self._token_expiry = None
+        self._token_lock = threading.Lock()
+        self.tokens_refreshed = 0
+        if max_qps is None:
+            max_qps = float(os.environ.get(MAX_QPS_ENV) or 0)
+        self.max_qps = max_qps
+        self._stats_lock = threading.Lock()
+        self.retries = 0
+        self.retry_wait_seconds = 0.0
+        self.throttled_seconds = 0.0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _token_is_fresh(self) -> bool:
+        if not self._token:
+            return False
+        if not self._token_expiry:
+            return True
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return now < self._token_expiry - TOKEN_EXPIRY_MARGIN
 
     def _get_access_token(self) -> str:
-        try:
-            credentials, _ = google_auth.default()
-            auth_request = google_requests.Request()
-            credentials.refresh(auth_request)
-            return credentials.token
-        except Exception as e:
-            raise Exception(
-                f"FATAL: Could not get Google credentials. "
-                f"Ensure you have run 'gcloud auth application-default login'"
-            )
+        with self._token_lock:
+            if self._token_is_fresh():
+                return self._token
+            try:
+                if self._credentials is None:
+                    self._credentials, _ = google_auth.default()
+                if token_cache.enabled():
+                    key = token_cache.cache_key(self._credentials)
+                    with token_cache.locked_entry(key) as entry:
+                        token, expiry = entry.read(TOKEN_EXPIRY_MARGIN)
+                        if token:
+                            self._token, self._token_expiry = token, expiry
+                            return self._token
+                        self._refresh_credentials()
+                        entry.write(self._token, self._token_expiry)
+                else:
+                    self._refresh_credentials()
+            except Exception as e:
+                raise Exception(
+                    f"FATAL: Could not get Google credentials. "
+                    f"Ensure you have run 'gcloud auth application-default login'"
+                ) from e
+            return self._token
+
+    def _refresh_credentials(self):
+        auth_request = google_requests.Request(session=self.session)
+        self._credentials.refresh(auth_request)
+        self.tokens_refreshed += 1
+        # google-auth expiry is a naive UTC datetime
+        self._token = self._credentials.token
+        self._token_expiry = self._credentials.expiry
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self._get_access_token()}",
+            "Content-Type": "application/json",
+            "X-Goog-User-Project": self.project_id,
+        }
+
+    def connections_opened(self) -> int:
+        """Number of TCP/TLS connections opened by this helper's session."""
+        total = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    total += pool.num_connections
+        return total
+
+    def stats(self) -> dict:
+        """Counters that show how much connection and credential reuse happened."""
+        return {
+            "connections_opened": self.connections_opened(),
+            "tokens_refreshed": self.tokens_refreshed,
+            "retries": self.retries,
+            "retry_wait_seconds": self.retry_wait_seconds,
+            "throttled_seconds": self.throttled_seconds,
+        }
+
+    def close(self):
+        self.session.close()
+
+    def _throttle(self, method: str, url: str):
+        if self.max_qps <= 0:
+            return
+        waited = shared_limiter(endpoint_key(method, url), self.max_qps).acquire()
+        if waited:
+            with self._stats_lock:
+                self.throttled_seconds += waited
+
+    def _raise_for_status(self, response: requests.Response, stream: bool):
+        """Raises HTTPError for an error response. A streamed one is closed first,
+        as the caller never gets it, so that its connection goes back to the pool."""
+        if stream and not response.ok:
+            # read the error body first, so HTTPError.response.text still has it
+            _ = response.content
+            response.close()
+        response.raise_for_status()
+
+    def _send(
+        self, method: str, url: str, idempotent: bool = None, **kwargs
+    ) -> requests.Response:
+        """Sends a request, retrying it when it failed in a way that is safe to retry.
+
+        Idempotent requests (GET, DELETE, or marked idempotent) are retried on
+        429 and 5xx responses and on connection errors. Others (POST, PATCH)
+        are only retried when they were not processed: on 429 responses and
+        when the connection could not be made.
+
+        Raises:
+            HTTPError: for error responses, once retries are exhausted.
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self._throttle(method, url)
+            delay = None
+            try:
+                response = self.session.request(
+                    method, url, headers=self._headers(), **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                safe = idempotent or isinstance(e, requests.ConnectTimeout)
+                if not safe or attempt >= MAX_RETRIES:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                    self._raise_for_status(response, kwargs.get("stream"))
+                    return response
+                if not idempotent and response.status_code != 429:
+                    self._raise_for_status(response, kwargs.get("stream"))
+                delay = retry_after_seconds(response)
+                if delay is not None:
+                    delay = min(delay, RETRY_AFTER_MAX)
+                response.close()
+            if delay is None:
+                delay = backoff_delay(attempt, RETRY_INITIAL_DELAY, RETRY_MAX_DELAY)
+            with self._stats_lock:
+                self.retries += 1
+                self.retry_wait_seconds += delay
+            time.sleep(delay)
+            attempt += 1
 
     def _execute_request(
-        self, method: str, url: str, data: dict = None, params: dict = None
+        self,
+        method: str,
+        url: str,
+        data: dict = None,
+        params: dict = None,
+        idempotent: bool = None,
     ) -> dict:
         """
-        Executes an HTTP request using the requests library.
+        Executes an HTTP request on the helper's pooled session, with retries.
 
         Args:
             method: The HTTP method (e.g., 'POST', 'GET', 'DELETE', 'PATCH').
             url: The API endpoint URL. Do not include the base
             data: The JSON payload for the request.
+            idempotent: Whether the request can be retried after any failure.
+                By default, only for GET and DELETE.
 
         Returns:
             The JSON response from the API.
         """
-        headers = {
-            "Authorization": f"Bearer {self._get_access_token()}",
-            "Content-Type": "application/json",
-            "X-Goog-User-Project": self.project_id,
-        }
-
-        response = requests.request(
-            method, self.base_url + url, headers=headers, json=data, params=params
+        response = self._send(
+            method, self.base_url + url, idempotent, json=data, params=params
         )
-        response.raise_for_status()  # Raises an HTTPError for bad responses (4xx or 5xx)
         return response.json()
 
-    def get_project_number(self):
-        headers = {
-            "Authorization": f"Bearer {self._get_access_token()}",
-            "Content-Type": "application/json",
-            "X-Goog-User-Project": self.project_id,
-        }
+    def post_stream(self, url, data, params: dict[str, str] = None):
+        """Posts data to a method that streams a JSON array, and yields each
+        element as soon as it arrives, without waiting for the whole response."""
+        with self._send(
+            "POST", self.base_url + url, json=data, params=params, stream=True
+        ) as response:
+            yield from iter_json_array(response.iter_content(chunk_size=None))
 
-        response = requests.request(
+    def get_project_number(self):
+        response = self._send(
             "GET",
             f"https://cloudresourcemanager.googleapis.com/v1/projects/{self.project_id}",
-            headers=headers,
         )
-        response.raise_for_status()
         return response.json().get("projectNumber")
 
     def get(self, url, params: dict = None):
         return self._execute_request("GET", url, params=params)
 
-    def post(self, url, data, params: dict[str, str] = None):
-        return self._execute_request("POST", url, data, params)
+    def post(self, url, data, params: dict[str, str] = None, idempotent: bool = False):
+        return self._execute_request("POST", url, data, params, idempotent)
 
     def delete(self, url, params: dict = None):
         return self._execute_request("DELETE", url, params=params)
 
-    def patch(self, url, data, params: dict[str, str] = None):
-        return self._execute_request("PATCH", url, data, params)
+    def patch(self, url, data, params: dict[str, str] = None, idempotent: bool = False):
+        return self._execute_request("PATCH", url, data, params, idempotent)
@@ -1,15 +1,35 @@
+import csv
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
 from .google_request_helper import GoogleRequestHelper
 
+from rich.console import Console
 from rich.prompt import Prompt
-from typing import Callable
+from typing import Callable, Iterator
 from requests.exceptions import HTTPError
 from rich import print as rprint
 
+# page size asked for when listing everything; the API lowers it to its own maximum
+ALL_PAGE_SIZE = 1000
+
 
 class GeminiDataAnalyticsRequestHelper(GoogleRequestHelper):
-    def __init__(self, project_id, location):
+    def __init__(self, project_id, location, **kwargs):
         self.base_url = f"https://geminidataanalytics.googleapis.com/v1beta/projects/{project_id}/locations/{location}/"
-        super().__init__(project_id, self.base_url)
+        super().__init__(project_id, self.base_url, **kwargs)
+
+
+def print_request_stats(helper: GoogleRequestHelper):
+    """Prints how many requests were retried, and the time spent waiting for
+    retries and for the rate limiter, if any."""
+    stats = helper.stats()
+    if stats["retries"] or stats["throttled_seconds"]:
+        rprint(
+            f"{stats['retries']} retried requests ({stats['retry_wait_seconds']:.1f}s waiting), "
+            f"{stats['throttled_seconds']:.1f}s throttled by the client-side rate limit"
+        )
 
 
 def paginate(retriever: Callable, printer: Callable):
@@ -29,3 +49,55 @@ def paginate(retriever: Callable, printer: Callable):
                 break
     except HTTPError as e:
         rprint(f"[bright_red]{e.response.text}[/bright_red]")
+
+
+def iter_pages(retriever: Callable, page_size: int = ALL_PAGE_SIZE) -> Iterator[dict]:
+    """Yields every page of a list method, without asking.
+
+    The next page is fetched in a background thread while the caller handles
+    the current one, so at most two pages are held in memory.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(retriever, {"pageSize": page_size})
+        while future is not None:
+            data = future.result()
+            if next_page_token := data.get("nextPageToken"):
+                future = executor.submit(
+                    retriever, {"pageToken": next_page_token, "pageSize": page_size}
+                )
+            else:
+                future = None
+            yield data
+
+
+def stream_all(
+    retriever: Callable,
+    items_key: str,
+    row: Callable[[dict], dict],
+    output_format: str = "jsonl",
+):
+    """Writes every item of a list method to stdout, as soon as its page arrives.
+
+    Args:
+        retriever: called with the page params, returns one page of the list method.
+        items_key: key of the items in each page, i.e. "dataAgents".
+        row: turns an item into a flat dict, used for the csv format.
+        output_format: jsonl (one raw item per line) or csv (one row per item).
+    """
+    writer = None
+    try:
+        for data in iter_pages(retriever):
+            for item in data.get(items_key, []):
+                if output_format == "csv":
+                    values = row(item)
+                    if writer is None:
+                        writer = csv.DictWriter(sys.stdout, fieldnames=[*values])
+                        writer.writeheader()
+                    writer.writerow(values)
+                else:
+                    sys.stdout.write(json.dumps(item) + "\n")
+            sys.stdout.flush()
+    except HTTPError as e:
+        Console(stderr=True, highlight=False).print(
+            f"[bright_red]{e.response.text}[/bright_red]"
+        )
@@ -0,0 +1,173 @@
+"""Finds likely join columns between tables from their metadata alone, without
+calling an LLM: same key column names, and <table>_id columns that point to a
+table with an id column."""
+
+import re
+
+# suffixes of column names that usually hold keys, after normalization
+KEY_SUFFIXES = ("id", "key", "code")
+# a shared key name in more tables than this, with no table owning it, is too
+# generic to pair every table with every other one
+MAX_UNOWNED_KEY_TABLES = 10
+
+# types that can be compared in a join without casting
+_TYPE_GROUPS = {
+    "INT64": "INTEGER",
+    "INTEGER": "INTEGER",
+    "STRING": "STRING",
+    "BYTES": "BYTES",
+    "NUMERIC": "NUMERIC",
+    "BIGNUMERIC": "NUMERIC",
+    "DATE": "DATE",
+}
+
+
+def normalize_name(name: str) -> str:
+    """stationId, station_id and STATION_ID all become "stationid"."""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def _singular(name: str) -> str:
+    if name.endswith("ies"):
+        return name[:-3] + "y"
+    if name.endswith(("ses", "xes")):
+        return name[:-2]
+    if name.endswith("s") and not name.endswith("ss"):
+        return name[:-1]
+    return name
+
+
+def table_fqn(table_reference: dict) -> str:
+    return (
+        f"bigquery.googleapis.com/projects/{table_reference['projectId']}"
+        f"/datasets/{table_reference['datasetId']}/tables/{table_reference['tableId']}"
+    )
+
+
+class ColumnIndex:
+    """Inverted index over the columns of exported tableReferences.
+
+    by_name maps a normalized column name to the (table index, path, type) of
+    every column with that name, nested columns included (path is dotted).
+    by_table_name maps a normalized, singular table name to table indexes.
+    """
+
+    def __init__(self, table_references: list[dict]):
+        self.table_references = table_references
+        self.by_name = {}
+        self.by_table_name = {}
+        for i, table in enumerate(table_references):
+            table_name = _singular(normalize_name(table["tableId"]))
+            self.by_table_name.setdefault(table_name, []).append(i)
+            stack = [("", table.get("schema", {}).get("fields") or [])]
+            while stack:
+                prefix, fields = stack.pop()
+                for field in fields:
+                    path = f"{prefix}{field['name']}"
+                    if field.get("subfields"):
+                        stack.append((f"{path}.", field["subfields"]))
+                        continue
+                    if field.get("mode") == "REPEATED":
+                        continue
+                    self.by_name.setdefault(normalize_name(field["name"]), []).append(
+                        (i, path, field.get("type"))
+                    )
+
+    def tables_by_name(self) -> dict[str, list[int]]:
+        """Normalized column name to the indexes of the tables that have it."""
+        return {
+            name: sorted({i for i, _, _ in columns})
+            for name, columns in self.by_name.items()
+        }
+
+    def _owners(self, key_name: str) -> set[int]:
+        """Tables whose name is the key name without its suffix, i.e. "station" for "stationid"."""
+        for suffix in KEY_SUFFIXES:
+            if key_name.endswith(suffix) and len(key_name) > len(suffix):
+                return set(self.by_table_name.get(key_name[: -len(suffix)], []))
+        return set()
+
+    def candidates(self) -> list[dict]:
+        """Candidate relationships, in the schemaRelationships format.
+
+        - <table>_id in one table and id in <table> (or its plural): score 90
+        - a key-like column name shared by several tables, paired with the
+          table that owns it when there is one (score 70), or else with
+          each other (score 50)
+
+        Columns must have compatible types. Results are sorted and have no
+        duplicates, so they can be used as LLM input that caches well.
+        """
+        found = {}
+
+        def add(left, right, score):
+            (li, lpath, ltype), (ri, rpath, rtype) = left, right
+            type_group = _TYPE_GROUPS.get(ltype)
+            if li == ri or type_group is None or type_group != _TYPE_GROUPS.get(rtype):
+                return
+            key = tuple(sorted([(li, lpath), (ri, rpath)]))
+            if key in found and found[key][0] >= score:
+                return
+            found[key] = (score, left, right)
+
+        # <table>_id -> <table>.id
+        id_columns = {}
+        for column in self.by_name.get("id", []):
+            if "." not in column[1]:
+                id_columns.setdefault(column[0], column)
+        for name, columns in self.by_name.items():
+            if name == "id" or not name.endswith("id"):
+                continue
+            for owner in self._owners(name):
+                if owner in id_columns:
+                    for column in columns:
+                        add(column, id_columns[owner], 90)
+
+        # shared key names
+        for name, columns in self.by_name.items():
+            if name == "id" or not name.endswith(KEY_SUFFIXES):
+                continue
+            if len({i for i, _, _ in columns}) < 2:
+                continue
+            owners = self._owners(name)
+            owned = [c for c in columns if c[0] in owners]
+            if owned:
+                for owner_column in owned:
+                    for column in columns:
+                        add(column, owner_column, 70)
+            elif len({i for i, _, _ in columns}) <= MAX_UNOWNED_KEY_TABLES:
+                for a in range(len(columns)):
+                    for b in range(a + 1, len(columns)):
+                        add(columns[a], columns[b], 50)
+
+        relationships = []
+        for key in sorted(found):
+            score, (li, lpath, _), (ri, rpath, _) = found[key]
+            relationships.append(
+                {
+                    "confidenceScore": score,
+                    "leftSchemaPaths": {
+                        "paths": [lpath],
+                        "tableFqn": table_fqn(self.table_references[li]),
+                    },
+                    "rightSchemaPaths": {
+                        "paths": [rpath],
+                        "tableFqn": table_fqn(self.table_references[ri]),
+                    },
+                    "sources": [],
+                }
+            )
+        return relationships
+
+    def candidate_table_indexes(self, candidates: list[dict]) -> list[int]:
+        """Indexes of the tables that appear in any of the candidates."""
+        fqns = {
+            c[side]["tableFqn"]
+            for c in candidates
+            for side in ("leftSchemaPaths", "rightSchemaPaths")
+        }
+        return [
+            i
+            for i, table in enumerate(self.table_references)
+            if table_fqn(table) in fqns
+        ]
@@ -0,0 +1,21 @@
+import os
+from pathlib import Path
+
+
+def cache_dir(name: str) -> Path:
+    """Returns (and creates) a private per-user cache directory for ca-utils.
+
+    The location is $CA_UTILS_CACHE_DIR if set, otherwise
+    $XDG_CACHE_HOME/ca-utils (~/.cache/ca-utils by default).
+
+    Args:
+        name: Subdirectory for one kind of cached data, e.g. "tokens".
+    """
+    root = os.environ.get("CA_UTILS_CACHE_DIR")
+    if not root:
+        root = (
+            Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "ca-utils"
+        )
+    path = Path(root) / name
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path
@@ -1,12 +1,23 @@
 from cyclopts import App
-from . import data_agent
-from . import bq_metadata
-from . import da_lro
 
 app = App()
 app.register_install_completion_command()
-app.command(data_agent.app)
-app.command(bq_metadata.app)
-app.command(da_lro.app)
+# sub-apps are imported only when one of their commands runs (or their help
+# is shown), so each command only pays for the dependencies it uses
+app.command(
+    "cautils.data_agent:app",
+    name="data-agent",
+    help="commands related to conversational analytics api agents",
+)
+app.command(
+    "cautils.bq_metadata:app",
+    name="bq-metadata",
+    help="commands related to bigquery metadata extraction (this section is obsolete, but hasn't been deleted)",
+)
+app.command(
+    "cautils.da_lro:app",
+    name="da-lro",
+    help="commands related to conversational analytics long running operations. i.e. deployments",
+)
 
 app()
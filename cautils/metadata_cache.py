@@ -0,0 +1,103 @@
+import json
+import os
+from pathlib import Path
+
+from .local_cache import cache_dir
+
+CACHE_VERSION = 1
+
+
+class MetadataCache:
+    """Exported tableReferences entries, cached per table with its lastModifiedTime.
+
+    There is one file per dataset, shared by every agent that uses the dataset.
+    An entry is only reused while the table's lastModifiedTime has not changed,
+    and it was exported with the same schema options (see
+    metadata_tool.SchemaOptions.cache_key).
+    """
+
+    def __init__(self, directory: Path = None):
+        self.directory = directory or cache_dir("metadata")
+        self._datasets = {}
+        self._dirty = set()
+        self.hits = 0
+        self.refreshed = 0
+        self.new = 0
+
+    def _path(self, project_id: str, dataset_id: str) -> Path:
+        return self.directory / f"{project_id}.{dataset_id}.json"
+
+    def _tables(self, project_id: str, dataset_id: str) -> dict:
+        key = (project_id, dataset_id)
+        if key not in self._datasets:
+            tables = {}
+            try:
+                data = json.loads(self._path(project_id, dataset_id).read_text())
+                if data.get("version") == CACHE_VERSION:
+                    tables = data["tables"]
+            except (OSError, ValueError, KeyError):
+                pass
+            self._datasets[key] = tables
+        return self._datasets[key]
+
+    def get(
+        self,
+        project_id: str,
+        dataset_id: str,
+        table_id: str,
+        last_modified_time: str,
+        export_options: str = "",
+    ):
+        """Returns the cached entry if the table has not changed, and was exported
+        with the same export_options, otherwise None.
+
+        Every lookup is counted as a hit, a refresh (the table changed) or new.
+        """
+        cached = self._tables(project_id, dataset_id).get(table_id)
+        if cached is None:
+            self.new += 1
+            return None
+        if (
+            cached["lastModifiedTime"] != last_modified_time
+            or cached.get("exportOptions", "") != export_options
+        ):
+            self.refreshed += 1
+            return None
+        self.hits += 1
+        return cached["tableReference"]
+
+    def put(
+        self,
+        project_id: str,
+        dataset_id: str,
+        table_id: str,
+        last_modified_time: str,
+        table_reference: dict,
+        etag: str = None,
+        export_options: str = "",
+    ):
+        self._tables(project_id, dataset_id)[table_id] = {
+            "lastModifiedTime": last_modified_time,
+            "exportOptions": export_options,
+            "etag": etag,
+            "tableReference": table_reference,
+        }
+        self._dirty.add((project_id, dataset_id))
+
+    def save(self):
+        for project_id, dataset_id in sorted(self._dirty):
+            path = self._path(project_id, dataset_id)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(
+                json.dumps(
+                    {
+                        "version": CACHE_VERSION,
+                        "tables": self._datasets[(project_id, dataset_id)],
+                    }
+                )
+            )
+            os.replace(tmp_path, path)
+        self._dirty.clear()
+
+    def summary(self) -> str:
+        return f"metadata cache: {self.hits} hits, {self.refreshed} refreshed, {self.new} new tables"
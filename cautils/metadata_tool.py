@@ -1,7 +1,51 @@
 # based on https://github.com/google/adk-python/blob/main/src/google/adk/tools/bigquery/metadata_tool.py
+import fnmatch
 import json
-from google.cloud import bigquery
-from typing import List
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List
+
+# google.cloud.bigquery is slow to import, and only imported by the functions
+# that use it, so commands that don't need it start faster
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+
+# Default number of tables fetched at the same time
+DEFAULT_PARALLELISM = 8
+# Upper bound for parallelism, also the size of each client's connection pool
+MAX_PARALLELISM = 64
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(project_id: str) -> "bigquery.Client":
+    """Returns a bigquery.Client for the project, shared by every caller and thread.
+
+    Args:
+        project_id (str): The Google Cloud project id.
+    Returns:
+        bigquery.Client: a client whose connection pool fits MAX_PARALLELISM requests.
+    """
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import bigquery
+
+    with _clients_lock:
+        client = _clients.get(project_id)
+        if client is None:
+            credentials, _ = google.auth.default(scopes=bigquery.Client.SCOPE)
+            session = AuthorizedSession(credentials)
+            # the default pool keeps 10 connections, too few for concurrent fetches
+            session.mount("https://", HTTPAdapter(pool_maxsize=MAX_PARALLELISM))
+            client = bigquery.Client(
+                project=project_id, credentials=credentials, _http=session
+            )
+            _clients[project_id] = client
+        return client
 
 
 def list_dataset_ids(project_id: str) -> list[str]:
@@ -12,7 +56,7 @@ def list_dataset_ids(project_id: str) -> list[str]:
     Returns:
         list[str]: List of the BigQuery dataset ids present in the project.
     """
-    client = bigquery.Client(project=project_id)
+    client = get_client(project_id)
 
     datasets = []
     for dataset in client.list_datasets(project_id):
@@ -30,61 +74,189 @@ def get_dataset_info(project_id: str, dataset_id: str):
     Returns:
         dataset.
     """
-    client = bigquery.Client(project=project_id)
+    from google.cloud import bigquery
+
+    client = get_client(project_id)
     dataset = client.get_dataset(bigquery.DatasetReference(project_id, dataset_id))
     return dataset
 
 
+def table_reference(
+    project_id: str, dataset_id: str, table_id: str
+) -> "bigquery.TableReference":
+    from google.cloud import bigquery
+
+    return bigquery.TableReference(
+        bigquery.DatasetReference(project_id, dataset_id), table_id
+    )
+
+
 def list_tables(project_id: str, dataset_id: str):
-    client = bigquery.Client(project=project_id)
+    from google.cloud import bigquery
+
+    client = get_client(project_id)
     return client.list_tables(bigquery.DatasetReference(project_id, dataset_id))
 
 
-def replace_fields_recursively(data):
-    """
-    Recursively finds all dictionary keys named 'fields' and replaces them
-    with 'subfields'. It handles nested dictionaries and lists.
+def _compile_globs(patterns: list[str]):
+    """One regex that matches any of the glob patterns, or None if there are none."""
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns))
 
-    Args:
-        data (dict, list, or other): The data structure to process.
 
-    Returns:
-        dict, list, or other: The processed data structure with keys replaced.
+class SchemaOptions:
+    """How a table schema is exported to a tableReferences entry.
+
+    Column patterns are globs (see fnmatch) matched, case-insensitively,
+    against the dotted path of each column, i.e. "address.city".
     """
 
-    # --- 1. Base Case: If the data is not a collection, return it as is. ---
-    if not isinstance(data, (dict, list)):
-        return data
+    # autogen.yaml key of each option
+    CONFIG_KEYS = {
+        "includeColumns": "include",
+        "excludeColumns": "exclude",
+        "maxDepth": "max_depth",
+        "dropDefaults": "drop_defaults",
+    }
 
-    # --- 2. Handle Lists: Recurse on each element of the list. ---
-    if isinstance(data, list):
-        return [replace_fields_recursively(item) for item in data]
+    def __init__(
+        self,
+        include: list[str] = (),
+        exclude: list[str] = (),
+        max_depth: int = 0,
+        drop_defaults: bool = False,
+    ):
+        """
+        Args:
+            include: If not empty, only columns matching one of these patterns
+                (and their subfields, and the records that contain them) are kept.
+            exclude: Columns matching one of these patterns, and their subfields,
+                are dropped.
+            max_depth: If more than 0, the deepest nesting level kept. Records at
+                that level keep their own attributes, without subfields.
+            drop_defaults: Whether to drop attributes that are empty, or have
+                the value the API assumes when missing (mode NULLABLE).
+        """
+        self.include = [p.lower() for p in include]
+        self.exclude = [p.lower() for p in exclude]
+        self.max_depth = max_depth
+        self.drop_defaults = drop_defaults
+        self._include = _compile_globs(self.include)
+        self._exclude = _compile_globs(self.exclude)
+
+    @classmethod
+    def from_config(cls, config: dict, base: "SchemaOptions" = None) -> "SchemaOptions":
+        """Options from a schemaExport mapping of autogen.yaml, on top of base."""
+        base = base or cls()
+        values = {attr: getattr(base, attr) for attr in cls.CONFIG_KEYS.values()}
+        for key, value in (config or {}).items():
+            if key not in cls.CONFIG_KEYS:
+                raise ValueError(
+                    f"Invalid schemaExport option '{key}', expected one of {[*cls.CONFIG_KEYS]}"
+                )
+            if key in ("includeColumns", "excludeColumns") and isinstance(value, str):
+                value = [value]
+            values[cls.CONFIG_KEYS[key]] = value
+        return cls(**values)
+
+    def cache_key(self) -> str:
+        """Identifies the options that change the export, "" for the defaults."""
+        if not (self.include or self.exclude or self.max_depth or self.drop_defaults):
+            return ""
+        return json.dumps(
+            [self.include, self.exclude, self.max_depth, self.drop_defaults]
+        )
 
-    # --- 3. Handle Dictionaries: Traverse keys and values. ---
-    new_data = {}
-    for key, value in data.items():
-        # Define the new key name
-        new_key = "subfields" if key == "fields" else key
+    def is_included(self, path: str) -> bool:
+        return self._include is not None and bool(self._include.match(path.lower()))
 
-        # Recursively process the value
-        new_value = replace_fields_recursively(value)
+    def is_excluded(self, path: str) -> bool:
+        return self._exclude is not None and bool(self._exclude.match(path.lower()))
 
-        # Assign the processed value to the new key
-        new_data[new_key] = new_value
 
-    return new_data
+DEFAULT_SCHEMA_OPTIONS = SchemaOptions()
 
 
-def export_table(table_metadata: dict) -> dict:
-    table_metadata["schema"]["fields"] = replace_fields_recursively(
-        table_metadata["schema"]["fields"]
-    )
+def _is_default(key: str, value) -> bool:
+    # None, "", [] or {}, but not False or 0
+    if not value and not isinstance(value, (bool, int, float)):
+        return True
+    return key == "mode" and value == "NULLABLE"
+
+
+def transform_schema(
+    fields: list[dict], options: SchemaOptions = DEFAULT_SCHEMA_OPTIONS
+) -> list[dict]:
+    """Exports the fields of a table schema, in one iterative pass, so neither
+    wide nor deeply nested schemas are copied more than once or hit the
+    recursion limit.
+
+    Nested "fields" are renamed to "subfields", and columns are filtered as
+    options say. Attribute values other than fields are shared with the input,
+    not copied.
+    """
+    exported = []
+    # entries are (field, path, depth, parent's exported list, included), or
+    # (None, exported record, ...) to close a record once its subfields are done
+    stack = [
+        (field, field.get("name", ""), 1, exported, not options.include)
+        for field in reversed(fields)
+    ]
+    while stack:
+        field, path, depth, siblings, included = stack.pop()
+        if field is None:
+            record = path
+            if not record["subfields"]:
+                del record["subfields"]
+                # a record kept only for the included columns it contains
+                if not included:
+                    siblings.pop()
+            continue
+        if options.is_excluded(path):
+            continue
+        included = included or options.is_included(path)
+        subfields = field.get("fields")
+        if subfields and options.max_depth and depth >= options.max_depth:
+            subfields = None
+        if not included and not subfields:
+            continue
+
+        out = {}
+        for key, value in field.items():
+            if key == "fields" or (options.drop_defaults and _is_default(key, value)):
+                continue
+            out[key] = value
+        siblings.append(out)
+        if subfields:
+            out["subfields"] = []
+            # popped after every subfield, when out is still the last sibling
+            stack.append((None, out, depth, siblings, included))
+            children = out["subfields"]
+            stack.extend(
+                (
+                    child,
+                    f"{path}.{child.get('name', '')}",
+                    depth + 1,
+                    children,
+                    included,
+                )
+                for child in reversed(subfields)
+            )
+    return exported
+
+
+def export_table(
+    table_metadata: dict, options: SchemaOptions = DEFAULT_SCHEMA_OPTIONS
+) -> dict:
     table_ref = table_metadata["tableReference"]
+    schema = table_metadata["schema"]
+    fields = transform_schema(schema.get("fields", []), options)
     return {
         "projectId": table_ref["projectId"],
         "datasetId": table_ref["datasetId"],
         "tableId": table_ref["tableId"],
-        "schema": table_metadata["schema"],
+        "schema": {**schema, "fields": fields},
     }
 
 
@@ -99,7 +271,9 @@ def get_table_metadata(project_id: str, dataset_id: str, table_id: str) -> dict:
     Returns:
         table fields information.
     """
-    client = bigquery.Client(project=project_id)
+    from google.cloud import bigquery
+
+    client = get_client(project_id)
     return client.get_table(
         bigquery.TableReference(
             bigquery.DatasetReference(project_id, dataset_id), table_id
@@ -107,13 +281,368 @@ def get_table_metadata(project_id: str, dataset_id: str, table_id: str) -> dict:
     ).to_api_repr()
 
 
-def get_tables_metadata(project_id: str, dataset_id: str):
-    client = bigquery.Client(project=project_id)
+def get_table_repr(table_ref) -> dict:
+    return get_client(table_ref.project).get_table(table_ref).to_api_repr()
+
+
+def map_bounded(
+    func: Callable, items: Iterable, parallelism: int = DEFAULT_PARALLELISM
+) -> Iterator:
+    """Like ThreadPoolExecutor.map, but items are read lazily and results are
+    yielded in order as soon as they (and the ones before them) are ready.
+
+    At most 2 * parallelism items are running or waiting to be yielded at any
+    time, so memory does not grow with the number of items.
+    """
+    workers = max(1, min(parallelism, MAX_PARALLELISM))
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in items:
+            in_flight.append(executor.submit(func, item))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def iter_tables_metadata(
+    table_refs: Iterable, parallelism: int = DEFAULT_PARALLELISM
+) -> Iterator[dict]:
+    """Gets metadata for many tables concurrently, yielding it in the same order
+    as table_refs (which can be lazy, i.e. list_tables) with bounded memory.
+
+    Args:
+        table_refs: TableReference or TableListItem objects, from any projects.
+        parallelism (int): Maximum number of get_table calls in flight.
+    """
+    return map_bounded(get_table_repr, table_refs, parallelism)
+
+
+def fetch_tables_metadata(
+    table_refs: Iterable, parallelism: int = DEFAULT_PARALLELISM
+) -> list[dict]:
+    """Gets metadata for many tables concurrently.
+
+    Args:
+        table_refs: TableReference or TableListItem objects, from any projects.
+        parallelism (int): Maximum number of get_table calls in flight.
+
+    Returns:
+        list[dict]: table metadata, in the same order as table_refs.
+    """
+    table_refs = list(table_refs)
+    if not table_refs:
+        return []
+    workers = max(1, min(parallelism, MAX_PARALLELISM, len(table_refs)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(get_table_repr, table_refs))
+
+
+def get_tables_metadata(
+    project_id: str, dataset_id: str, parallelism: int = DEFAULT_PARALLELISM
+):
+    from google.cloud import bigquery
+
+    client = get_client(project_id)
     table_refs = client.list_tables(bigquery.DatasetReference(project_id, dataset_id))
-    tables = []
-    for t_ref in table_refs:
-        tables.append(client.get_table(t_ref).to_api_repr())
-    return tables
+    return fetch_tables_metadata(table_refs, parallelism)
+
+
+METADATA_BACKENDS = ("api", "information_schema")
+
+# Standard SQL type names, as shown in INFORMATION_SCHEMA, mapped to the
+# names used by the tables.get API (and therefore by export_table)
+_API_TYPE_NAMES = {
+    "INT64": "INTEGER",
+    "FLOAT64": "FLOAT",
+    "BOOL": "BOOLEAN",
+    "STRUCT": "RECORD",
+}
+
+_BULK_METADATA_QUERY = """
+SELECT
+  c.table_name,
+  c.column_name,
+  c.is_nullable,
+  p.field_path,
+  p.data_type,
+  p.description,
+  t.option_value AS table_description
+FROM `{project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMN_FIELD_PATHS` AS p
+JOIN `{project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMNS` AS c
+  USING (table_name, column_name)
+LEFT JOIN `{project_id}.{dataset_id}.INFORMATION_SCHEMA.TABLE_OPTIONS` AS t
+  ON t.table_name = c.table_name AND t.option_name = 'description'
+WHERE c.is_hidden = 'NO' AND c.is_system_defined = 'NO'
+  {table_filter}
+ORDER BY c.table_name, c.ordinal_position, p.field_path
+"""
+
+
+def _split_top_level(text: str, separator: str) -> list[str]:
+    """Splits text on separator, ignoring separators inside <...> or (...)"""
+    parts = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(text):
+        if char in "<(":
+            depth += 1
+        elif char in ">)":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _parse_data_type(data_type: str) -> dict:
+    """Parses an INFORMATION_SCHEMA data_type into the attributes of a schema field.
+
+    i.e. "ARRAY<STRUCT<id INT64 NOT NULL, name STRING(20)>>" becomes
+    {"type": "RECORD", "mode": "REPEATED", "members": [("id", "INT64", True), ...]}
+
+    Args:
+        data_type (str): The data type, as shown in INFORMATION_SCHEMA.
+
+    Returns:
+        dict: type, mode (REPEATED or None) and, depending on the type,
+        maxLength, precision, scale, rangeElementType or members.
+    """
+    data_type = data_type.strip()
+    field = {"mode": None}
+    if data_type.startswith("ARRAY<"):
+        field["mode"] = "REPEATED"
+        data_type = data_type[len("ARRAY<") : -1].strip()
+
+    # drop attributes that follow the type, i.e. COLLATE 'und:ci'
+    tokens = _split_top_level(data_type, " ")
+    base = tokens[0]
+    type_name = base
+    arguments = None
+    for opener, closer in ("<>", "()"):
+        if opener in base:
+            type_name = base[: base.index(opener)]
+            arguments = base[base.index(opener) + 1 : base.rindex(closer)]
+            break
+    field["type"] = _API_TYPE_NAMES.get(type_name, type_name)
+
+    if type_name == "STRUCT":
+        members = []
+        for member in _split_top_level(arguments, ","):
+            if member.startswith("`"):
+                end = member.index("`", 1)
+                name, member_type = member[1:end], member[end + 1 :].strip()
+            else:
+                name, member_type = member.split(" ", 1)
+            not_null = member_type.endswith(" NOT NULL")
+            if not_null:
+                member_type = member_type[: -len(" NOT NULL")]
+            members.append((name, member_type, not_null))
+        field["members"] = members
+    elif type_name == "RANGE":
+        field["rangeElementType"] = {"type": arguments.strip()}
+    elif arguments and type_name in ("STRING", "BYTES"):
+        field["maxLength"] = arguments.strip()
+    elif arguments and type_name in ("NUMERIC", "BIGNUMERIC"):
+        precision_scale = _split_top_level(arguments, ",")
+        field["precision"] = precision_scale[0]
+        if len(precision_scale) > 1:
+            field["scale"] = precision_scale[1]
+    return field
+
+
+def _build_schema_field(
+    name: str, data_type: str, not_null: bool, path: str, descriptions: dict
+) -> dict:
+    parsed = _parse_data_type(data_type)
+    members = parsed.pop("members", None)
+    field = {"name": name}
+    field.update(parsed)
+    if not field["mode"]:
+        field["mode"] = "REQUIRED" if not_null else "NULLABLE"
+    if descriptions.get(path):
+        field["description"] = descriptions[path]
+    if members is not None:
+        field["fields"] = [
+            _build_schema_field(
+                member_name,
+                member_type,
+                member_not_null,
+                f"{path}.{member_name}",
+                descriptions,
+            )
+            for member_name, member_type, member_not_null in members
+        ]
+    return field
+
+
+def _unquote_option_value(option_value: str):
+    """TABLE_OPTIONS values are SQL literals, descriptions are double quoted strings"""
+    if not option_value:
+        return None
+    try:
+        return json.loads(option_value)
+    except ValueError:
+        return option_value.strip('"')
+
+
+def get_tables_metadata_bulk(
+    project_id: str,
+    dataset_id: str,
+    table_ids: list[str] = None,
+    billing_project: str = None,
+) -> list[dict]:
+    """Get metadata for all tables of a dataset with a single INFORMATION_SCHEMA query.
+
+    The results have the same shape as tables.get (tableReference, description
+    and schema with nested fields), so they can be passed to export_table.
+
+    Args:
+        project_id (str): The Google Cloud project id containing the dataset.
+        dataset_id (str): The BigQuery dataset id.
+        table_ids (list[str]): Only return these tables. All tables if None.
+        billing_project (str): The project that runs (and pays for) the query,
+            project_id if None. Needed for datasets, like public ones, whose
+            project the caller cannot create jobs in.
+
+    Returns:
+        list[dict]: table metadata, ordered by table id.
+
+    Raises:
+        NotFound: when one of table_ids does not exist, like tables.get.
+    """
+    from google.api_core.exceptions import NotFound
+    from google.cloud import bigquery
+
+    client = get_client(billing_project or project_id)
+    job_config = bigquery.QueryJobConfig()
+    table_filter = ""
+    if table_ids is not None:
+        table_filter = "AND c.table_name IN UNNEST(@table_ids)"
+        job_config.query_parameters = [
+            bigquery.ArrayQueryParameter("table_ids", "STRING", table_ids)
+        ]
+    query = _BULK_METADATA_QUERY.format(
+        project_id=project_id, dataset_id=dataset_id, table_filter=table_filter
+    )
+    rows = client.query_and_wait(query, job_config=job_config)
+
+    tables = {}
+    for row in rows:
+        table = tables.setdefault(
+            row["table_name"],
+            {
+                "description": _unquote_option_value(row["table_description"]),
+                "columns": [],
+                "descriptions": {},
+            },
+        )
+        if row["field_path"] == row["column_name"]:
+            table["columns"].append(
+                (row["column_name"], row["data_type"], row["is_nullable"] == "NO")
+            )
+        if row["description"]:
+            table["descriptions"][row["field_path"]] = row["description"]
+
+    if table_ids is not None:
+        not_found = [t for t in table_ids if t not in tables]
+        if not_found:
+            raise NotFound(
+                f"Table {project_id}.{dataset_id}.{not_found[0]} was not found"
+            )
+
+    tables_metadata = []
+    for table_id, table in tables.items():
+        table_metadata = {
+            "tableReference": {
+                "projectId": project_id,
+                "datasetId": dataset_id,
+                "tableId": table_id,
+            },
+            "schema": {
+                "fields": [
+                    _build_schema_field(
+                        name, data_type, not_null, name, table["descriptions"]
+                    )
+                    for name, data_type, not_null in table["columns"]
+                ]
+            },
+        }
+        if table["description"]:
+            table_metadata["description"] = table["description"]
+        tables_metadata.append(table_metadata)
+    return tables_metadata
+
+
+def get_last_modified_times(
+    project_id: str,
+    dataset_id: str,
+    table_ids: list[str] = None,
+    billing_project: str = None,
+) -> dict[str, str]:
+    """Get the last modification time of every table in a dataset, with one query.
+
+    This is much cheaper than getting each table, and is used to find out which
+    tables changed since their metadata was cached.
+
+    Args:
+        project_id (str): The Google Cloud project id containing the dataset.
+        dataset_id (str): The BigQuery dataset id.
+        table_ids (list[str]): Only return these tables. All tables if None.
+        billing_project (str): The project that runs (and pays for) the query,
+            project_id if None.
+
+    Returns:
+        dict[str, str]: table id to lastModifiedTime (milliseconds since epoch,
+        formatted like tables.get does), ordered by table id.
+
+    Raises:
+        Forbidden: when the query is denied, see get_tables_repr for a fallback.
+    """
+    from google.cloud import bigquery
+
+    client = get_client(billing_project or project_id)
+    job_config = bigquery.QueryJobConfig()
+    table_filter = ""
+    if table_ids is not None:
+        table_filter = "WHERE table_id IN UNNEST(@table_ids)"
+        job_config.query_parameters = [
+            bigquery.ArrayQueryParameter("table_ids", "STRING", table_ids)
+        ]
+    query = (
+        f"SELECT table_id, last_modified_time "
+        f"FROM `{project_id}.{dataset_id}.__TABLES__` {table_filter} ORDER BY table_id"
+    )
+    rows = client.query_and_wait(query, job_config=job_config)
+    return {row["table_id"]: str(row["last_modified_time"]) for row in rows}
+
+
+def get_tables_repr(
+    project_id: str,
+    dataset_id: str,
+    table_ids: list[str] = None,
+    parallelism: int = DEFAULT_PARALLELISM,
+) -> dict[str, dict]:
+    """tables.get of every table of a dataset, by table id, ordered by table id.
+
+    Slower than get_last_modified_times, but only needs read access to the
+    tables, for datasets whose __TABLES__ cannot be queried.
+
+    Args:
+        project_id (str): The Google Cloud project id containing the dataset.
+        dataset_id (str): The BigQuery dataset id.
+        table_ids (list[str]): Only get these tables. All tables if None.
+        parallelism (int): Maximum number of tables fetched at the same time.
+    """
+    if table_ids is None:
+        table_ids = sorted(t.table_id for t in list_tables(project_id, dataset_id))
+    tables = map_bounded(
+        lambda t: get_table_repr(table_reference(project_id, dataset_id, t)),
+        table_ids,
+        parallelism,
+    )
+    return dict(zip(table_ids, tables))
 
 
 def get_table_ids_in_dataset(project_id: str, dataset_id: str) -> list[str]:
@@ -126,8 +655,9 @@ def get_table_ids_in_dataset(project_id: str, dataset_id: str) -> list[str]:
 
     Returns:
         list[str]: List of the tables ids present in the dataset."""
+    from google.cloud import bigquery
 
-    client = bigquery.Client(project=project_id)
+    client = get_client(project_id)
     table_refs = client.list_tables(bigquery.DatasetReference(project_id, dataset_id))
     table_ids = []
     for t_ref in table_refs:
@@ -136,12 +666,12 @@ def get_table_ids_in_dataset(project_id: str, dataset_id: str) -> list[str]:
 
 
 def get_table_info_direct(project_id: str, table_reference):
-    client = bigquery.Client(project=project_id)
+    client = get_client(project_id)
     return client.get_table(table_reference)
 
 
 def get_job_info(project_id: str, job_id: str):
-    client = bigquery.Client(project=project_id)
+    client = get_client(project_id)
 
     job = client.get_job(job_id)
     # We need to use _properties to get the job info because it contains all
@@ -163,7 +693,7 @@ def get_table_schema_and_sample_rows_old(
         - schema: metadata for table fields
         - rows: sample table rows
     """
-    client = bigquery.Client(project=project_id)
+    client = get_client(project_id)
 
     table_ref = client.dataset(dataset_id).table(table_id)
 
@@ -187,7 +717,7 @@ def get_sample_rows_json(project_id: str, dataset_id: str, table_id: str) -> str
     Returns:
         A list of rows in JSON format
     """
-    client = bigquery.Client(project=project_id)
+    client = get_client(project_id)
 
     table_ref = client.dataset(dataset_id).table(table_id)
 
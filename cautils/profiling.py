@@ -0,0 +1,353 @@
+"""Column profiles: statistics of the values of each column, computed on a
+bounded sample of rows per table, to give LLM generations an idea of the data
+behind the schema.
+
+Samples are read as Arrow data, either with a TABLESAMPLE query or with the
+BigQuery Storage Read API, and profiled with vectorized pyarrow.compute
+kernels: null ratio, approximate distinct count, min/max and the most frequent
+values. Profiles are saved to columnProfiles.yaml, next to
+datasourceReferences.yaml.
+
+pyarrow (and, for the Storage Read API, google-cloud-bigquery-storage) are
+optional dependencies, installed with `pip install 'ca-utils[profile]'`.
+"""
+
+import json
+import math
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import metadata_tool as mt
+from . import yaml_io
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+PROFILES_FILE = "columnProfiles.yaml"
+SAMPLE_METHODS = ("tablesample", "storage")
+DEFAULT_SAMPLE_ROWS = 10_000
+# most frequent values kept, for columns whose values repeat
+TOP_K = 5
+# longer string values are cut in profiles
+MAX_VALUE_CHARS = 100
+# column types that can be read and profiled as scalar Arrow arrays
+PROFILED_TYPES = {
+    "STRING",
+    "INTEGER",
+    "INT64",
+    "FLOAT",
+    "FLOAT64",
+    "NUMERIC",
+    "BIGNUMERIC",
+    "BOOLEAN",
+    "BOOL",
+    "DATE",
+    "DATETIME",
+    "TIME",
+    "TIMESTAMP",
+}
+
+_storage_client = None
+_storage_client_lock = threading.Lock()
+
+
+def _require_dependencies(method: str):
+    import importlib.util
+
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ValueError(
+            "Column profiling needs pyarrow, install it with: pip install 'ca-utils[profile]'"
+        )
+    if (
+        method == "storage"
+        and importlib.util.find_spec("google.cloud.bigquery_storage") is None
+    ):
+        raise ValueError(
+            "The storage sample method needs google-cloud-bigquery-storage, "
+            "install it with: pip install 'ca-utils[profile]'"
+        )
+
+
+def table_name(table_reference: dict) -> str:
+    return ".".join(table_reference[k] for k in ("projectId", "datasetId", "tableId"))
+
+
+def profiled_columns(table_reference: dict) -> list[str]:
+    """Top level columns with a scalar type, the ones that are profiled."""
+    return [
+        field["name"]
+        for field in table_reference.get("schema", {}).get("fields", [])
+        if field.get("type") in PROFILED_TYPES and field.get("mode") != "REPEATED"
+    ]
+
+
+def sample_percent(num_rows: int, sample_rows: int) -> float:
+    """Percent of a table's rows to sample to get about sample_rows rows. Twice
+    as many as needed, since TABLESAMPLE picks whole blocks of rows."""
+    if num_rows <= 0:
+        return 100.0
+    return min(100.0, max(0.001, 200.0 * sample_rows / num_rows))
+
+
+def _plain(value):
+    """value as something yaml_io can dump: int, float, bool, or a short string."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value.hex() if isinstance(value, bytes) else str(value)
+    if len(text) > MAX_VALUE_CHARS:
+        text = text[:MAX_VALUE_CHARS] + "..."
+    return text
+
+
+def profile_column(array: "pa.ChunkedArray", total_rows: int = 0) -> dict:
+    """Profile of the sampled values of one column.
+
+    The distinct count of the whole table is estimated from the sample with
+    the GEE estimator: values seen once in the sample stand for
+    sqrt(total_rows / sampled rows) values each.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    rows = len(array)
+    if not rows:
+        return {"nullRatio": 0.0}
+    profile = {"nullRatio": round(array.null_count / rows, 4)}
+    values = pc.drop_null(array)
+    if not len(values):
+        return profile
+    try:
+        counts = pc.value_counts(values)
+    except pa.ArrowNotImplementedError:
+        return profile
+    frequencies = counts.field("counts")
+    distinct = len(counts)
+    seen_once = pc.sum(pc.equal(frequencies, 1)).as_py() or 0
+    estimate = distinct
+    if total_rows > rows:
+        estimate = math.sqrt(total_rows / rows) * seen_once + (distinct - seen_once)
+        estimate = min(estimate, total_rows * len(values) / rows)
+    profile["approxDistinct"] = int(round(estimate))
+    if not pa.types.is_binary(values.type):
+        min_max = pc.min_max(values)
+        profile["min"] = _plain(min_max["min"].as_py())
+        profile["max"] = _plain(min_max["max"].as_py())
+    # only meaningful when values repeat, i.e. categories or codes
+    if distinct <= len(values) // 2:
+        top = pc.array_sort_indices(frequencies, order="descending")[:TOP_K]
+        profile["topValues"] = [
+            {
+                "value": _plain(counts.field("values")[i].as_py()),
+                "count": frequencies[i].as_py(),
+            }
+            for i in top.to_pylist()
+        ]
+    return profile
+
+
+def profile_table(sample: "pa.Table", total_rows: int = 0) -> list[dict]:
+    """Profiles of every column of a sample, in the sample's column order."""
+    return [
+        {"name": name, **profile_column(sample.column(name), total_rows)}
+        for name in sample.column_names
+    ]
+
+
+def _read_tablesample(
+    project_id: str,
+    parts: tuple[str, str, str],
+    columns: list[str],
+    percent: float,
+    sample_rows: int,
+) -> "pa.Table":
+    selected = ", ".join(f"`{c}`" for c in columns)
+    query = (
+        f"SELECT {selected} FROM `{'.'.join(parts)}` "
+        f"TABLESAMPLE SYSTEM ({percent:.6g} PERCENT) LIMIT {sample_rows}"
+    )
+    job = mt.get_client(project_id).query(query)
+    return job.to_arrow(create_bqstorage_client=False)
+
+
+def _get_storage_client():
+    global _storage_client
+    from google.cloud import bigquery_storage
+
+    with _storage_client_lock:
+        if _storage_client is None:
+            _storage_client = bigquery_storage.BigQueryReadClient()
+        return _storage_client
+
+
+def _read_storage(
+    project_id: str,
+    parts: tuple[str, str, str],
+    columns: list[str],
+    percent: float,
+    sample_rows: int,
+) -> "pa.Table":
+    import pyarrow as pa
+    from google.cloud.bigquery_storage import types
+
+    table_project, dataset_id, table_id = parts
+    client = _get_storage_client()
+    session = client.create_read_session(
+        parent=f"projects/{project_id}",
+        read_session=types.ReadSession(
+            table=f"projects/{table_project}/datasets/{dataset_id}/tables/{table_id}",
+            data_format=types.DataFormat.ARROW,
+            read_options=types.ReadSession.TableReadOptions(
+                selected_fields=columns, sample_percentage=percent
+            ),
+        ),
+        max_stream_count=1,
+    )
+    empty = pa.table({c: pa.array([], pa.null()) for c in columns})
+    if not session.streams:
+        return empty
+    batches = []
+    rows = 0
+    # the stream is read only until there are enough rows
+    for page in client.read_rows(session.streams[0].name).rows(session).pages:
+        batches.append(page.to_arrow())
+        rows += batches[-1].num_rows
+        if rows >= sample_rows:
+            break
+    if not batches:
+        return empty
+    return pa.Table.from_batches(batches).slice(0, sample_rows)
+
+
+SAMPLE_READERS = {"tablesample": _read_tablesample, "storage": _read_storage}
+
+
+def profile_table_reference(
+    project_id: str, table_reference: dict, method: str, sample_rows: int
+) -> dict:
+    """Samples one table of datasourceReferences.yaml, and returns its profile
+    entry for columnProfiles.yaml, or one with an "error" if it cannot be read."""
+    import pyarrow as pa
+    from google.api_core.exceptions import GoogleAPICallError, RetryError
+
+    parts = tuple(table_reference[k] for k in ("projectId", "datasetId", "tableId"))
+    columns = profiled_columns(table_reference)
+    entry = {"table": table_name(table_reference), "method": method}
+    # denied or failed reads, and data pyarrow cannot convert, fail one table only
+    try:
+        metadata = mt.get_table_repr(mt.table_reference(*parts))
+        if metadata.get("type", "TABLE") != "TABLE":
+            return {**entry, "error": f"{metadata['type']} tables cannot be sampled"}
+        total_rows = int(metadata.get("numRows") or 0)
+        if not columns:
+            return {**entry, "totalRows": total_rows, "sampledRows": 0, "columns": []}
+        sample = SAMPLE_READERS[method](
+            project_id,
+            parts,
+            columns,
+            sample_percent(total_rows, sample_rows),
+            sample_rows,
+        )
+    except (GoogleAPICallError, RetryError, pa.ArrowException) as e:
+        return {**entry, "error": str(e).splitlines()[0] if str(e) else repr(e)}
+    return {
+        **entry,
+        "totalRows": total_rows,
+        "sampledRows": sample.num_rows,
+        "columns": profile_table(sample, total_rows),
+    }
+
+
+def profile_tables(
+    project_id: str,
+    data_source_references_path: Path,
+    method: str = "tablesample",
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+    parallelism: int = mt.DEFAULT_PARALLELISM,
+) -> Path:
+    """Profiles every table of a datasourceReferences.yaml file, up to
+    parallelism tables at a time, and writes columnProfiles.yaml next to it.
+
+    Args:
+        project_id: The project that runs (and pays for) the sample reads.
+        data_source_references_path: The datasourceReferences.yaml file.
+        method: "tablesample" queries a random sample of blocks of each table,
+            "storage" reads the sample with the BigQuery Storage Read API.
+        sample_rows: Maximum rows read per table.
+        parallelism: Maximum number of tables sampled at the same time.
+
+    Returns:
+        the path of the columnProfiles.yaml file.
+    """
+    if method not in SAMPLE_METHODS:
+        raise ValueError(
+            f"Invalid sample method '{method}', expected one of {SAMPLE_METHODS}"
+        )
+    _require_dependencies(method)
+    table_references = yaml_io.load_file(data_source_references_path)["bq"][
+        "tableReferences"
+    ]
+    print(f"Profiling {len(table_references)} tables, {sample_rows} rows each")
+    profiles = []
+    for profile in mt.map_bounded(
+        lambda t: profile_table_reference(project_id, t, method, sample_rows),
+        table_references,
+        parallelism,
+    ):
+        if "error" in profile:
+            print(f"Could not profile {profile['table']}: {profile['error']}")
+        profiles.append(profile)
+    path = data_source_references_path.parent / PROFILES_FILE
+    yaml_io.dump({"columnProfiles": profiles}, path)
+    return path
+
+
+def read_profiles(data_source_references_path: Path) -> dict[str, dict]:
+    """The profiles saved next to a datasourceReferences.yaml file, by table
+    name, or none if there is no columnProfiles.yaml file."""
+    path = Path(data_source_references_path).parent / PROFILES_FILE
+    if not path.exists():
+        return {}
+    profiles = yaml_io.load_file(path) or {}
+    return {
+        profile["table"]: profile
+        for profile in profiles.get("columnProfiles", [])
+        if "columns" in profile
+    }
+
+
+def _format_value(value) -> str:
+    return json.dumps(value) if isinstance(value, str) else str(value)
+
+
+def encode_profiles(profiles: dict[str, dict], tables: list[str] = None) -> str:
+    """Profiles as compact text for LLM prompts, one line per column.
+
+    Args:
+        profiles: Profiles by table name, see read_profiles.
+        tables: Names of the tables to include, all by default.
+    """
+    lines = []
+    for table in profiles if tables is None else tables:
+        profile = profiles.get(table)
+        if not profile:
+            continue
+        lines.append(
+            f"table {table}, {profile['sampledRows']} of {profile['totalRows']} rows sampled"
+        )
+        for column in profile["columns"]:
+            parts = [f"{column['nullRatio']:.1%} null"]
+            if "approxDistinct" in column:
+                parts.append(f"~{column['approxDistinct']} distinct")
+            if "min" in column:
+                parts.append(
+                    f"min {_format_value(column['min'])}, max {_format_value(column['max'])}"
+                )
+            if column.get("topValues"):
+                top = ", ".join(
+                    f"{_format_value(v['value'])} ({v['count']})"
+                    for v in column["topValues"]
+                )
+                parts.append(f"top {top}")
+            lines.append(f"- {column['name']}: {', '.join(parts)}")
+    return "\n".join(lines) + "\n" if lines else ""
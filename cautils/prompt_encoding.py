@@ -0,0 +1,264 @@
+"""Compact encoding of tableReferences for LLM prompts.
+
+datasourceReferences.yaml repeats keys like "mode: NULLABLE" and
+"type: STRING" for every column. The compact encoding has one line per table,
+and one line per column with its name, type, mode (left out when NULLABLE)
+and description, nested columns indented under their record:
+
+    table my-project.sales.orders
+    - id INTEGER REQUIRED: Unique order id.
+    - customer RECORD
+      - city STRING: "Where the order\\nwas shipped."
+
+Names and descriptions are written as JSON strings when they would be
+ambiguous otherwise. Other column attributes are left out.
+"""
+
+import asyncio
+import json
+import re
+
+from google import genai
+
+from . import yaml_io
+
+# describes the input of LLM generations, instead of "in a yaml format"
+INPUT_INSTRUCTION = (
+    "For input, you will be given the metadata for the tables in a compact format: "
+    "a 'table project.dataset.table' line per table, followed by one '- name TYPE MODE: "
+    "description' line per column, where a missing mode means NULLABLE, a missing "
+    "description means there is none, and nested columns are indented under their record. "
+    "Names and descriptions in double quotes are JSON strings"
+)
+TRUNCATED = "..."
+# description lengths tried, in order, to fit a prompt into its token budget,
+# before leaving descriptions out
+TRUNCATION_STEPS = (400, 200, 100, 50)
+
+_PLAIN_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_COLUMN_LINE = re.compile(
+    r'(?P<indent>(?:  )*)- (?P<name>"(?:[^"\\]|\\.)*"|\S+) (?P<type>[^\s:]+)'
+    r"(?: (?P<mode>REQUIRED|REPEATED|NULLABLE))?(?:: (?P<description>.*))?"
+)
+
+
+class PromptEncoding:
+    """How tables are encoded in LLM prompts."""
+
+    def __init__(
+        self,
+        prompt_format: str = "compact",
+        max_tokens: int = 0,
+        description_chars: int = 0,
+        compare_yaml: bool = False,
+    ):
+        """
+        Args:
+            prompt_format: "compact" (see encode_tables), or "yaml" for
+                datasourceReferences.yaml as it is.
+            max_tokens: If more than 0, compact prompts over this many tokens
+                (counted with the genai count_tokens API) get their descriptions
+                truncated until they fit, and fail if they still do not.
+            description_chars: If more than 0, descriptions are truncated to
+                about this many characters.
+            compare_yaml: Whether to report the token count of compact prompts
+                and the one of their yaml, before each LLM call that is not
+                cached (see compare_with_yaml).
+        """
+        self.prompt_format = prompt_format
+        self.max_tokens = max_tokens
+        self.description_chars = description_chars
+        self.compare_yaml = compare_yaml
+
+    @property
+    def compact(self) -> bool:
+        return self.prompt_format == "compact"
+
+
+def _quote_name(name: str) -> str:
+    return name if _PLAIN_NAME.fullmatch(name) else json.dumps(name)
+
+
+def _quote_description(description: str) -> str:
+    if (
+        description.startswith('"')
+        or description != description.strip()
+        or any(c in description for c in "\n\r\t")
+    ):
+        return json.dumps(description)
+    return description
+
+
+def _truncate(description: str, max_chars: int) -> str:
+    if max_chars <= 0 or len(description) <= max_chars:
+        return description
+    return description[:max_chars].rstrip() + TRUNCATED
+
+
+def encode_tables(
+    table_references: list[dict], description_chars: int = 0, descriptions: bool = True
+) -> str:
+    """Encodes tableReferences entries in the compact format.
+
+    Args:
+        table_references: tableReferences entries, as in datasourceReferences.yaml.
+        description_chars: If more than 0, descriptions are truncated to about
+            this many characters.
+        descriptions: Whether to include descriptions at all.
+    """
+    lines = []
+    for table_reference in table_references:
+        table = ".".join(
+            table_reference[k] for k in ("projectId", "datasetId", "tableId")
+        )
+        lines.append(f"table {table}")
+        stack = [
+            (field, 0)
+            for field in reversed(table_reference.get("schema", {}).get("fields", []))
+        ]
+        while stack:
+            field, depth = stack.pop()
+            name = _quote_name(field.get("name", ""))
+            line = f"{'  ' * depth}- {name} {field.get('type', 'STRING')}"
+            if field.get("mode") and field["mode"] != "NULLABLE":
+                line += f" {field['mode']}"
+            description = _truncate(field.get("description") or "", description_chars)
+            if description and descriptions:
+                line += f": {_quote_description(description)}"
+            lines.append(line)
+            subfields = field.get("subfields") or field.get("fields") or []
+            stack.extend((subfield, depth + 1) for subfield in reversed(subfields))
+    return "\n".join(lines) + "\n"
+
+
+def decode_tables(text: str) -> list[dict]:
+    """Parses the compact format back into tableReferences entries, with only
+    the attributes it keeps (name, type, mode and description)."""
+    tables = []
+    # the subfields list of each depth, for the column lines that follow
+    levels = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if line.startswith("table "):
+            project_id, dataset_id, table_id = line[len("table ") :].split(".", 2)
+            fields = []
+            tables.append(
+                {
+                    "projectId": project_id,
+                    "datasetId": dataset_id,
+                    "tableId": table_id,
+                    "schema": {"fields": fields},
+                }
+            )
+            levels = [fields]
+            continue
+        match = _COLUMN_LINE.fullmatch(line)
+        if not match or not levels:
+            raise ValueError(f"Invalid compact schema line: {line!r}")
+        depth = len(match["indent"]) // 2
+        name = match["name"]
+        field = {
+            "name": json.loads(name) if name.startswith('"') else name,
+            "type": match["type"],
+            "mode": match["mode"] or "NULLABLE",
+        }
+        description = match["description"]
+        if description:
+            if description.startswith('"'):
+                description = json.loads(description)
+            field["description"] = description
+        del levels[depth + 1 :]
+        levels[depth].append(field)
+        field["subfields"] = []
+        levels.append(field["subfields"])
+    # records were given a subfields list in case they had nested columns
+    stack = [field for table in tables for field in table["schema"]["fields"]]
+    while stack:
+        field = stack.pop()
+        if field["subfields"]:
+            stack.extend(field["subfields"])
+        else:
+            del field["subfields"]
+    return tables
+
+
+async def count_tokens(client: genai.Client, model: str, text: str) -> int:
+    response = await client.aio.models.count_tokens(model=model, contents=text)
+    return response.total_tokens or 0
+
+
+async def encode_for_prompt(
+    client: genai.Client,
+    model: str,
+    table_references: list[dict],
+    encoding: PromptEncoding,
+    extra: str = "",
+    label: str = "prompt",
+) -> bytes:
+    """Returns the LLM input for table_references (followed by extra), in the
+    compact format.
+
+    Tokens are only counted (with the count_tokens API) when there is a token
+    budget: descriptions are then truncated further and further (see
+    TRUNCATION_STEPS) until the input fits.
+
+    Raises:
+        ValueError: when the input does not fit even without descriptions.
+    """
+    if encoding.max_tokens <= 0:
+        return (
+            encode_tables(table_references, encoding.description_chars) + extra
+        ).encode()
+    # (description_chars, descriptions) of each attempt
+    attempts = [(encoding.description_chars, True)]
+    attempts += [
+        (chars, True)
+        for chars in TRUNCATION_STEPS
+        if encoding.description_chars <= 0 or chars < encoding.description_chars
+    ]
+    attempts.append((0, False))
+    for description_chars, descriptions in attempts:
+        text = encode_tables(table_references, description_chars, descriptions)
+        text += extra
+        tokens = await count_tokens(client, model, text)
+        if tokens <= encoding.max_tokens:
+            break
+    else:
+        raise ValueError(
+            f"{label} has {tokens} tokens without descriptions, over the budget "
+            f"of {encoding.max_tokens}. Try --relationship-shard-size, or fewer tables"
+        )
+
+    if not descriptions:
+        print(f"{label}: {tokens} tokens, without descriptions")
+    elif description_chars != encoding.description_chars:
+        print(
+            f"{label}: {tokens} tokens, descriptions truncated to {description_chars} characters"
+        )
+    return text.encode()
+
+
+async def compare_with_yaml(
+    client: genai.Client,
+    model: str,
+    table_references: list[dict],
+    contents: bytes,
+    extra: str = "",
+    label: str = "prompt",
+):
+    """Prints the token count of compact contents (from encode_for_prompt), and
+    the one the same input would have in yaml. Two count_tokens calls, so only
+    made when asked for (see PromptEncoding.compare_yaml)."""
+    yaml_tokens, tokens = await asyncio.gather(
+        count_tokens(
+            client,
+            model,
+            yaml_io.dumps({"bq": {"tableReferences": table_references}}) + extra,
+        ),
+        count_tokens(client, model, contents.decode()),
+    )
+    saved = 1 - tokens / yaml_tokens if yaml_tokens else 0
+    print(
+        f"{label}: {yaml_tokens} tokens as yaml, {tokens} compact ({saved:.0%} fewer)"
+    )
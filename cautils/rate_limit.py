@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Client-side rate limiter, safe to share across threads.
+
+    Allows `rate` operations per second on average, with bursts of up to
+    `capacity` operations.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes one token, and returns how many seconds to wait before using it.
+
+        Tokens can be reserved ahead of time, so callers waiting in parallel
+        are spaced out instead of all retrying at once.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        """Blocks until an operation is allowed, returns the seconds waited."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+_shared_limiters = {}
+_shared_limiters_lock = threading.Lock()
+
+
+def shared_limiter(key: str, rate: float) -> TokenBucket:
+    """The TokenBucket for key (i.e. an API endpoint), created on first use and
+    shared by every caller in the process that uses the same key and rate."""
+    with _shared_limiters_lock:
+        limiter = _shared_limiters.get((key, rate))
+        if limiter is None:
+            limiter = _shared_limiters[(key, rate)] = TokenBucket(rate)
+        return limiter
@@ -0,0 +1,111 @@
+"""Splits large schemas into overlapping groups of tables, so schema relationships
+can be inferred with one smaller LLM call per group, and merges the results."""
+
+from .join_candidates import ColumnIndex
+
+
+def _add_to_shards(shards: list[set], tables: list[int], shard_size: int):
+    """Puts a group of tables in the shard that already has most of them and has
+    room for the rest, or in a new shard."""
+    group = set(tables)
+    best = None
+    for shard in shards:
+        if len(shard | group) <= shard_size:
+            if best is None or len(shard & group) > len(best & group):
+                best = shard
+    if best is None:
+        shards.append(group)
+    else:
+        best |= group
+
+
+def shard_tables(table_references: list[dict], shard_size: int) -> list[list[int]]:
+    """Groups tables into shards of at most shard_size tables.
+
+    Tables that share a column name are kept in the same shard when possible.
+    Bigger groups are split, repeating their first table in every part, so each
+    part still has a table to relate to. Tables with no shared columns are
+    grouped by dataset.
+
+    Args:
+        table_references: the tableReferences entries of datasourceReferences.yaml.
+        shard_size: maximum number of tables per shard, at least 2.
+
+    Returns:
+        list[list[int]]: indexes into table_references, per shard. A table can
+        be in more than one shard.
+    """
+    shard_size = max(shard_size, 2)
+    if len(table_references) <= shard_size:
+        return [list(range(len(table_references)))]
+
+    tables_by_column = ColumnIndex(table_references).tables_by_name()
+
+    # columns in most tables (i.e. "name", "created_at") are rarely join keys
+    too_common = max(shard_size, len(table_references) // 2)
+    clusters = sorted(
+        {
+            tuple(tables)
+            for tables in tables_by_column.values()
+            if 2 <= len(tables) <= too_common
+        },
+        key=lambda tables: (len(tables), tables),
+    )
+
+    shards = []
+    for cluster in clusters:
+        if len(cluster) <= shard_size:
+            _add_to_shards(shards, cluster, shard_size)
+            continue
+        anchor, rest = cluster[0], cluster[1:]
+        for start in range(0, len(rest), shard_size - 1):
+            _add_to_shards(
+                shards, [anchor, *rest[start : start + shard_size - 1]], shard_size
+            )
+
+    sharded = set().union(*shards)
+    by_dataset = {}
+    for i, table in enumerate(table_references):
+        if i not in sharded:
+            key = (table["projectId"], table["datasetId"])
+            by_dataset.setdefault(key, []).append(i)
+    for tables in by_dataset.values():
+        for start in range(0, len(tables), shard_size):
+            _add_to_shards(shards, tables[start : start + shard_size], shard_size)
+
+    return sorted(sorted(shard) for shard in shards)
+
+
+def _relationship_key(relationship: dict) -> tuple:
+    sides = sorted(
+        (
+            relationship[side]["tableFqn"],
+            tuple(relationship[side]["paths"]),
+        )
+        for side in ("leftSchemaPaths", "rightSchemaPaths")
+    )
+    return tuple(sides)
+
+
+def merge_relationships(results: list[list[dict]]) -> list[dict]:
+    """Merges relationships inferred by each shard.
+
+    The same pair of tables and paths, in either direction, is kept once, with
+    the highest confidenceScore found and all of its sources.
+    """
+    merged = {}
+    for relationships in results:
+        for relationship in relationships:
+            key = _relationship_key(relationship)
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = dict(relationship)
+                continue
+            sources = [*existing.get("sources", [])]
+            sources += [s for s in relationship.get("sources", []) if s not in sources]
+            if relationship.get("confidenceScore", 0) > existing.get(
+                "confidenceScore", 0
+            ):
+                existing.update(relationship)
+            existing["sources"] = sources
+    return [*merged.values()]
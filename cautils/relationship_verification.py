@@ -0,0 +1,426 @@
+"""Verification of schema relationships against the data of their tables.
+
+Each side of a relationship (a table and its join columns) is summarized by a
+sketch, computed by BigQuery in one aggregate query per table: an approximate
+distinct count (APPROX_COUNT_DISTINCT, a HyperLogLog++ sketch) and a bottom-k
+MinHash, the MINHASH_SIZE smallest FARM_FINGERPRINT hashes of the distinct
+values. Only the sketches leave BigQuery, and two sketches are enough to
+estimate how many values of one side are contained in the other one, so any
+number of candidate relationships are checked without joining their tables.
+
+Sketches are cached per table and join columns, until the table is modified,
+so relationships generated again are checked without any query.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+from . import metadata_tool as mt
+from .local_cache import cache_dir
+
+# hashes kept per column, about 20 bytes each in the cache
+MINHASH_SIZE = 1024
+# hashes of the contained side that must be comparable for an estimate
+MIN_EVIDENCE = 8
+DEFAULT_MIN_CONTAINMENT = 0.5
+CACHE_VERSION = 1
+_FQN_PREFIX = "bigquery.googleapis.com/"
+
+
+def parse_table_fqn(table_fqn: str) -> tuple[str, str, str]:
+    """(project, dataset, table) of a tableFqn like
+    bigquery.googleapis.com/projects/P/datasets/D/tables/T."""
+    parts = table_fqn.removeprefix(_FQN_PREFIX).split("/")
+    if len(parts) != 6 or parts[0::2] != ["projects", "datasets", "tables"]:
+        raise ValueError(f"Invalid tableFqn '{table_fqn}'")
+    return parts[1], parts[3], parts[5]
+
+
+def column_key(paths: list[str]) -> str:
+    return ",".join(paths)
+
+
+def relationship_sides(relationship: dict) -> list[tuple[tuple[str, str, str], str]]:
+    """The (table, column_key) of the left and right sides of a relationship.
+
+    Raises:
+        ValueError: when the relationship is malformed, e.g. an LLM-made
+            tableFqn that is not one.
+    """
+    sides = []
+    for side in ("leftSchemaPaths", "rightSchemaPaths"):
+        paths = relationship.get(side)
+        if not isinstance(paths, dict) or not paths.get("paths"):
+            raise ValueError(f"Relationship without {side}")
+        sides.append(
+            (parse_table_fqn(str(paths.get("tableFqn"))), column_key(paths["paths"]))
+        )
+    return sides
+
+
+def _column_expression(paths: list[str]) -> str:
+    """SQL for the hashed value of the join columns, NULL when any is NULL."""
+    columns = [
+        "CAST(" + ".".join(f"`{part}`" for part in path.split(".")) + " AS STRING)"
+        for path in paths
+    ]
+    value = (
+        columns[0] if len(columns) == 1 else f"CONCAT({', CHR(31), '.join(columns)})"
+    )
+    return f"FARM_FINGERPRINT({value})"
+
+
+def sketch_query(
+    parts: tuple[str, str, str], keys: list[str], sample_percent: float = 100.0
+) -> str:
+    """One query that sketches every join column set (see column_key) of keys."""
+    hashes = ", ".join(
+        f"{_column_expression(key.split(','))} AS h{i}" for i, key in enumerate(keys)
+    )
+    aggregates = ", ".join(
+        f"APPROX_COUNT_DISTINCT(h{i}) AS distinct_{i}, "
+        f"ARRAY_AGG(DISTINCT h{i} IGNORE NULLS ORDER BY h{i} LIMIT {MINHASH_SIZE}) AS minhash_{i}"
+        for i in range(len(keys))
+    )
+    sample = (
+        f" TABLESAMPLE SYSTEM ({sample_percent:.6g} PERCENT)"
+        if sample_percent < 100
+        else ""
+    )
+    return (
+        f"SELECT {aggregates} FROM (SELECT {hashes} FROM `{'.'.join(parts)}`{sample})"
+    )
+
+
+def make_sketch(hashes, distinct: int = None) -> dict:
+    """A sketch from value hashes, as BigQuery computes it in sketch_query."""
+    minhash = sorted(set(hashes))
+    return {
+        "distinct": len(minhash) if distinct is None else distinct,
+        "minhash": minhash[:MINHASH_SIZE],
+    }
+
+
+def containment(contained: dict, container: dict) -> tuple[float | None, int]:
+    """Estimated fraction of the distinct values of one sketch found in another.
+
+    The container sketch holds every value of its column with a hash up to its
+    largest one, so each hash of the contained sketch in that range is known to
+    be in the container or not. The fraction of those that are in it is the
+    estimate, from a uniform sample of the contained values.
+
+    Returns:
+        the estimate, or None when fewer than MIN_EVIDENCE hashes (and not all
+        of the contained ones) could be compared, and the number compared.
+    """
+    container_hashes = container["minhash"]
+    compared = contained["minhash"]
+    if len(container_hashes) >= MINHASH_SIZE:
+        threshold = container_hashes[-1]
+        compared = [h for h in compared if h <= threshold]
+    if not compared or (
+        len(compared) < MIN_EVIDENCE and len(compared) < len(contained["minhash"])
+    ):
+        return None, len(compared)
+    members = set(container_hashes)
+    return sum(h in members for h in compared) / len(compared), len(compared)
+
+
+class SketchCache:
+    """Column sketches, by table and join columns (see column_key).
+
+    There is one file per dataset, shared by every agent that uses the dataset.
+    Sketches are only reused while the table's lastModifiedTime has not changed,
+    and were computed with the same sample percent.
+    """
+
+    def __init__(self, directory: Path = None):
+        self.directory = directory or cache_dir("sketches")
+        self._datasets = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.new = 0
+
+    def _path(self, project_id: str, dataset_id: str) -> Path:
+        return self.directory / f"{project_id}.{dataset_id}.json"
+
+    def _tables(self, project_id: str, dataset_id: str) -> dict:
+        key = (project_id, dataset_id)
+        if key not in self._datasets:
+            tables = {}
+            try:
+                data = json.loads(self._path(project_id, dataset_id).read_text())
+                if data.get("version") == CACHE_VERSION:
+                    tables = data["tables"]
+            except (OSError, ValueError, KeyError):
+                pass
+            self._datasets[key] = tables
+        return self._datasets[key]
+
+    def get(
+        self,
+        parts: tuple[str, str, str],
+        last_modified_time: str,
+        sample_percent: float,
+        keys: list[str],
+    ) -> dict:
+        """The cached sketches of keys, for the ones that are still valid."""
+        project_id, dataset_id, table_id = parts
+        with self._lock:
+            cached = self._tables(project_id, dataset_id).get(table_id)
+            if (
+                cached is None
+                or cached["lastModifiedTime"] != last_modified_time
+                or cached["samplePercent"] != sample_percent
+            ):
+                sketches = {}
+            else:
+                sketches = {
+                    k: cached["columns"][k] for k in keys if k in cached["columns"]
+                }
+            self.hits += len(sketches)
+            self.new += len(keys) - len(sketches)
+            return sketches
+
+    def put(
+        self,
+        parts: tuple[str, str, str],
+        last_modified_time: str,
+        sample_percent: float,
+        sketches: dict,
+    ):
+        project_id, dataset_id, table_id = parts
+        with self._lock:
+            tables = self._tables(project_id, dataset_id)
+            cached = tables.get(table_id)
+            if (
+                cached is None
+                or cached["lastModifiedTime"] != last_modified_time
+                or cached["samplePercent"] != sample_percent
+            ):
+                cached = tables[table_id] = {
+                    "lastModifiedTime": last_modified_time,
+                    "samplePercent": sample_percent,
+                    "columns": {},
+                }
+            cached["columns"].update(sketches)
+            self._dirty.add((project_id, dataset_id))
+
+    def save(self):
+        for project_id, dataset_id in sorted(self._dirty):
+            path = self._path(project_id, dataset_id)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(
+                json.dumps(
+                    {
+                        "version": CACHE_VERSION,
+                        "tables": self._datasets[(project_id, dataset_id)],
+                    }
+                )
+            )
+            os.replace(tmp_path, path)
+        self._dirty.clear()
+
+    def summary(self) -> str:
+        return f"sketch cache: {self.hits} hits, {self.new} new column sketches"
+
+
+def table_sketches(
+    project_id: str,
+    parts: tuple[str, str, str],
+    keys: list[str],
+    sample_percent: float = 100.0,
+    cache: SketchCache = None,
+) -> dict:
+    """Sketches of the join column sets keys of one table, from the cache or
+    from one query for the ones that are not cached.
+
+    Returns:
+        the sketch of each key, or {"error": message} for all of them when the
+        table cannot be sketched.
+    """
+    from google.api_core.exceptions import GoogleAPICallError, RetryError
+
+    try:
+        metadata = mt.get_table_repr(mt.table_reference(*parts))
+        # the data of views changes without their lastModifiedTime
+        modified = metadata.get("lastModifiedTime", "")
+        cacheable = cache is not None and metadata.get("type", "TABLE") == "TABLE"
+        sketches = cache.get(parts, modified, sample_percent, keys) if cacheable else {}
+        missing = [k for k in keys if k not in sketches]
+        if missing:
+            query = sketch_query(parts, missing, sample_percent)
+            (row,) = mt.get_client(project_id).query(query).result()
+            computed = {
+                key: {
+                    "distinct": row[f"distinct_{i}"],
+                    # NULL when the columns have no values
+                    "minhash": [*(row[f"minhash_{i}"] or [])],
+                }
+                for i, key in enumerate(missing)
+            }
+            if cacheable:
+                cache.put(parts, modified, sample_percent, computed)
+            sketches.update(computed)
+        return sketches
+    except (GoogleAPICallError, RetryError) as e:
+        error = str(e).splitlines()[0] if str(e) else repr(e)
+        return {key: {"error": error} for key in keys}
+
+
+def score_relationship(relationship: dict, sketches: dict) -> dict:
+    """How much the data of a relationship's tables supports it.
+
+    Returns:
+        the containment of the left values in the right ones, and of the right
+        values in the left ones (None when unknown), their distinct counts,
+        "support", the larger containment, since either side can hold the key,
+        and "error" if a side could not be sketched.
+    """
+    try:
+        sides = [sketches[side] for side in relationship_sides(relationship)]
+    except ValueError as e:
+        return {"support": None, "error": str(e)}
+    left, right = sides
+    errors = [side["error"] for side in sides if "error" in side]
+    if errors:
+        return {"support": None, "error": errors[0]}
+    # e.g. tables not loaded yet, that say nothing about the relationship
+    if not left["minhash"] or not right["minhash"]:
+        return {"support": None, "error": "no values to compare"}
+    left_in_right, _ = containment(left, right)
+    right_in_left, _ = containment(right, left)
+    known = [c for c in (left_in_right, right_in_left) if c is not None]
+    return {
+        "leftInRight": left_in_right,
+        "rightInLeft": right_in_left,
+        "leftDistinct": left["distinct"],
+        "rightDistinct": right["distinct"],
+        "support": max(known) if known else None,
+    }
+
+
+def verify(
+    project_id: str,
+    relationships: list[dict],
+    min_containment: float = DEFAULT_MIN_CONTAINMENT,
+    sample_percent: float = 100.0,
+    parallelism: int = mt.DEFAULT_PARALLELISM,
+    cache: SketchCache = None,
+) -> tuple[list[dict], list[dict]]:
+    """Checks schema relationships against the data of their tables.
+
+    Every table is sketched at most once, for all the join columns it has in
+    relationships, up to parallelism tables at a time.
+
+    Args:
+        project_id: The project that runs (and pays for) the sketch queries.
+        relationships: The entries of a schemaRelationships.yaml file.
+        min_containment: Relationships whose support (the fraction of the values
+            of one side found in the other) is lower are dropped.
+        sample_percent: If less than 100, the percent of each table's blocks
+            that are sketched, with TABLESAMPLE. Cheaper, but sampling both
+            sides lowers the estimated support.
+        parallelism: Maximum number of tables sketched at the same time.
+        cache: Where sketches are reused from, and saved to.
+
+    Returns:
+        the relationships that are kept, the ones with the most support first,
+        followed by the ones that could not be verified in their original
+        order, and the score of every relationship (see score_relationship),
+        in the original order.
+    """
+    keys_by_table = {}
+    for relationship in relationships:
+        try:
+            sides = relationship_sides(relationship)
+        except ValueError:
+            # unverified, see score_relationship
+            continue
+        for parts, key in sides:
+            keys_by_table.setdefault(parts, {})[key] = None
+    print(
+        f"Sketching {sum(len(keys) for keys in keys_by_table.values())} join columns"
+        f" of {len(keys_by_table)} tables"
+    )
+    sketches = {}
+    for parts, table in zip(
+        keys_by_table,
+        mt.map_bounded(
+            lambda parts: table_sketches(
+                project_id, parts, [*keys_by_table[parts]], sample_percent, cache
+            ),
+            keys_by_table,
+            parallelism,
+        ),
+    ):
+        sketches.update(((parts, key), sketch) for key, sketch in table.items())
+    if cache is not None:
+        cache.save()
+        print(cache.summary())
+
+    scores = [score_relationship(r, sketches) for r in relationships]
+    supported = [
+        (score["support"], i)
+        for i, score in enumerate(scores)
+        if score["support"] is not None and score["support"] >= min_containment
+    ]
+    # sorted by support, the original order breaking ties
+    supported.sort(key=lambda item: (-item[0], item[1]))
+    unverified = [i for i, score in enumerate(scores) if score["support"] is None]
+    kept = [relationships[i] for _, i in supported] + [
+        relationships[i] for i in unverified
+    ]
+    return kept, scores
+
+
+def _percent(value: float | None) -> str:
+    return "?" if value is None else f"{value:.0%}"
+
+
+def print_scores(relationships: list[dict], scores: list[dict], min_containment: float):
+    table = Table(box=box.SQUARE)
+    table.add_column("Left", style="bright_green")
+    table.add_column("Right", style="bright_green")
+    table.add_column("Left in right", justify="right")
+    table.add_column("Right in left", justify="right")
+    table.add_column("Distinct", justify="right")
+    table.add_column("Result")
+
+    for relationship, score in zip(relationships, scores):
+        try:
+            left, right = (
+                f"{parts[2]}.{key}" for parts, key in relationship_sides(relationship)
+            )
+        except ValueError:
+            left, right = (
+                str(relationship.get(side, {}).get("tableFqn", ""))
+                for side in ("leftSchemaPaths", "rightSchemaPaths")
+            )
+        if "error" in score:
+            table.add_row(left, right, "", "", "", f"unverified: {score['error']}")
+            continue
+        if score["support"] is None:
+            result = "unverified: too few values in common range"
+        elif score["support"] >= min_containment:
+            result = "kept"
+        else:
+            result = "[bright_red]dropped[/bright_red]"
+        table.add_row(
+            left,
+            right,
+            _percent(score["leftInRight"]),
+            _percent(score["rightInLeft"]),
+            f"{score['leftDistinct']} / {score['rightDistinct']}",
+            result,
+        )
+
+    console = Console(highlight=False)
+    console.print(table)
@@ -0,0 +1,45 @@
+from .agent_tree import changed_fields, find_agent_dirs, read_agent_payload
+
+
+def test_find_agent_dirs_skips_hidden_and_reads_payload(tmp_path):
+    (tmp_path / "sales").mkdir()
+    (tmp_path / "sales" / "systemInstruction.yaml").write_text("be brief\n")
+    (tmp_path / "sales" / "agentMetadata.yaml").write_text("displayName: Sales\n")
+    (tmp_path / "team" / "hr").mkdir(parents=True)
+    (tmp_path / "team" / "hr" / "exampleQueries.yaml").write_text("[]\n")
+    (tmp_path / ".git" / "hooks").mkdir(parents=True)
+    (tmp_path / ".git" / "hooks" / "exampleQueries.yaml").write_text("[]\n")
+
+    assert find_agent_dirs(tmp_path) == [tmp_path / "sales", tmp_path / "team" / "hr"]
+
+    payload, added = read_agent_payload(tmp_path / "sales")
+    assert added == ["systemInstruction", "metadata"]
+    assert payload == {
+        "dataAnalyticsAgent": {"publishedContext": {"systemInstruction": "be brief"}},
+        "displayName": "Sales",
+    }
+
+
+def test_changed_fields_only_lists_differences():
+    payload = {
+        "dataAnalyticsAgent": {
+            "publishedContext": {"systemInstruction": "new", "exampleQueries": []}
+        },
+        "displayName": "Sales",
+    }
+    remote = {
+        "name": "projects/p/locations/l/dataAgents/sales",
+        "dataAnalyticsAgent": {
+            "publishedContext": {
+                "systemInstruction": "old",
+                "glossaryTerms": [{"displayName": "t"}],
+            }
+        },
+        "displayName": "Sales",
+        "description": "",
+    }
+    assert changed_fields(payload, remote) == [
+        "dataAnalyticsAgent.publishedContext.glossaryTerms",
+        "dataAnalyticsAgent.publishedContext.systemInstruction",
+    ]
+    assert changed_fields(remote, remote) == []
@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import httpx
+
+from . import async_request_helper
+from .async_request_helper import AsyncGeminiDataAnalyticsRequestHelper, paginate
+
+
+def test_paginate_and_retries_on_one_event_loop(monkeypatch):
+    monkeypatch.setattr(async_request_helper, "RETRY_INITIAL_DELAY", 0.001)
+    calls = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["Authorization"] == "Bearer token"
+        token = request.url.params.get("pageToken", "0")
+        calls[token] = calls.get(token, 0) + 1
+        if token == "1" and calls[token] == 1:
+            return httpx.Response(503)
+        page = {"dataAgents": [{"name": f"agent{token}"}]}
+        if token != "2":
+            page["nextPageToken"] = str(int(token) + 1)
+        return httpx.Response(200, json=page)
+
+    async def run():
+        async with AsyncGeminiDataAnalyticsRequestHelper(
+            "p", "global", transport=httpx.MockTransport(handler)
+        ) as helper:
+            helper._auth._token = "token"
+            names = [
+                agent["name"]
+                async for page in paginate(
+                    lambda params: helper.get("dataAgents", params)
+                )
+                for agent in page["dataAgents"]
+            ]
+            return names, helper.stats()["retries"]
+
+    assert asyncio.run(run()) == (["agent0", "agent1", "agent2"], 1)
+
+
+def test_post_stream_yields_elements():
+    messages = [{"systemMessage": {"text": {"parts": ["a"]}}}, {"x": "}"}]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=json.dumps(messages).encode())
+
+    async def run():
+        async with AsyncGeminiDataAnalyticsRequestHelper(
+            "p", "global", transport=httpx.MockTransport(handler)
+        ) as helper:
+            helper._auth._token = "token"
+            return [m async for m in helper.post_stream(":chat", {})]
+
+    assert asyncio.run(run()) == messages
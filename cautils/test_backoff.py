@@ -0,0 +1,7 @@
+from .backoff import backoff_delay
+
+
+def test_backoff_delay_grows_with_jitter_up_to_maximum():
+    for attempt, delay in [(0, 2.0), (1, 3.0), (2, 4.5), (20, 60.0)]:
+        for _ in range(20):
+            assert delay / 2 <= backoff_delay(attempt, 2.0, 60.0, 1.5) <= delay
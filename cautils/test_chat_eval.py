@@ -0,0 +1,35 @@
+import json
+
+from .chat_eval import print_summary, run_prompt
+from .google_request_helper import iter_json_array
+
+
+class MalformedStreamHelper:
+    def post_stream(self, path, payload):
+        yield {"systemMessage": {"text": {"parts": ["Looking"]}}}
+        json.loads('{"systemMessage": ')
+
+
+def test_malformed_stream_is_recorded_as_the_prompt_error():
+    result = run_prompt(
+        MalformedStreamHelper(), "p", "l", "agent", {"prompt": "How many orders?"}
+    )
+    assert result["error"].startswith("Malformed streamed message")
+    assert result["answer"] == "Looking"
+
+
+class TruncatedStreamHelper:
+    def post_stream(self, path, payload):
+        yield from iter_json_array(
+            [b'[{"systemMessage": {"text": {"parts": ["Looking"]}}},', b'{"system']
+        )
+
+
+def test_truncated_stream_is_recorded_as_the_prompt_error(capsys):
+    result = run_prompt(
+        TruncatedStreamHelper(), "p", "l", "agent", {"prompt": "How many orders?"}
+    )
+    assert "Unterminated JSON array" in result["error"]
+    assert result["answer"] == "Looking"
+    print_summary([result], 1.0)
+    assert "1 (100%)" in capsys.readouterr().out
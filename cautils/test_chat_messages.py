@@ -0,0 +1,28 @@
+from rich.console import Console
+
+from .chat_messages import render_message
+
+
+def test_render_message_prints_brackets_in_text_and_data_as_they_are():
+    console = Console(record=True, width=80)
+    render_message(
+        console, {"systemMessage": {"text": {"parts": ["Use [/b] and [note]"]}}}
+    )
+    render_message(
+        console,
+        {
+            "systemMessage": {
+                "data": {
+                    "result": {
+                        "schema": {"fields": [{"name": "code"}]},
+                        "data": [{"code": "[red]"}],
+                    }
+                }
+            }
+        },
+    )
+    render_message(console, {"systemMessage": {"error": {"text": "bad [/i]"}}})
+    output = console.export_text()
+    assert "Use [/b] and [note]" in output
+    assert "[red]" in output
+    assert "bad [/i]" in output
@@ -0,0 +1,78 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from . import yaml_io
+from .description_inference import DescriptionCache, infer_descriptions
+
+
+class FakeClient:
+    """Answers every column of the LLM input with "<column> described"."""
+
+    def __init__(self):
+        self.batches = []
+        self.aio = SimpleNamespace(models=self)
+
+    async def generate_content(self, model, contents, config):
+        batch = yaml_io.load(contents[0].parts[0].inline_data.data)["columns"]
+        self.batches.append(batch)
+        result = [
+            {"id": e["id"], "description": f"{e['column']} described"} for e in batch
+        ]
+        return SimpleNamespace(
+            candidates=[
+                SimpleNamespace(
+                    content=SimpleNamespace(
+                        parts=[SimpleNamespace(text=json.dumps(result))]
+                    )
+                )
+            ],
+            usage_metadata=None,
+        )
+
+
+def table_references():
+    fields = [
+        {"name": "id", "type": "STRING", "description": "order id"},
+        {
+            "name": "customer",
+            "type": "RECORD",
+            "subfields": [{"name": "city", "type": "STRING"}],
+        },
+    ] + [{"name": f"col{i}", "type": "INTEGER"} for i in range(20)]
+    return [
+        {
+            "projectId": "p",
+            "datasetId": "d",
+            "tableId": "t",
+            "schema": {"fields": fields},
+        }
+    ]
+
+
+def test_batches_missing_descriptions_and_caches_them(tmp_path):
+    client = FakeClient()
+    tables = table_references()
+    filled = asyncio.run(
+        infer_descriptions(
+            client, tables, 2, max_batch_tokens=200, cache=DescriptionCache(tmp_path)
+        )
+    )
+    fields = tables[0]["schema"]["fields"]
+    assert filled == 22
+    assert fields[0]["description"] == "order id"
+    assert fields[1]["subfields"][0]["description"] == "customer.city described"
+    assert len(client.batches) > 1
+    assert sorted(e["id"] for b in client.batches for e in b) == [*range(22)]
+
+    # only the column whose siblings changed is sent again
+    client = FakeClient()
+    tables = table_references()
+    tables[0]["schema"]["fields"][1]["subfields"].append({"name": "zip"})
+    cache = DescriptionCache(tmp_path)
+    assert asyncio.run(infer_descriptions(client, tables, 2, cache=cache)) == 23
+    assert [e["column"] for b in client.batches for e in b] == [
+        "customer.city",
+        "customer.zip",
+    ]
+    assert cache.hits == 21
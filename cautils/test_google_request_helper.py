@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+from requests.exceptions import HTTPError
+from requests.models import Response
+
+from .google_request_helper import (
+    GoogleRequestHelper,
+    endpoint_key,
+    iter_json_array,
+    retry_after_seconds,
+)
+
+
+def test_iter_json_array_yields_elements_split_across_chunks():
+    messages = [
+        {"systemMessage": {"text": {"parts": ['braces } { and "quotes"']}}},
+        {"systemMessage": {"data": {"generatedSql": "SELECT 'é\\\\'"}}},
+        {},
+    ]
+    raw = json.dumps(messages, ensure_ascii=False).encode()
+    chunks = [raw[i : i + 3] for i in range(0, len(raw), 3)]
+    assert list(iter_json_array(chunks)) == messages
+
+
+def test_iter_json_array_raises_when_the_stream_is_truncated():
+    for chunks in ([b'[{"a":1},', b'{"b"'], [b'[{"a":1}'], []):
+        elements = []
+        with pytest.raises(json.JSONDecodeError, match="Unterminated JSON array"):
+            for element in iter_json_array(chunks):
+                elements.append(element)
+        assert elements == ([{"a": 1}] if chunks else [])
+
+
+def test_retry_after_seconds_and_endpoint_key():
+    response = Response()
+    response.headers["Retry-After"] = "7"
+    assert retry_after_seconds(response) == 7
+    response.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert retry_after_seconds(response) == 0
+    del response.headers["Retry-After"]
+    assert retry_after_seconds(response) is None
+
+    base = "https://geminidataanalytics.googleapis.com/v1beta/projects/p/locations/l/"
+    assert endpoint_key("GET", base + "dataAgents/a") == (
+        "GET geminidataanalytics.googleapis.com dataAgents"
+    )
+    assert endpoint_key("POST", base + ":chat") == (
+        "POST geminidataanalytics.googleapis.com :chat"
+    )
+
+
+class PooledBody(io.BytesIO):
+    released = False
+
+    def release_conn(self):
+        self.released = True
+
+
+def test_streamed_error_response_is_closed_before_raising():
+    response = Response()
+    response.status_code = 400
+    response.raw = PooledBody(b"Bad prompt")
+    helper = GoogleRequestHelper("p", "https://example.com/")
+    helper._token = "token"
+    helper.session.request = lambda *args, **kwargs: response
+
+    with pytest.raises(HTTPError) as e:
+        list(helper.post_stream(":chat", {}))
+    assert response.raw.released
+    assert e.value.response.text == "Bad prompt"
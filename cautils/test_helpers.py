@@ -0,0 +1,28 @@
+from .helpers import iter_pages, stream_all
+
+
+def _retriever(pages):
+    def retrieve(params):
+        index = int(params.get("pageToken", 0))
+        page = {"items": pages[index]}
+        if index + 1 < len(pages):
+            page["nextPageToken"] = str(index + 1)
+        return page
+
+    return retrieve
+
+
+def test_iter_pages_follows_tokens():
+    pages = [[{"n": 1}, {"n": 2}], [{"n": 3}], [{"n": 4}]]
+    assert [p["items"] for p in iter_pages(_retriever(pages))] == pages
+
+
+def test_stream_all_csv(capsys):
+    pages = [[{"name": "a/1"}], [{"name": "a/2"}]]
+    stream_all(
+        _retriever(pages),
+        "items",
+        lambda item: {"id": item["name"].split("/")[-1]},
+        "csv",
+    )
+    assert capsys.readouterr().out.splitlines() == ["id", "1", "2"]
@@ -0,0 +1,55 @@
+from .join_candidates import ColumnIndex
+
+
+def _table(table_id, *columns):
+    return {
+        "projectId": "p",
+        "datasetId": "d",
+        "tableId": table_id,
+        "schema": {
+            "fields": [
+                {"name": name, "type": type, "mode": "NULLABLE"}
+                for name, type in columns
+            ]
+        },
+    }
+
+
+def _pairs(candidates):
+    return [
+        (
+            c["leftSchemaPaths"]["tableFqn"].split("/")[-1],
+            c["leftSchemaPaths"]["paths"][0],
+            c["rightSchemaPaths"]["tableFqn"].split("/")[-1],
+            c["rightSchemaPaths"]["paths"][0],
+            c["confidenceScore"],
+        )
+        for c in candidates
+    ]
+
+
+def test_candidates_match_table_id_and_shared_keys():
+    tables = [
+        _table("stations", ("id", "INTEGER"), ("name", "STRING")),
+        _table(
+            "files",
+            ("id", "INTEGER"),
+            ("station_id", "INTEGER"),
+            ("regionCode", "STRING"),
+        ),
+        _table("regions", ("region_code", "STRING")),
+        _table("ads", ("stationId", "STRING"), ("region_code", "STRING")),
+    ]
+    assert _pairs(ColumnIndex(tables).candidates()) == [
+        ("files", "station_id", "stations", "id", 90),
+        ("files", "regionCode", "regions", "region_code", 70),
+        ("ads", "region_code", "regions", "region_code", 70),
+    ]
+
+
+def test_candidates_skip_incompatible_types_and_generic_names():
+    tables = [
+        _table("a", ("id", "INTEGER"), ("name", "STRING"), ("b_id", "STRING")),
+        _table("b", ("id", "INTEGER"), ("name", "STRING")),
+    ]
+    assert ColumnIndex(tables).candidates() == []
@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["google.genai", "google.cloud.bigquery"]
+
+# runs the CLI as the ca-utils entry point would, then reports heavy modules
+RUNNER = """
+import json, sys
+command, heavy_modules = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+sys.argv = ["ca-utils", *command]
+try:
+    import cautils.main
+except SystemExit:
+    pass
+print(json.dumps([m for m in heavy_modules if m in sys.modules]))
+"""
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        ["--help"],
+        ["da-lro", "list", "--help"],
+        ["data-agent", "list", "--help"],
+        ["data-agent", "autogen", "--help"],
+    ],
+)
+def test_commands_start_without_heavy_imports(command):
+    process = subprocess.run(
+        [sys.executable, "-c", RUNNER, json.dumps(command), json.dumps(HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert json.loads(process.stdout.strip().splitlines()[-1]) == []
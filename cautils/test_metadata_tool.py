@@ -0,0 +1,151 @@
+import pytest
+from google.api_core.exceptions import NotFound
+
+from . import metadata_tool as mt
+
+
+def test_build_schema_field_from_information_schema_type():
+    field = mt._build_schema_field(
+        "orders",
+        "ARRAY<STRUCT<id INT64 NOT NULL, note STRING(20), total NUMERIC(10, 2)>>",
+        False,
+        "orders",
+        {"orders": "all orders", "orders.id": "order id"},
+    )
+    assert field == {
+        "name": "orders",
+        "type": "RECORD",
+        "mode": "REPEATED",
+        "description": "all orders",
+        "fields": [
+            {
+                "name": "id",
+                "type": "INTEGER",
+                "mode": "REQUIRED",
+                "description": "order id",
+            },
+            {"name": "note", "type": "STRING", "mode": "NULLABLE", "maxLength": "20"},
+            {
+                "name": "total",
+                "type": "NUMERIC",
+                "mode": "NULLABLE",
+                "precision": "10",
+                "scale": "2",
+            },
+        ],
+    }
+
+
+def test_parse_data_type_ignores_collation_and_quoted_names():
+    assert mt._parse_data_type("STRING COLLATE 'und:ci'") == {
+        "mode": None,
+        "type": "STRING",
+    }
+    parsed = mt._parse_data_type("STRUCT<`a b` RANGE<DATE>, c BOOL>")
+    assert parsed["members"] == [("a b", "RANGE<DATE>", False), ("c", "BOOL", False)]
+
+
+def test_bulk_metadata_is_billed_to_the_caller_and_missing_tables_raise(
+    monkeypatch,
+):
+    class FakeClient:
+        def __init__(self, project_id):
+            self.project_id = project_id
+
+        def query_and_wait(self, query, job_config):
+            queried.append((self.project_id, query))
+            return [
+                {
+                    "table_name": "orders",
+                    "table_description": None,
+                    "field_path": "id",
+                    "column_name": "id",
+                    "data_type": "INT64",
+                    "is_nullable": "NO",
+                    "description": None,
+                }
+            ]
+
+    queried = []
+    monkeypatch.setattr(mt, "get_client", FakeClient)
+    (orders,) = mt.get_tables_metadata_bulk(
+        "bigquery-public-data", "sales", ["orders"], billing_project="my-project"
+    )
+    assert orders["tableReference"]["tableId"] == "orders"
+    assert queried[0][0] == "my-project"
+    assert "`bigquery-public-data.sales.INFORMATION_SCHEMA" in queried[0][1]
+
+    with pytest.raises(NotFound):
+        mt.get_tables_metadata_bulk("bigquery-public-data", "sales", ["orders", "gone"])
+
+
+def test_map_bounded_keeps_order_and_reads_items_lazily():
+    read = []
+
+    def items():
+        for i in range(100):
+            read.append(i)
+            yield i
+
+    results = mt.map_bounded(lambda i: i * 2, items(), parallelism=4)
+    assert next(results) == 0
+    assert len(read) <= 2 * 4
+    assert [0, *results] == [i * 2 for i in range(100)]
+
+
+def test_transform_schema_filters_columns_in_one_pass():
+    fields = [
+        {"name": "id", "type": "INTEGER", "mode": "REQUIRED", "description": ""},
+        {
+            "name": "customer",
+            "type": "RECORD",
+            "mode": "NULLABLE",
+            "fields": [
+                {"name": "customer_id", "type": "STRING", "mode": "NULLABLE"},
+                {"name": "address", "type": "RECORD", "fields": [{"name": "city"}]},
+            ],
+        },
+        {"name": "notes", "type": "STRING", "mode": "NULLABLE"},
+    ]
+    exported = mt.transform_schema(fields)
+    assert exported[1]["subfields"][1] == {
+        "name": "address",
+        "type": "RECORD",
+        "subfields": [{"name": "city"}],
+    }
+    assert "fields" in fields[1]
+
+    options = mt.SchemaOptions(include=["*ID"], drop_defaults=True)
+    assert mt.transform_schema(fields, options) == [
+        {"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+        {
+            "name": "customer",
+            "type": "RECORD",
+            "subfields": [{"name": "customer_id", "type": "STRING"}],
+        },
+    ]
+    options = mt.SchemaOptions.from_config(
+        {"excludeColumns": "notes", "maxDepth": 2}, mt.SchemaOptions(include=["c*"])
+    )
+    assert mt.transform_schema(fields, options) == [
+        {
+            "name": "customer",
+            "type": "RECORD",
+            "mode": "NULLABLE",
+            "subfields": [
+                {"name": "customer_id", "type": "STRING", "mode": "NULLABLE"},
+                {"name": "address", "type": "RECORD"},
+            ],
+        },
+    ]
+    assert options.cache_key() != mt.SchemaOptions().cache_key() == ""
+
+
+def test_transform_schema_handles_schemas_deeper_than_the_recursion_limit():
+    field = {"name": "leaf", "type": "STRING"}
+    for depth in range(5000):
+        field = {"name": f"level{depth}", "type": "RECORD", "fields": [field]}
+    exported = mt.transform_schema([field])[0]
+    for _ in range(5000):
+        exported = exported["subfields"][0]
+    assert exported == {"name": "leaf", "type": "STRING"}
@@ -0,0 +1,81 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from . import yaml_io
+from .profiling import (
+    PROFILES_FILE,
+    encode_profiles,
+    profile_table,
+    profiled_columns,
+    read_profiles,
+)
+
+
+def test_profile_table():
+    sample = pa.table(
+        {
+            "status": ["open", "open", "closed", None, "open", "closed"],
+            "amount": [1.5, 2.0, None, None, 10.0, 3.0],
+            "id": [1, 2, 3, 4, 5, 6],
+        }
+    )
+    status, amount, id_ = profile_table(sample, total_rows=6)
+
+    assert status["nullRatio"] == round(1 / 6, 4)
+    assert status["approxDistinct"] == 2
+    assert status["topValues"] == [
+        {"value": "open", "count": 3},
+        {"value": "closed", "count": 2},
+    ]
+    assert (amount["min"], amount["max"]) == (1.5, 10.0)
+    # unique values have no top values
+    assert "topValues" not in id_
+    assert id_["approxDistinct"] == 6
+
+
+def test_distinct_is_extrapolated_from_the_sample():
+    sample = pa.table({"id": list(range(100))})
+    (profile,) = profile_table(sample, total_rows=10_000)
+    assert 100 < profile["approxDistinct"] <= 10_000
+
+
+def test_profiled_columns():
+    table_reference = {
+        "schema": {
+            "fields": [
+                {"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+                {"name": "tags", "type": "STRING", "mode": "REPEATED"},
+                {"name": "address", "type": "RECORD", "mode": "NULLABLE"},
+                {"name": "created", "type": "TIMESTAMP"},
+            ]
+        }
+    }
+    assert profiled_columns(table_reference) == ["id", "created"]
+
+
+def test_read_and_encode_profiles(tmp_path):
+    sample = pa.table({"status": ["open", "open", "closed", "closed"]})
+    yaml_io.dump(
+        {
+            "columnProfiles": [
+                {
+                    "table": "p.d.orders",
+                    "method": "tablesample",
+                    "totalRows": 400,
+                    "sampledRows": 4,
+                    "columns": profile_table(sample, 400),
+                },
+                {"table": "p.d.broken", "method": "tablesample", "error": "denied"},
+            ]
+        },
+        tmp_path / PROFILES_FILE,
+    )
+    profiles = read_profiles(tmp_path / "datasourceReferences.yaml")
+    assert [*profiles] == ["p.d.orders"]
+    assert encode_profiles(profiles) == (
+        "table p.d.orders, 4 of 400 rows sampled\n"
+        '- status: 0.0% null, ~2 distinct, min "closed", max "open", '
+        'top "open" (2), "closed" (2)\n'
+    )
+    assert encode_profiles(profiles, ["p.d.other"]) == ""
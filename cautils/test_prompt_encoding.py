@@ -0,0 +1,124 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from . import yaml_io
+from .prompt_encoding import (
+    PromptEncoding,
+    decode_tables,
+    encode_for_prompt,
+    encode_tables,
+)
+
+SAMPLE = [
+    {
+        "projectId": "my-project",
+        "datasetId": "sales",
+        "tableId": "orders",
+        "schema": {
+            "fields": [
+                {
+                    "name": "id",
+                    "type": "INTEGER",
+                    "mode": "REQUIRED",
+                    "description": "Order id.",
+                },
+                {
+                    "name": "customer",
+                    "type": "RECORD",
+                    "mode": "NULLABLE",
+                    "subfields": [
+                        {
+                            "name": "city",
+                            "type": "STRING",
+                            "description": "Where: shipped\nto.",
+                        },
+                        {"name": "tags", "type": "STRING", "mode": "REPEATED"},
+                    ],
+                },
+                {
+                    "name": "unit price",
+                    "type": "NUMERIC",
+                    "description": '"net" price ',
+                },
+                {
+                    "name": "note",
+                    "type": "STRING",
+                    "description": "",
+                    "maxLength": "20",
+                },
+            ]
+        },
+    },
+    {"projectId": "p", "datasetId": "d", "tableId": "empty", "schema": {"fields": []}},
+]
+
+
+def essential(fields: list[dict]) -> list[dict]:
+    """The attributes the compact format keeps, as decode_tables returns them."""
+    result = []
+    for field in fields:
+        kept = {"name": field["name"], "type": field["type"]}
+        kept["mode"] = field.get("mode", "NULLABLE")
+        if field.get("description"):
+            kept["description"] = field["description"]
+        if field.get("subfields"):
+            kept["subfields"] = essential(field["subfields"])
+        result.append(kept)
+    return result
+
+
+def test_compact_encoding_round_trips_and_is_smaller():
+    text = encode_tables(SAMPLE)
+    decoded = decode_tables(text)
+    assert [t["tableId"] for t in decoded] == ["orders", "empty"]
+    for table, original in zip(decoded, SAMPLE):
+        assert table["schema"]["fields"] == essential(original["schema"]["fields"])
+    assert len(text) < len(yaml_io.dumps({"bq": {"tableReferences": SAMPLE}})) / 2
+
+    truncated = decode_tables(encode_tables(SAMPLE, description_chars=5))
+    assert truncated[0]["schema"]["fields"][0]["description"] == "Order..."
+
+
+class FakeClient:
+    """Counts about one token per 4 characters."""
+
+    def __init__(self):
+        self.aio = SimpleNamespace(models=self)
+        self.calls = 0
+
+    async def count_tokens(self, model, contents):
+        self.calls += 1
+        return SimpleNamespace(total_tokens=len(contents) // 4)
+
+
+def test_token_budget_truncates_descriptions_until_the_prompt_fits():
+    tables = [
+        {
+            "projectId": "p",
+            "datasetId": "d",
+            "tableId": "t",
+            "schema": {
+                "fields": [
+                    {"name": f"c{i}", "type": "STRING", "description": "x" * 300}
+                    for i in range(10)
+                ]
+            },
+        }
+    ]
+    client = FakeClient()
+    full = asyncio.run(encode_for_prompt(client, "m", tables, PromptEncoding()))
+    assert full.decode() == encode_tables(tables)
+    # tokens are only counted for a budget
+    assert client.calls == 0
+
+    budget = PromptEncoding(max_tokens=400)
+    fitted = asyncio.run(encode_for_prompt(client, "m", tables, budget))
+    assert len(fitted) // 4 <= 400
+    assert fitted.decode() == encode_tables(tables, description_chars=100)
+
+    with pytest.raises(ValueError):
+        asyncio.run(
+            encode_for_prompt(client, "m", tables, PromptEncoding(max_tokens=10))
+        )
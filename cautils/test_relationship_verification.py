@@ -0,0 +1,77 @@
+import random
+
+from . import metadata_tool as mt
+from . import relationship_verification as rv
+
+
+def fqn(table: str) -> str:
+    return f"bigquery.googleapis.com/projects/p/datasets/d/tables/{table}"
+
+
+def relationship(left: str, left_column: str, right: str, right_column: str) -> dict:
+    return {
+        "confidenceScore": 50,
+        "leftSchemaPaths": {"paths": [left_column], "tableFqn": fqn(left)},
+        "rightSchemaPaths": {"paths": [right_column], "tableFqn": fqn(right)},
+        "sources": ["LLM_SUGGESTED"],
+    }
+
+
+def test_containment_is_estimated_from_minhash_sketches():
+    rng = random.Random(0)
+    keys = [rng.getrandbits(64) - 2**63 for _ in range(50_000)]
+    parent = rv.make_sketch(keys)
+    # a foreign key using a fifth of the keys, and a column unrelated to them
+    child = rv.make_sketch(keys[:10_000])
+    other = rv.make_sketch(rng.getrandbits(64) - 2**63 for _ in range(10_000))
+
+    estimate, compared = rv.containment(child, parent)
+    assert estimate == 1.0 and compared >= rv.MIN_EVIDENCE
+    assert rv.containment(other, parent)[0] == 0.0
+    assert 0.1 < rv.containment(parent, child)[0] < 0.3
+    # a tiny column cannot be compared with the range of a large one
+    assert rv.containment(rv.make_sketch(keys[:3]), parent)[0] in (None, 1.0)
+    assert rv.containment(rv.make_sketch([1, 2, 3]), rv.make_sketch([2, 3, 4])) == (
+        2 / 3,
+        3,
+    )
+
+
+def test_verify_drops_and_ranks_relationships_with_cached_sketches(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(
+        mt, "get_table_repr", lambda ref: {"lastModifiedTime": "1", "type": "TABLE"}
+    )
+    cache = rv.SketchCache(tmp_path)
+    sketches = {
+        "orders": {"customer_id": range(0, 80), "status": range(1000, 1003)},
+        "customers": {"id": range(0, 100)},
+        "stations": {"id": range(500, 600)},
+    }
+    for table, columns in sketches.items():
+        cache.put(
+            ("p", "d", table),
+            "1",
+            100.0,
+            {column: rv.make_sketch(values) for column, values in columns.items()},
+        )
+    cache.save()
+
+    relationships = [
+        relationship("orders", "status", "customers", "id"),
+        relationship("orders", "customer_id", "stations", "id"),
+        relationship("customers", "id", "orders", "customer_id"),
+        {**relationship("orders", "id", "customers", "id"), "rightSchemaPaths": {}},
+        {
+            **relationship("orders", "id", "customers", "id"),
+            "leftSchemaPaths": {"paths": ["id"], "tableFqn": "orders"},
+        },
+    ]
+    kept, scores = rv.verify("p", relationships, cache=rv.SketchCache(tmp_path))
+
+    # malformed relationships are kept as unverified, after the supported ones
+    assert kept == [relationships[2], relationships[3], relationships[4]]
+    assert [s["support"] for s in scores] == [0.0, 0.0, 1.0, None, None]
+    assert "Invalid tableFqn 'orders'" in scores[4]["error"]
+    assert scores[2]["rightInLeft"] == 1.0 and scores[2]["leftInRight"] == 0.8
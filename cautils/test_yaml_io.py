@@ -0,0 +1,45 @@
+import io
+
+import pytest
+import yaml
+
+from .yaml_io import dump_list_streaming, dumps, load, write_table_references
+
+
+def test_streamed_yaml_matches_dumps(tmp_path):
+    entries = [
+        {
+            "projectId": "p",
+            "datasetId": "d",
+            "tableId": f"t{i}",
+            "schema": {"fields": [{"name": "a: b", "description": "two\nlines"}]},
+        }
+        for i in range(3)
+    ]
+    for count in (0, 1, 3):
+        path = tmp_path / "datasourceReferences.yaml"
+        assert write_table_references(path, iter(entries[:count])) == count
+        expected = dumps({"bq": {"tableReferences": entries[:count]}})
+        assert path.read_text() == expected
+
+    file = io.StringIO()
+    dump_list_streaming(file, ["tableReferences"], iter(entries))
+    assert file.getvalue() == dumps({"tableReferences": entries})
+    assert [p.name for p in tmp_path.iterdir()] == ["datasourceReferences.yaml"]
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason="PyYAML built without libyaml")
+def test_libyaml_and_pure_python_dump_the_same():
+    description = "Amount in EUR, without taxes: 'net'. " * 20
+    content = {
+        "fields": [
+            {"name": "amount", "description": description},
+            {"name": "notes", "description": "first\nsecond\n\n  indented\ttab"},
+            {"name": "ñandú", "description": "ünïcödé   and \x85 and \x07"},
+            {"name": "yes", "description": None, "mode": "REPEATED", "n": 1.5},
+        ]
+    }
+    text = dumps(content)
+    assert text == dumps(content, dumper=yaml.SafeDumper)
+    assert load(text) == content
+    assert yaml.load(text, Loader=yaml.SafeLoader) == content
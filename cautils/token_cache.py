@@ -0,0 +1,94 @@
+"""On-disk access token cache, shared by short-lived ca-utils processes.
+
+Opt in by setting CA_UTILS_TOKEN_CACHE=1. Tokens are stored one file per
+credential identity and scope set, readable only by the current user.
+"""
+
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from .local_cache import cache_dir
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, processes just won't share refreshes
+    fcntl = None
+
+
+def enabled() -> bool:
+    return os.environ.get("CA_UTILS_TOKEN_CACHE", "").lower() in ("1", "true", "yes")
+
+
+def cache_key(credentials) -> str:
+    """Builds a key that identifies who the credentials are and what they can do.
+
+    Args:
+        credentials: google.auth credentials, as returned by google.auth.default().
+
+    Returns:
+        A hex digest, safe to use as a file name.
+    """
+    identity = getattr(credentials, "service_account_email", None)
+    if not identity:
+        refresh_token = getattr(credentials, "refresh_token", None) or ""
+        identity = "{}:{}".format(
+            getattr(credentials, "client_id", None),
+            hashlib.sha256(refresh_token.encode()).hexdigest(),
+        )
+    scopes = getattr(credentials, "scopes", None) or getattr(
+        credentials, "default_scopes", None
+    )
+    quota_project = getattr(credentials, "quota_project_id", None)
+    raw = json.dumps(
+        [type(credentials).__name__, identity, quota_project, sorted(scopes or [])]
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class TokenCacheEntry:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def read(self, margin: datetime.timedelta):
+        """Returns (token, expiry) if a token with at least `margin` left is cached."""
+        try:
+            data = json.loads(self.path.read_text())
+            expiry = datetime.datetime.fromisoformat(data["expiry"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        if now >= expiry - margin:
+            return None, None
+        return data["token"], expiry
+
+    def write(self, token: str, expiry: datetime.datetime):
+        if not token or not expiry:
+            return
+        tmp_path = self.path.with_suffix(".tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"token": token, "expiry": expiry.isoformat()}, f)
+        os.replace(tmp_path, self.path)
+
+
+@contextlib.contextmanager
+def locked_entry(key: str):
+    """Holds an exclusive lock on the cache entry for `key`.
+
+    While one process refreshes the token, other processes using the same
+    credentials wait here and then pick up the freshly written token.
+    """
+    directory = cache_dir("tokens")
+    lock_fd = os.open(directory / f"{key}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        yield TokenCacheEntry(directory / f"{key}.json")
+    finally:
+        if fcntl:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        os.close(lock_fd)
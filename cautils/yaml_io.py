@@ -0,0 +1,96 @@
+"""Reading and writing of the yaml files that define data agents.
+
+The libyaml based CSafeLoader/CSafeDumper are used when PyYAML was built with
+them, and the pure Python SafeLoader/SafeDumper otherwise. Lines are never
+folded: libyaml and PyYAML fold long quoted strings at different places, and
+without folding both write the same bytes.
+
+Files are written to a temporary file next to them, and renamed when complete,
+so an interrupted run never leaves a half-written file behind.
+"""
+
+import contextlib
+import os
+from pathlib import Path
+from typing import IO, Iterable
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+# the largest width libyaml accepts, so lines are never folded
+WIDTH = 2**31 - 1
+
+
+def load(stream):
+    """Parses yaml from a string or an open file, like yaml.safe_load."""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def load_file(path: Path):
+    with open(path, "rb") as file:
+        return load(file)
+
+
+def dumps(content, dumper=SafeDumper) -> str:
+    """Returns content as yaml, like yaml.safe_dump but without folding lines."""
+    return yaml.dump(content, Dumper=dumper, width=WIDTH)
+
+
+@contextlib.contextmanager
+def atomic_open(path: Path):
+    """Opens a temporary file for writing, that replaces path when the block
+    ends without errors, and is removed otherwise."""
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w") as file:
+            yield file
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def dump(content, path: Path):
+    with atomic_open(path) as file:
+        file.write(dumps(content))
+
+
+def dump_list_streaming(file: IO, keys: list[str], items: Iterable) -> int:
+    """Writes {keys[0]: {keys[1]: ... [items]}} as dumps would, but one item at
+    a time, so items can be a generator that is never held in memory as a whole.
+
+    Returns:
+        the number of items written.
+    """
+
+    def nested(value):
+        for key in reversed(keys):
+            value = {key: value}
+        return value
+
+    count = 0
+    for item in items:
+        text = dumps(nested([item]))
+        if count:
+            # the same lines as the first item, without the keys
+            text = text.split("\n", len(keys))[len(keys)]
+        file.write(text)
+        count += 1
+    if not count:
+        file.write(dumps(nested([])))
+    return count
+
+
+def write_table_references(path: Path, table_references: Iterable[dict]) -> int:
+    """Writes a datasourceReferences.yaml file, atomically, as entries of
+    table_references are produced.
+
+    Returns:
+        the number of entries written.
+    """
+    with atomic_open(path) as file:
+        return dump_list_streaming(file, ["bq", "tableReferences"], table_references)